@@ -3,7 +3,9 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from app.config import get_settings
 from app.services.supabase import SupabaseService
-from typing import Optional
+from app.api.dependencies.database import get_db
+from app.services.principal_cache import to_principal
+from typing import Dict, Optional
 from pydantic import BaseModel
 
 settings = get_settings()
@@ -12,32 +14,66 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 class TokenData(BaseModel):
     email: Optional[str] = None
     client_id: Optional[str] = None
+    user_id: Optional[str] = None
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    supabase: SupabaseService = Depends()
-) -> dict:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+def decode_token(token: str) -> TokenData:
     try:
         payload = jwt.decode(
             token,
             settings.JWT_SECRET,
             algorithms=[settings.JWT_ALGORITHM]
         )
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email, client_id=payload.get("client_id"))
     except JWTError:
-        raise credentials_exception
-    
-    user = supabase.get_user_by_email(email=token_data.email)
-    if user is None:
-        raise credentials_exception
-        
-    return user
\ No newline at end of file
+        raise _credentials_exception()
+    email: str = payload.get("sub")
+    if email is None:
+        raise _credentials_exception()
+    return TokenData(
+        email=email,
+        client_id=payload.get("client_id"),
+        user_id=payload.get("user_id")
+    )
+
+async def _resolve_user(token_data: TokenData, supabase: SupabaseService) -> Dict:
+    """Look up the token's principal, reusing a recent lookup for the same subject"""
+    principal = supabase.principals.get(token_data.email)
+    if principal is None:
+        user = await supabase.get_user_by_email(email=token_data.email)
+        if user is None:
+            raise _credentials_exception()
+        principal = to_principal(user)
+        supabase.principals.set(token_data.email, principal)
+    return principal
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    supabase: SupabaseService = Depends(get_db)
+) -> dict:
+    """Principal of the token's user: id, email and client_id, possibly cached"""
+    return await _resolve_user(decode_token(token), supabase)
+
+async def get_token_principal(
+    token: str = Depends(oauth2_scheme),
+    supabase: SupabaseService = Depends(get_db)
+) -> dict:
+    """Principal for read-only routes: id, email and client_id
+
+    With AUTH_TRUST_TOKEN_CLAIMS the signed claims are used as they are, so
+    a deleted user or a moved client_id keeps access until the token
+    expires. Tokens issued without a user_id claim are looked up.
+    """
+    token_data = decode_token(token)
+    if settings.AUTH_TRUST_TOKEN_CLAIMS and token_data.user_id and token_data.client_id:
+        return {
+            "id": token_data.user_id,
+            "email": token_data.email,
+            "client_id": token_data.client_id
+        }
+    return await _resolve_user(token_data, supabase)
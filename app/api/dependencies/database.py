@@ -1,12 +1,9 @@
 from fastapi import Depends
+from app.services.container import ServiceContainer
 from app.services.supabase import SupabaseService
-from functools import lru_cache
-
-@lru_cache()
-def get_supabase_service() -> SupabaseService:
-    return SupabaseService()
+from app.api.dependencies.services import get_services
 
 async def get_db(
-    supabase_service: SupabaseService = Depends(get_supabase_service)
+    services: ServiceContainer = Depends(get_services)
 ) -> SupabaseService:
-    return supabase_service
\ No newline at end of file
+    return services.supabase
@@ -0,0 +1,24 @@
+from fastapi import Depends, Request
+from app.services.bulk_upload import BulkUploadService
+from app.services.container import ServiceContainer
+from app.services.ingestion_jobs import IngestionJobManager
+from app.services.rag import RAGService
+
+def get_services(request: Request) -> ServiceContainer:
+    return request.app.state.services
+
+def get_rag_service(
+    services: ServiceContainer = Depends(get_services)
+) -> RAGService:
+    return services.rag_service
+
+def get_bulk_upload_service(
+    services: ServiceContainer = Depends(get_services)
+) -> BulkUploadService:
+    return services.bulk_upload_service
+
+
+def get_ingestion_jobs(
+    services: ServiceContainer = Depends(get_services)
+) -> IngestionJobManager:
+    return services.ingestion_jobs
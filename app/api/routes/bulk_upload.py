@@ -1,10 +1,8 @@
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from app.services.bulk_upload import BulkUploadService
-from app.services.rag import RAGService
-from app.services.embedding import EmbeddingService
-from app.services.completion import CompletionService
-from app.services.supabase import SupabaseService
-from app.api.dependencies.auth import get_current_user
+from app.services.ingestion_jobs import IngestionJobManager
+from app.api.dependencies.auth import get_current_user, get_token_principal
+from app.api.dependencies.services import get_bulk_upload_service, get_ingestion_jobs
 from app.config import get_settings
 from typing import Dict, List
 import logging
@@ -13,21 +11,19 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-def get_bulk_upload_service():
-    rag_service = RAGService(
-        embedding_service=EmbeddingService(),
-        completion_service=CompletionService(),
-        supabase_service=SupabaseService()
-    )
-    return BulkUploadService(rag_service=rag_service)
-
 @router.post("/csv")
 async def upload_csv(
     file: UploadFile = File(...),
+    background: bool = False,
     bulk_upload_service: BulkUploadService = Depends(get_bulk_upload_service),
+    ingestion_jobs: IngestionJobManager = Depends(get_ingestion_jobs),
     current_user: Dict = Depends(get_current_user)
 ):
-    """Upload documents via CSV file"""
+    """Upload documents via CSV file
+
+    With `background=true` the file is queued as an ingestion job and the job is
+    returned immediately; poll `/upload/jobs/{job_id}` for progress.
+    """
     try:
         # Validate file extension
         if not file.filename.endswith('.csv'):
@@ -36,17 +32,21 @@ async def upload_csv(
                 detail="Only CSV files are allowed"
             )
         
-        # Read file content
-        contents = await file.read()
-        if len(contents) > settings.MAX_UPLOAD_SIZE:
+        if file.size is not None and file.size > settings.MAX_CSV_UPLOAD_SIZE:
             raise HTTPException(
                 status_code=400,
-                detail=f"File size exceeds maximum limit of {settings.MAX_UPLOAD_SIZE} bytes"
+                detail=f"File size exceeds maximum limit of {settings.MAX_CSV_UPLOAD_SIZE} bytes"
             )
         
-        # Process the file
-        result = await bulk_upload_service.process_csv(
-            file=contents,
+        if background:
+            return await ingestion_jobs.submit_csv(
+                file=file,
+                client_id=current_user["client_id"]
+            )
+        
+        # Stream the file through parsing, embedding and insertion
+        result = await bulk_upload_service.process_csv_stream(
+            file=file,
             client_id=current_user["client_id"]
         )
         
@@ -58,10 +58,16 @@ async def upload_csv(
 @router.post("/json")
 async def upload_json(
     documents: List[Dict],
+    background: bool = False,
     bulk_upload_service: BulkUploadService = Depends(get_bulk_upload_service),
+    ingestion_jobs: IngestionJobManager = Depends(get_ingestion_jobs),
     current_user: Dict = Depends(get_current_user)
 ):
-    """Upload documents via JSON"""
+    """Upload documents via JSON
+
+    With `background=true` the documents are queued as an ingestion job and the
+    job is returned immediately; poll `/upload/jobs/{job_id}` for progress.
+    """
     try:
         # Validate documents structure
         for doc in documents:
@@ -71,6 +77,12 @@ async def upload_json(
                     detail="Each document must contain 'title' and 'content' fields"
                 )
         
+        if background:
+            return await ingestion_jobs.submit_json(
+                documents=documents,
+                client_id=current_user["client_id"]
+            )
+        
         # Process documents
         result = await bulk_upload_service.process_json(
             documents=documents,
@@ -80,4 +92,43 @@ async def upload_json(
         return result
     except Exception as e:
         logger.error(f"Error processing JSON upload: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    ingestion_jobs: IngestionJobManager = Depends(get_ingestion_jobs),
+    current_user: Dict = Depends(get_token_principal)
+):
+    """Report progress, throughput, ETA and errors of an ingestion job"""
+    job = await ingestion_jobs.get(job_id, client_id=current_user["client_id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(
+    job_id: str,
+    ingestion_jobs: IngestionJobManager = Depends(get_ingestion_jobs),
+    current_user: Dict = Depends(get_current_user)
+):
+    """Cancel an ingestion job, keeping the batches already committed"""
+    job = await ingestion_jobs.cancel(job_id, client_id=current_user["client_id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/jobs/{job_id}/resume")
+async def resume_job(
+    job_id: str,
+    ingestion_jobs: IngestionJobManager = Depends(get_ingestion_jobs),
+    current_user: Dict = Depends(get_current_user)
+):
+    """Resume a cancelled ingestion job from its last committed batch"""
+    try:
+        job = await ingestion_jobs.resume(job_id, client_id=current_user["client_id"])
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
\ No newline at end of file
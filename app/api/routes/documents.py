@@ -4,24 +4,16 @@ from typing import Dict, List, Optional
 from uuid import UUID
 from app.services.supabase import SupabaseService
 from app.api.dependencies.database import get_db
-from app.api.dependencies.auth import get_current_user
+from app.api.dependencies.auth import get_current_user, get_token_principal
 from app.api.models.document import DocumentCreate, DocumentResponse, DocumentUpdate
+from app.api.dependencies.services import get_rag_service
 from app.services.rag import RAGService
-from app.services.embedding import EmbeddingService
-from app.services.completion import CompletionService
 import logging
 
 security = HTTPBearer()
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-def get_rag_service():
-    return RAGService(
-        embedding_service=EmbeddingService(),
-        completion_service=CompletionService(),
-        supabase_service=SupabaseService()
-    )
-
 @router.post("/")
 async def create_document(
     document: Dict,
@@ -46,7 +38,7 @@ async def list_documents(
     page: int = 1,
     page_size: int = 10,
     rag_service: RAGService = Depends(get_rag_service),
-    current_user: Dict = Depends(get_current_user)
+    current_user: Dict = Depends(get_token_principal)
 ):
     """Get paginated list of documents"""
     try:
@@ -93,10 +85,10 @@ async def list_documents(
     dependencies=[Depends(security)]
 )
 async def get_user_documents(
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(get_token_principal),
     page: int = 1,
     page_size: int = 10,
-    supabase: SupabaseService = Depends()
+    supabase: SupabaseService = Depends(get_db)
 ):
     """
     Get all documents belonging to the current user.
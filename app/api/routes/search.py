@@ -1,40 +1,129 @@
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from app.config import get_settings
 from app.services.rag import RAGService
-from app.services.embedding import EmbeddingService
-from app.services.completion import CompletionService
-from app.services.supabase import SupabaseService
-from app.api.dependencies.auth import get_current_user
-from typing import Dict
+from app.api.dependencies.auth import get_token_principal
+from app.api.dependencies.services import get_rag_service
+from typing import Any, AsyncIterator, Awaitable, Dict, List
+import asyncio
+import json
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+class ClientDisconnected(Exception):
+    """The client went away before the response was ready"""
 
 class SearchQuery(BaseModel):
     query: str
 
-def get_rag_service():
-    return RAGService(
-        embedding_service=EmbeddingService(),
-        completion_service=CompletionService(),
-        supabase_service=SupabaseService()
-    )
+class BatchSearchQuery(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=settings.BATCH_MAX_QUERIES)
 
 @router.post("/query")
 async def search_query(
     search_query: SearchQuery,
+    request: Request,
     rag_service: RAGService = Depends(get_rag_service),
-    current_user: Dict = Depends(get_current_user)
+    current_user: Dict = Depends(get_token_principal)
 ):
     """Search documents and generate response"""
     try:
-        result = await rag_service.search_and_generate_response(
+        result = await _cancel_on_disconnect(request, rag_service.search_and_generate_response(
             query=search_query.query,
             client_id=current_user["client_id"],
             user_id=current_user["id"]
-        )
+        ))
         return result
+    except ClientDisconnected:
+        # Nobody is left to read the response; 499 as nginx logs it
+        logger.info("Client disconnected before the answer was ready")
+        raise HTTPException(status_code=499, detail="Client disconnected")
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/batch")
+async def search_batch(
+    batch: BatchSearchQuery,
+    rag_service: RAGService = Depends(get_rag_service),
+    current_user: Dict = Depends(get_token_principal)
+):
+    """Answer several queries in one request
+
+    Returns one entry per query, in request order, with either an answer and
+    sources or an error.
+    """
+    try:
+        results = await rag_service.batch_search_and_generate_response(
+            queries=batch.queries,
+            client_id=current_user["client_id"],
+            user_id=current_user["id"]
+        )
+        return {"results": results}
+    except Exception as e:
+        logger.error(f"Error processing batch query: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/query/stream")
+async def search_query_stream(
+    search_query: SearchQuery,
+    rag_service: RAGService = Depends(get_rag_service),
+    current_user: Dict = Depends(get_token_principal)
+):
+    """Search documents and stream the response as Server-Sent Events
+
+    Emits a `sources` event once retrieval finishes, a `token` event per answer
+    fragment and a final `done` event. Failures after the stream has started
+    are reported as an `error` event.
+    """
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            async for event in rag_service.stream_search_and_generate_response(
+                query=search_query.query,
+                client_id=current_user["client_id"],
+                user_id=current_user["id"]
+            ):
+                yield _format_sse(event["event"], event["data"])
+        except Exception as e:
+            logger.error(f"Error streaming query: {str(e)}")
+            yield _format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _cancel_on_disconnect(request: Request, awaitable: Awaitable[Any]) -> Any:
+    """Await a request's work, cancelling it if the client disconnects first
+
+    Raises ClientDisconnected when the work was cancelled for a disconnect;
+    any other cancellation, e.g. at shutdown, propagates unchanged.
+    """
+    task = asyncio.ensure_future(awaitable)
+    disconnected = False
+
+    async def watch() -> None:
+        nonlocal disconnected
+        # The body has been read, so the next message only arrives on disconnect
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+        disconnected = True
+        task.cancel()
+
+    watcher = asyncio.create_task(watch())
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if disconnected:
+            raise ClientDisconnected() from None
+        raise
+    finally:
+        watcher.cancel()
+
+def _format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
\ No newline at end of file
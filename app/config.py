@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import List
+from typing import Dict, List, Optional
 from enum import Enum
 
 class ModelSettings(Enum):
@@ -20,6 +20,7 @@ class Settings(BaseSettings):
 
     # OpenAI
     OPENAI_API_KEY: str
+    OPENAI_BASE_URL: Optional[str] = None  # Alternative OpenAI-compatible endpoint, e.g. the benchmark stand-in
     
     # Supabase
     SUPABASE_URL: str
@@ -34,15 +35,132 @@ class Settings(BaseSettings):
     # CORS Settings
     CORS_ORIGINS: List[str] = ["*"]
     
+    # HTTP Connection Pools
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0  # Seconds an idle connection is kept open
+    HTTP_TIMEOUT: float = 60.0
+
+    # Logging
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "text"  # "text" or "json" lines
+    LOG_FIELD_MAX_CHARS: int = 512  # Longer structured field values are truncated
+    LOG_SAMPLE_RATES: Dict[str, float] = {}  # Share of sub-WARNING records kept per logger prefix, e.g. {"app.services.rag": 0.1}
+    LOG_QUEUE_SIZE: int = 10_000  # Records waiting for the log writer thread before new ones are dropped
+
+    # Query Logs
+    QUERY_LOG_BUFFER_SIZE: int = 10_000  # Rows held in memory before new ones are spilled
+    QUERY_LOG_BATCH_SIZE: int = 200  # Rows per bulk insert into query_logs
+    QUERY_LOG_FLUSH_INTERVAL: float = 2.0  # Seconds between flushes of a partial batch
+    QUERY_LOG_SPILL_PATH: str = ".cache/query_logs.jsonl"  # Rows that could not be buffered or inserted; empty string drops them
+
+    # Metrics
+    METRICS_ENABLED: bool = True  # Record latency histograms and counters, exposed on /metrics
+    METRICS_TENANT_LABELS: bool = False  # Also label metrics by client_id; one series per tenant
+
+    # Supabase Worker Pool
+    SUPABASE_MAX_WORKERS: int = 16  # Threads running blocking supabase-py queries
+
+    # Tenant Registry
+    TENANT_REGISTRY_TTL: float = 30.0  # Seconds before cached document counts are reloaded
+
+    # Principal Cache
+    AUTH_PRINCIPAL_CACHE_TTL: float = 60.0  # Seconds a user resolved from a token subject is reused; 0 disables
+    AUTH_PRINCIPAL_CACHE_MAX_ENTRIES: int = 10_000  # Least recently used principals are evicted beyond this
+    AUTH_TRUST_TOKEN_CLAIMS: bool = False  # Read-only routes take user_id and client_id from the signed token without a lookup
+
+    # Password Hashing
+    PASSWORD_HASH_WORKERS: int = 2  # Threads running bcrypt off the event loop
+    PASSWORD_HASH_MAX_PENDING: int = 16  # Hashes queued or running before requests are rejected with 503
+
     # Upload Settings
     MAX_UPLOAD_SIZE: int = 10_000_000  # 10MB
+    MAX_CSV_UPLOAD_SIZE: int = 5_000_000_000  # 5GB, CSV uploads are streamed
+    CSV_STREAM_CHUNK_SIZE: int = 1_048_576  # 1MB
+    CSV_MAX_RECORD_SIZE: int = 1_048_576  # Characters in one CSV record, bounding an unterminated quoted field
     ALLOWED_EXTENSIONS: List[str] = ["csv", "json"]
-    BATCH_SIZE: int = 5
+    BATCH_SIZE: int = 100  # Documents embedded and inserted per request
+
+    # Ingestion Pipeline
+    INGEST_EMBED_CONCURRENCY: int = 4  # Concurrent embedding batches
+    INGEST_INSERT_CONCURRENCY: int = 4  # Concurrent insert batches
+    INGEST_QUEUE_SIZE: int = 8  # Batches buffered between stages before backpressure
+
+    # Background Ingestion Jobs
+    INGEST_JOB_WORKERS: int = 2  # Jobs running concurrently per worker process
+    INGEST_JOBS_DB_PATH: str = ".cache/ingest_jobs.sqlite3"
+    INGEST_JOBS_DIR: str = ".cache/ingest_jobs"  # Spooled uploads awaiting ingestion
+    INGEST_JOB_STALE_AFTER: float = 300.0  # Seconds without progress before another worker takes over
+    INGEST_JOB_MAX_ERRORS: int = 100  # Row errors stored per job; failed_documents still counts every failure
+    INGEST_JOB_SWEEP_INTERVAL: float = 60.0  # Seconds between checks for jobs abandoned by another worker
+    INGEST_JOB_HEARTBEAT_INTERVAL: float = 30.0  # Seconds between heartbeats of a running job; keep well below INGEST_JOB_STALE_AFTER
 
     # Model Configuration
     DEFAULT_EMBEDDING_MODEL: str = ModelSettings.EMBEDDING_MODEL.value
     DEFAULT_COMPLETION_MODEL: str = ModelSettings.GPT_4_MINI.value
-    EMBEDDING_DIMENSIONS: int = ModelSettings.EMBEDDING_DIMENSIONS.value
+    EMBEDDING_DIMENSIONS: int = ModelSettings.EMBEDDING_DIMENSIONS.value  # Must match the documents.embedding column
+
+    # Embedding Provider
+    EMBEDDING_PROVIDER: str = "openai"  # "openai", or "local" for CPU feature hashing with no API calls
+    LOCAL_EMBEDDING_WORKERS: int = 2  # Worker processes for the local provider; 0 embeds on the event loop
+    LOCAL_EMBEDDING_BATCH_SIZE: int = 256  # Texts sent to a worker at a time
+    LOCAL_EMBEDDING_NGRAM_RANGE: int = 2  # Longest word n-gram hashed, alongside character trigrams
+
+    # Request Coalescing
+    SEARCH_COALESCING_ENABLED: bool = True  # Identical concurrent /search/query requests share one answer, per worker
+
+    # Batch Queries
+    BATCH_MAX_QUERIES: int = 100  # Queries accepted by /search/batch per request
+    BATCH_SEARCH_CONCURRENCY: int = 8  # Concurrent retrievals per batch
+    BATCH_COMPLETION_CONCURRENCY: int = 4  # Concurrent completions per batch
+
+    # Source Selection
+    SOURCE_SELECTION_ENABLED: bool = True  # Diversify retrieved sources and pick how many to keep
+    SOURCE_CANDIDATES: int = 20  # Results retrieved before selection
+    SOURCE_MIN_GAP: float = 0.05  # Similarity drop that ends the list of sources
+    SOURCE_DUPLICATE_SIMILARITY: float = 0.95  # Sources this similar to a chosen one are dropped
+    MMR_LAMBDA: float = 0.7  # Relevance versus diversity; 1.0 ranks by relevance only
+
+    # Prompt Context
+    CONTEXT_MAX_TOKENS: int = 3000  # Token budget for retrieved documents in the completion prompt
+    CONTEXT_PASSAGE_TOKENS: int = 128  # Passage size when trimming a document to its relevant parts
+    CONTEXT_MIN_DOCUMENT_TOKENS: int = 48  # Documents whose share of the budget is smaller are dropped
+
+    # Embedding Batching
+    EMBEDDING_BATCH_MAX_ITEMS: int = 2048  # OpenAI per-request input limit
+    EMBEDDING_BATCH_MAX_TOKENS: int = 300_000  # OpenAI per-request token limit
+    EMBEDDING_MAX_INPUT_TOKENS: int = 8191  # Per-input limit of the embedding model
+    EMBEDDING_MAX_CONCURRENT_REQUESTS: int = 4
+
+    # Document Chunking (requires the document_chunks table, see README)
+    CHUNKING_ENABLED: bool = False
+    CHUNK_SIZE_TOKENS: int = 512
+    CHUNK_OVERLAP_TOKENS: int = 64
+
+    # Vector Search
+    VECTOR_SEARCH_BACKEND: str = "supabase"  # "supabase" (match_documents RPC) or "memory" (in-process NumPy)
+    VECTOR_INDEX_TTL: float = 60.0  # Seconds before a tenant's in-memory vectors are refreshed with changed documents
+    VECTOR_INDEX_MAX_DOCUMENTS: int = 100_000  # Larger tenants are searched with the RPC
+    VECTOR_INDEX_PAGE_SIZE: int = 1000  # Documents fetched per request when loading a tenant
+    VECTOR_INDEX_IVF_MIN_DOCUMENTS: int = 20_000  # Tenants this large get an approximate IVF index
+    VECTOR_INDEX_IVF_NPROBE: int = 8  # Clusters scanned per query; higher trades latency for recall
+    VECTOR_INDEX_SNAPSHOT_DIR: str = ".cache/vector_index"  # Memory-mapped tenant snapshots; empty string disables them
+    VECTOR_INDEX_QUANTIZATION: str = "int8"  # Stored vector type: "float32", "float16" or "int8"
+    VECTOR_INDEX_RESCORE: int = 4  # Candidates per result rescored at full precision from the snapshot; 0 disables
+    VECTOR_INDEX_MEMORY_BUDGET: int = 2_000_000_000  # Bytes of resident tenant vectors before LRU eviction; 0 is unlimited
+
+    # Hybrid Search
+    HYBRID_SEARCH_ENABLED: bool = False  # Fuse BM25 keyword matches with vector search results
+    HYBRID_SEARCH_CANDIDATES: int = 20  # Results taken from each retriever before fusion
+    HYBRID_RRF_K: int = 60  # Reciprocal rank fusion constant; higher flattens rank differences
+    KEYWORD_INDEX_TTL: float = 60.0  # Seconds before a tenant's keyword index is refreshed with changed documents
+    KEYWORD_INDEX_MAX_DOCUMENTS: int = 100_000  # Larger tenants are searched by vector only
+
+    # Embedding Cache
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 10_000
+    EMBEDDING_CACHE_PATH: str = ".cache/embeddings.sqlite3"  # Empty string disables the disk tier
+    EMBEDDING_CACHE_MAX_DISK_ENTRIES: int = 100_000  # Rows kept in the disk tier, about 6KB each at 1536 dimensions
     
     class Config:
         env_file = ".env"
@@ -1,24 +1,49 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from app.api.routes import auth, documents, search, bulk_upload  # Add bulk_upload import
 from app.config import get_settings
+from app.services.container import ServiceContainer
+from app.services.embedding_cache import get_embedding_cache
+from app.utils.logs import RequestIdMiddleware, configure_logging, shutdown_logging
+from app.utils import metrics
+from fastapi.responses import PlainTextResponse
 import logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Log records are written by a background thread; see app/utils/logs.py
+configure_logging()
 
 settings = get_settings()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup
+    logging.info("Starting up RAG System...")
+    app.state.services = ServiceContainer()
+    if settings.EMBEDDING_CACHE_ENABLED:
+        # Embeddings from a previous model or provider are no longer valid
+        get_embedding_cache().prune_models(keep_model=app.state.services.embedding_service.model)
+    await app.state.services.start()
+
+    yield
+
+    # Shutdown
+    logging.info("Shutting down RAG System...")
+    await app.state.services.close()
+    if settings.EMBEDDING_CACHE_ENABLED:
+        cache = get_embedding_cache()
+        logging.info(f"Embedding cache stats: {cache.stats()}")
+        cache.close()
+    shutdown_logging()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="RAG System",
     description="Retrieval Augmented Generation System with Multi-tenant Support",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -29,6 +54,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Include routers with proper tags and prefixes
 app.include_router(
@@ -66,6 +93,20 @@ async def health_check():
         "environment": settings.ENVIRONMENT
     }
 
+@app.get("/health/pools", tags=["Health Check"])
+async def pool_health():
+    """
+    Connection pool statistics for the shared OpenAI and Supabase clients
+    """
+    return app.state.services.pool_stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """
+    Latency histograms, counters and gauges in the Prometheus text format
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/", tags=["Root"])
 async def root():
     """
@@ -87,15 +128,3 @@ async def global_exception_handler(request, exc):
         "message": str(exc),
         "path": request.url.path
     }
-
-# Startup event
-@app.on_event("startup")
-async def startup_event():
-    logging.info("Starting up RAG System...")
-    # Add any startup initialization here
-
-# Shutdown event
-@app.on_event("shutdown")
-async def shutdown_event():
-    logging.info("Shutting down RAG System...")
-    # Add any cleanup code here
\ No newline at end of file
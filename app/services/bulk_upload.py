@@ -1,142 +1,95 @@
-from typing import List, Dict, Optional
-import pandas as pd
+from typing import AsyncIterator, List, Dict, Optional, Tuple, Union
 import asyncio
 from app.services.embedding import EmbeddingService
 from app.services.supabase import SupabaseService
 from uuid import UUID
 import logging
 from fastapi import UploadFile, HTTPException
-import io
 import json
 from app.services.rag import RAGService
+from app.services.ingestion_pipeline import IngestionPipeline
+from app.utils.csv_stream import iter_csv_records
+from app.config import get_settings
 
+settings = get_settings()
 logger = logging.getLogger(__name__)
 
+REQUIRED_CSV_COLUMNS = ['title', 'content']
+
 class BulkUploadService:
     def __init__(self, rag_service: RAGService):
-        self.embedding_service = EmbeddingService()
-        self.supabase = SupabaseService()
-        self.batch_size = 5  # Adjust based on your needs
+        self.embedding_service = rag_service.embedding_service
+        self.supabase = rag_service.supabase
+        self.batch_size = settings.BATCH_SIZE
         self.rag_service = rag_service
+        self.pipeline = IngestionPipeline(
+            embedding_service=self.embedding_service,
+            supabase=self.supabase,
+            batch_size=self.batch_size,
+            chunker=rag_service.chunker
+        )
 
-    async def process_batch(
-        self,
-        documents: List[Dict],
-        client_id: UUID
-    ) -> List[Dict]:
-        """Process a batch of documents"""
-        try:
-            # Generate embeddings in parallel
-            embeddings = await asyncio.gather(*[
-                self.embedding_service.create_embedding(doc['content'])
-                for doc in documents
-            ])
-
-            # Prepare documents with embeddings
-            docs_with_embeddings = [
-                {
-                    "title": doc["title"],
-                    "content": doc["content"],
-                    "client_id": str(client_id),
-                    "embedding": embedding,
-                    "metadata": doc.get("metadata", {})
-                }
-                for doc, embedding in zip(documents, embeddings)
-            ]
-
-            # Bulk insert documents
-            response = await self.supabase.client.table('documents')\
-                .insert(docs_with_embeddings)\
-                .execute()
-
-            return response.data
-
-        except Exception as e:
-            logger.error(f"Error processing batch: {str(e)}")
-            raise
-
-    async def process_csv(self, file: bytes, client_id: UUID) -> Dict:
-        """Process CSV file upload"""
+    async def process_csv_stream(self, file: UploadFile, client_id: UUID) -> Dict:
+        """Process a CSV upload incrementally through the ingestion pipeline"""
         try:
-            # Convert bytes to file-like object
-            file_obj = io.BytesIO(file)
-            
-            # Read CSV file
-            df = pd.read_csv(file_obj)
-            required_columns = ['title', 'content']
-            
-            # Validate columns
-            if not all(col in df.columns for col in required_columns):
-                raise ValueError(f"CSV must contain columns: {required_columns}")
-            
-            # Process documents
-            total = len(df)
-            processed = 0
-            failed = 0
-            errors = []
-
-            for _, row in df.iterrows():
-                try:
-                    # Handle metadata - convert string to dict if present
-                    metadata = {}
-                    if 'metadata' in row and pd.notna(row['metadata']):
-                        try:
-                            metadata = json.loads(row['metadata'])
-                        except json.JSONDecodeError:
-                            metadata = {'raw': row['metadata']}
-                    
-                    await self.rag_service.process_document(
-                        title=str(row['title']),
-                        content=str(row['content']),
-                        client_id=client_id,
-                        metadata=metadata
-                    )
-                    processed += 1
-                except Exception as e:
-                    failed += 1
-                    errors.append(f"Error processing row {_}: {str(e)}")
-                    logger.error(f"Error processing document: {str(e)}")
-
-            return {
-                "status": "completed",
-                "total_documents": total,
-                "processed_documents": processed,
-                "failed_documents": failed,
-                "errors": errors
-            }
+            report = await self.pipeline.run(self.iter_csv_documents(file), client_id)
+            return report.to_dict()
         except Exception as e:
-            logger.error(f"Error processing CSV: {str(e)}")
+            logger.error(f"Error processing CSV stream: {str(e)}")
             raise HTTPException(status_code=400, detail=str(e))
 
     async def process_json(self, documents: List[Dict], client_id: UUID) -> Dict:
         """Process JSON documents upload"""
         try:
-            total = len(documents)
-            processed = 0
-            failed = 0
-            errors = []
-
-            for doc in documents:
-                try:
-                    await self.rag_service.process_document(
-                        title=doc['title'],
-                        content=doc['content'],
-                        client_id=client_id,
-                        metadata=doc.get('metadata', {})
-                    )
-                    processed += 1
-                except Exception as e:
-                    failed += 1
-                    errors.append(f"Error processing document: {str(e)}")
-                    logger.error(f"Error processing document: {str(e)}")
-
-            return {
-                "status": "completed",
-                "total_documents": total,
-                "processed_documents": processed,
-                "failed_documents": failed,
-                "errors": errors
-            }
+            report = await self.pipeline.run(self.iter_json_documents(documents), client_id)
+            return report.to_dict()
         except Exception as e:
             logger.error(f"Error processing JSON documents: {str(e)}")
-            raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def iter_json_documents(self, documents: List[Dict]) -> AsyncIterator[Tuple[int, Dict]]:
+        """Yield (row number, document) pairs for the ingestion pipeline from JSON documents"""
+        for row, doc in enumerate(documents):
+            yield row, {
+                "title": doc['title'],
+                "content": doc['content'],
+                "metadata": doc.get('metadata', {})
+            }
+
+    async def iter_csv_documents(self, file: UploadFile) -> AsyncIterator[Tuple[int, Union[Dict, Exception]]]:
+        """Yield (row number, document) pairs for the ingestion pipeline from a CSV upload
+
+        A row missing a required value is yielded with a ValueError in place
+        of its document, so it fails alone.
+        """
+        row = 0
+        async for record in iter_csv_records(
+            file,
+            chunk_size=settings.CSV_STREAM_CHUNK_SIZE,
+            max_size=settings.MAX_CSV_UPLOAD_SIZE,
+            max_record_size=settings.CSV_MAX_RECORD_SIZE
+        ):
+            if row == 0 and not all(col in record for col in REQUIRED_CSV_COLUMNS):
+                raise ValueError(f"CSV must contain columns: {REQUIRED_CSV_COLUMNS}")
+            missing = [col for col in REQUIRED_CSV_COLUMNS if record[col] is None]
+            if missing:
+                yield row, ValueError(f"Missing column(s): {', '.join(missing)}")
+            else:
+                yield row, self._csv_row_to_document(record)
+            row += 1
+
+    @staticmethod
+    def _csv_row_to_document(row: Dict[str, str]) -> Dict:
+        # Handle metadata - convert string to dict if present
+        metadata = {}
+        raw_metadata = row.get('metadata')
+        if raw_metadata:
+            try:
+                metadata = json.loads(raw_metadata)
+            except json.JSONDecodeError:
+                metadata = {'raw': raw_metadata}
+        return {
+            "title": str(row['title']),
+            "content": str(row['content']),
+            "metadata": metadata
+        }
@@ -0,0 +1,76 @@
+from app.config import get_settings
+from app.utils.tokens import get_encoding
+from typing import Dict, List, Optional, Tuple
+import math
+
+settings = get_settings()
+
+class TextChunker:
+    """Splits text into overlapping windows of at most chunk_size tokens"""
+
+    def __init__(
+        self,
+        chunk_size: Optional[int] = None,
+        overlap: Optional[int] = None,
+        model: Optional[str] = None
+    ):
+        self.chunk_size = chunk_size or settings.CHUNK_SIZE_TOKENS
+        self.overlap = overlap if overlap is not None else settings.CHUNK_OVERLAP_TOKENS
+        if not 0 <= self.overlap < self.chunk_size:
+            raise ValueError("Chunk overlap must be smaller than the chunk size")
+        self.model = model or settings.DEFAULT_EMBEDDING_MODEL
+        self._encoding = None
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            self._encoding = get_encoding(self.model)
+        return self._encoding
+
+    def split(self, text: str) -> List[str]:
+        tokens = self.encoding.encode(text)
+        if len(tokens) <= self.chunk_size:
+            return [text]
+
+        chunks = []
+        step = self.chunk_size - self.overlap
+        for start in range(0, len(tokens), step):
+            chunks.append(self.encoding.decode(tokens[start:start + self.chunk_size]))
+            if start + self.chunk_size >= len(tokens):
+                break
+        return chunks
+
+def pool_embeddings(embeddings: List[List[float]]) -> List[float]:
+    """Average chunk embeddings into a unit-length document embedding"""
+    if len(embeddings) == 1:
+        return embeddings[0]
+    mean = [sum(values) / len(embeddings) for values in zip(*embeddings)]
+    norm = math.sqrt(sum(value * value for value in mean)) or 1.0
+    return [value / norm for value in mean]
+
+async def embed_chunked(
+    embedding_service,
+    chunker: TextChunker,
+    contents: List[str]
+) -> Tuple[List[List[float]], List[List[Dict]]]:
+    """Embed every chunk of several texts in one batch
+
+    Returns a pooled embedding per text and, per text, its chunk rows with
+    content and embedding.
+    """
+    split = [chunker.split(content) for content in contents]
+    flat = [chunk for chunks in split for chunk in chunks]
+    flat_embeddings = await embedding_service.create_embeddings(flat)
+
+    embeddings = []
+    chunk_rows = []
+    offset = 0
+    for chunks in split:
+        vectors = flat_embeddings[offset:offset + len(chunks)]
+        offset += len(chunks)
+        embeddings.append(pool_embeddings(vectors))
+        chunk_rows.append([
+            {"content": chunk, "embedding": vector}
+            for chunk, vector in zip(chunks, vectors)
+        ])
+    return embeddings, chunk_rows
@@ -1,87 +1,130 @@
 from openai import AsyncOpenAI
 from app.config import get_settings, ModelSettings
+from app.services.context_builder import ContextBuilder
+from app.utils.logs import Lazy, fields
+from app.utils.metrics import COMPLETION_TOKENS, IN_FLIGHT, STAGE_SECONDS
 import logging
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Optional
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
 class CompletionService:
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        context_builder: Optional[ContextBuilder] = None
+    ):
+        self.client = client or AsyncOpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
         self.model = settings.DEFAULT_COMPLETION_MODEL
+        self.context_builder = context_builder or ContextBuilder(model=self.model)
 
     async def generate_response(self, query: str, context: List[Dict]) -> str:
         try:
-            # Create a more focused system message
-            system_message = """You are an AI assistant that provides accurate answers based on the given context.
-            Your task is to analyze the provided documents and generate a comprehensive answer.
-            Rules:
-            1. Only use information present in the provided documents
-            2. If the documents contain relevant information, synthesize it into a clear answer
-            3. If the documents discuss related topics but don't directly answer the question, 
-               explain what relevant information is available
-            4. Be specific and cite information from the documents
-            5. If the documents are completely unrelated to the question, say 
-               "I don't have enough information to answer that question."
-            """
-
-            # Create a better structured prompt
-            user_prompt = self._create_prompt(query, context)
-
-            messages = [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_prompt}
-            ]
+            messages = self._create_messages(query, context)
 
             logger.info(f"Sending request to OpenAI with {len(context)} documents")
-            response = await self.client.chat.completions.create(
+            with STAGE_SECONDS.time(stage="completion"), IN_FLIGHT.track(operation="openai_completion"):
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.5,  # Lower temperature for more focused answers
+                    max_tokens=500,
+                    presence_penalty=0.1,
+                    frequency_penalty=0.1
+                )
+            
+            answer = response.choices[0].message.content
+            if response.usage:
+                COMPLETION_TOKENS.observe(response.usage.prompt_tokens, kind="prompt")
+                COMPLETION_TOKENS.observe(response.usage.completion_tokens, kind="completion")
+                logger.info(
+                    f"OpenAI usage: {response.usage.prompt_tokens} prompt tokens, "
+                    f"{response.usage.completion_tokens} completion tokens"
+                )
+            logger.debug("Generated response", extra=fields(answer=answer))
+            return answer
+
+        except Exception as e:
+            logger.error(f"Error generating completion: {str(e)}")
+            raise
+
+    async def stream_response(self, query: str, context: List[Dict]) -> AsyncIterator[str]:
+        """Yield answer text fragments as OpenAI produces them"""
+        try:
+            messages = self._create_messages(query, context)
+
+            logger.info(f"Streaming request to OpenAI with {len(context)} documents")
+            stream = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
-                temperature=0.5,  # Lower temperature for more focused answers
+                temperature=0.5,
                 max_tokens=500,
                 presence_penalty=0.1,
-                frequency_penalty=0.1
+                frequency_penalty=0.1,
+                stream=True
             )
-            
-            answer = response.choices[0].message.content
-            logger.info(f"Generated response: {answer}")
-            return answer
+
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
 
         except Exception as e:
-            logger.error(f"Error generating completion: {str(e)}")
+            logger.error(f"Error streaming completion: {str(e)}")
             raise
 
+    def _create_messages(self, query: str, context: List[Dict]) -> List[Dict]:
+        # Create a more focused system message
+        system_message = """You are an AI assistant that provides accurate answers based on the given context.
+        Your task is to analyze the provided documents and generate a comprehensive answer.
+        Rules:
+        1. Only use information present in the provided documents
+        2. If the documents contain relevant information, synthesize it into a clear answer
+        3. If the documents discuss related topics but don't directly answer the question, 
+           explain what relevant information is available
+        4. Be specific and cite information from the documents
+        5. If the documents are completely unrelated to the question, say 
+           "I don't have enough information to answer that question."
+        """
+
+        # Create a better structured prompt
+        user_prompt = self._create_prompt(query, context)
+
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_prompt}
+        ]
+        # Counted on the log writer thread, and only if the record is kept
+        logger.info("Created messages", extra=fields(prompt_tokens=Lazy(lambda: self.count_prompt_tokens(messages))))
+        return messages
+
     def _create_prompt(self, query: str, context: List[Dict]) -> str:
-        # Format each document with its metadata
-        formatted_docs = []
-        for i, doc in enumerate(context, 1):
-            doc_text = f"""Document {i}:
-Title: {doc['title']}
-Content: {doc['content']}
-Relevance: This document has a similarity score of {doc.get('similarity', 'N/A')}
----"""
-            formatted_docs.append(doc_text)
-
-        # Join all documents
-        context_str = "\n".join(formatted_docs)
-
-        # Create the prompt
+        # Fit the documents into the context token budget; the rules live in the system message
+        with STAGE_SECONDS.time(stage="build_context"):
+            built = self.context_builder.build(query, context)
+
         prompt = f"""Please analyze these documents and answer the question.
 
 Context Documents:
-{context_str}
+{built.text}
 
 Question: {query}
 
-Instructions:
-1. Use only information from the provided documents
-2. If the documents contain relevant information, provide a detailed answer
-3. If the information is partially relevant, explain what information is available
-4. Cite specific details from the documents when possible
-5. If the documents don't contain relevant information, say "I don't have enough information to answer that question."
-
 Answer:"""
 
-        logger.info(f"Created prompt with {len(context)} documents")
-        return prompt
\ No newline at end of file
+        logger.info(
+            f"Created prompt with {len(built.documents)} of {len(context)} documents, "
+            f"{built.tokens} context tokens (budget {self.context_builder.max_tokens})"
+        )
+        return prompt
+
+    def count_prompt_tokens(self, messages: List[Dict]) -> int:
+        """Estimate prompt tokens as OpenAI counts them for chat messages"""
+        # Every message carries a few tokens of framing, and the reply is primed with 3 more
+        return sum(
+            self.context_builder.count_tokens(message["content"]) + 4
+            for message in messages
+        ) + 3
\ No newline at end of file
@@ -0,0 +1,65 @@
+from openai import AsyncOpenAI
+from app.config import get_settings
+from app.services.bulk_upload import BulkUploadService
+from app.services.completion import CompletionService
+from app.services.embedding import EmbeddingService
+from app.services.ingestion_jobs import IngestionJobManager
+from app.services.query_log import QueryLogWriter
+from app.services.rag import RAGService
+from app.services.supabase import SupabaseService
+from app.utils.http import get_pool_limits, pool_stats
+from typing import Dict
+import httpx
+import logging
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class ServiceContainer:
+    """Clients and services shared by every request for the lifetime of the app"""
+
+    def __init__(self):
+        self.openai_http_client = httpx.AsyncClient(
+            limits=get_pool_limits(),
+            timeout=settings.HTTP_TIMEOUT
+        )
+        self.openai_client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=self.openai_http_client
+        )
+        self.embedding_service = EmbeddingService(client=self.openai_client)
+        # Stored embeddings are validated against what the configured provider produces
+        self.supabase = SupabaseService.create_pooled(
+            embedding_dimensions=self.embedding_service.dimensions
+        )
+        self.completion_service = CompletionService(client=self.openai_client)
+        self.query_log = QueryLogWriter(self.supabase.insert_query_logs)
+        self.rag_service = RAGService(
+            embedding_service=self.embedding_service,
+            completion_service=self.completion_service,
+            supabase_service=self.supabase,
+            query_log=self.query_log
+        )
+        self.bulk_upload_service = BulkUploadService(rag_service=self.rag_service)
+        self.ingestion_jobs = IngestionJobManager(self.bulk_upload_service)
+
+    async def start(self) -> None:
+        await self.query_log.start()
+        await self.ingestion_jobs.start()
+
+    def pool_stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "openai": pool_stats(self.openai_http_client),
+            "supabase": pool_stats(self.supabase.http_session)
+        }
+
+    async def close(self) -> None:
+        logger.info("Closing shared service clients")
+        await self.ingestion_jobs.close()
+        await self.query_log.close()
+        await self.embedding_service.close()
+        await self.openai_client.close()
+        if self.supabase.vector_index is not None:
+            self.supabase.vector_index.save_snapshots()
+        self.supabase.close()
@@ -0,0 +1,194 @@
+from app.config import get_settings
+from app.services.keyword_index import tokenize
+from app.utils.tokens import get_encoding
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import math
+import re
+
+settings = get_settings()
+
+# Sentence and paragraph boundaries that passages are packed from
+UNIT_PATTERN = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+PASSAGE_SEPARATOR = "\n...\n"
+
+@dataclass
+class BuiltContext:
+    text: str
+    documents: List[Dict] = field(default_factory=list)  # Documents kept, with trimmed content
+    tokens: int = 0
+    dropped: int = 0  # Duplicates and documents that did not fit the budget
+
+class ContextBuilder:
+    """Assembles retrieved documents into prompt context within a token budget
+
+    The budget is shared out in proportion to similarity; documents that fit
+    in their share are included whole and their leftover goes to the others.
+    A document that does not fit keeps its passages with the most query
+    terms. Duplicate documents and passages are dropped.
+    """
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        passage_tokens: Optional[int] = None,
+        min_document_tokens: Optional[int] = None,
+        model: Optional[str] = None
+    ):
+        self.max_tokens = max_tokens or settings.CONTEXT_MAX_TOKENS
+        self.passage_tokens = passage_tokens or settings.CONTEXT_PASSAGE_TOKENS
+        self.min_document_tokens = min_document_tokens or settings.CONTEXT_MIN_DOCUMENT_TOKENS
+        self.model = model or settings.DEFAULT_COMPLETION_MODEL
+        self._encoding = None
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            self._encoding = get_encoding(self.model)
+        return self._encoding
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+    @staticmethod
+    def _header(index: int, doc: Dict) -> str:
+        return f"Document {index}: {doc.get('title') or ''}\n"
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def build(self, query: str, documents: List[Dict]) -> BuiltContext:
+        unique = []
+        seen = set()
+        for doc in documents:
+            key = self._normalize(doc.get('content') or '')
+            if key and key not in seen:
+                seen.add(key)
+                unique.append(doc)
+        dropped = len(documents) - len(unique)
+
+        weights = self._weights(unique)
+        sizes = [
+            self.count_tokens(self._header(i, doc)) + self.count_tokens(doc['content'])
+            for i, doc in enumerate(unique, 1)
+        ]
+        allocations = self._allocate(sizes, weights)
+        # Drop the least relevant documents until every remaining share is usable
+        while unique and any(
+            allocation < min(self.min_document_tokens, size)
+            for allocation, size in zip(allocations, sizes)
+        ):
+            weakest = min(range(len(unique)), key=lambda i: weights[i])
+            for values in (unique, weights, sizes):
+                del values[weakest]
+            dropped += 1
+            allocations = self._allocate(sizes, weights) if unique else []
+
+        query_terms = set(tokenize(query))
+        seen_passages = set()
+        parts = []
+        kept = []
+        for index, (doc, size, allocation) in enumerate(zip(unique, sizes, allocations), 1):
+            header = self._header(index, doc)
+            content = doc['content']
+            if size > allocation:
+                content = self._trim(
+                    content,
+                    query_terms,
+                    allocation - self.count_tokens(header),
+                    seen_passages
+                )
+            if not content:
+                dropped += 1
+                continue
+            parts.append(f"{header}{content}\n---")
+            kept.append({**doc, 'content': content})
+
+        text = "\n".join(parts)
+        return BuiltContext(text=text, documents=kept, tokens=self.count_tokens(text), dropped=dropped)
+
+    @staticmethod
+    def _weights(documents: List[Dict]) -> List[float]:
+        """Similarity per document; documents without one, such as keyword matches, get the mean"""
+        scores = [doc.get('similarity') for doc in documents]
+        known = [max(score, 0.0) for score in scores if score is not None]
+        default = sum(known) / len(known) if known else 1.0
+        weights = [max(score, 0.0) if score is not None else default for score in scores]
+        if not any(weights):
+            weights = [1.0] * len(documents)
+        return weights
+
+    def _allocate(self, sizes: List[int], weights: List[float]) -> List[int]:
+        """Share the budget by weight, handing what small documents leave unused to the rest"""
+        allocations = [0] * len(sizes)
+        active = set(range(len(sizes)))
+        remaining = self.max_tokens
+        while active:
+            total = sum(weights[i] for i in active) or 1.0
+            settled = [i for i in active if sizes[i] <= remaining * weights[i] / total]
+            if not settled:
+                for i in active:
+                    allocations[i] = int(remaining * weights[i] / total)
+                break
+            for i in settled:
+                allocations[i] = sizes[i]
+                remaining -= sizes[i]
+                active.remove(i)
+        return allocations
+
+    def _passages(self, content: str) -> List[List[int]]:
+        """Split content into runs of whole sentences of at most passage_tokens tokens"""
+        passages = []
+        current: List[int] = []
+        for unit in UNIT_PATTERN.split(content):
+            if not unit or not unit.strip():
+                continue
+            tokens = self.encoding.encode(unit.strip() + " ")
+            if current and len(current) + len(tokens) > self.passage_tokens:
+                passages.append(current)
+                current = []
+            while len(tokens) > self.passage_tokens:
+                passages.append(tokens[:self.passage_tokens])
+                tokens = tokens[self.passage_tokens:]
+            current = current + tokens
+        if current:
+            passages.append(current)
+        return passages
+
+    def _trim(self, content: str, query_terms: set, budget: int, seen: set) -> str:
+        """Keep the passages with the most query terms, weighted by rarity, in document order"""
+        passages = self._passages(content)
+        texts = [self.encoding.decode(tokens).strip() for tokens in passages]
+        terms = [set(tokenize(text)) & query_terms for text in texts]
+        frequency = {term: sum(term in found for found in terms) for term in query_terms}
+        scores = [
+            sum(math.log(1 + len(passages) / frequency[term]) for term in found)
+            for found in terms
+        ]
+        # Higher score first; earlier passages win ties
+        order = sorted(range(len(passages)), key=lambda i: (-scores[i], i))
+
+        separator = self.count_tokens(PASSAGE_SEPARATOR)
+        selected = {}
+        for i in order:
+            key = self._normalize(texts[i])
+            if key in seen:
+                continue
+            if len(passages[i]) > budget:
+                if budget >= self.min_document_tokens:
+                    selected[i] = self.encoding.decode(passages[i][:budget]).strip()
+                break
+            selected[i] = texts[i]
+            budget -= len(passages[i]) + separator
+            seen.add(key)
+
+        # Adjacent passages read on; a gap between them is marked with the separator
+        text = ""
+        previous = None
+        for i in sorted(selected):
+            if previous is not None:
+                text += " " if i == previous + 1 else PASSAGE_SEPARATOR
+            text += selected[i]
+            previous = i
+        return text
@@ -1,22 +1,142 @@
 from openai import AsyncOpenAI
 from app.config import get_settings, ModelSettings
+from app.services.embedding_cache import EmbeddingCache, get_embedding_cache
+from app.services.embedding_providers import EmbeddingProvider, create_embedding_provider
+from app.utils.metrics import EMBEDDING_BATCH_SIZE, EMBEDDING_CACHE_LOOKUPS
+from typing import List, Optional
+import asyncio
 import logging
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
 class EmbeddingService:
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-        self.model = settings.DEFAULT_EMBEDDING_MODEL
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        cache: Optional[EmbeddingCache] = None,
+        provider: Optional[EmbeddingProvider] = None
+    ):
+        # Selected by EMBEDDING_PROVIDER; client is only used by the OpenAI provider
+        self.provider = provider or create_embedding_provider(client=client)
+        self.model = self.provider.model
+        self.dimensions = self.provider.dimensions
+        if cache is None and settings.EMBEDDING_CACHE_ENABLED:
+            cache = get_embedding_cache()
+        self.cache = cache
+        self.max_batch_items = self.provider.max_batch_items
+        self.max_batch_tokens = self.provider.max_batch_tokens
+        self.max_input_tokens = self.provider.max_input_tokens
+        self.max_concurrent_requests = self.provider.max_concurrent_requests
+
+    def count_tokens(self, text: str) -> int:
+        return self.provider.count_tokens(text)
 
     async def create_embedding(self, text: str) -> list[float]:
-        try:
-            response = await self.client.embeddings.create(
-                model=self.model,
-                input=text
+        embeddings = await self.create_embeddings([text])
+        return embeddings[0]
+
+    async def create_embeddings(
+        self,
+        texts: List[str],
+        token_counts: Optional[List[int]] = None
+    ) -> List[List[float]]:
+        """Embed many texts using as few requests as possible, preserving input order
+
+        Callers that have already counted each text's tokens can pass the
+        counts so they are not counted again.
+        """
+        if not texts:
+            return []
+
+        if self.cache is None:
+            return await self._create_uncached(texts, token_counts)
+
+        embeddings = await self._cache_call(self.cache.get_many, self.model, self.dimensions, texts)
+        # Embed each distinct missing text once, even if it repeats in the input
+        missing = list(dict.fromkeys(
+            text for text, embedding in zip(texts, embeddings) if embedding is None
+        ))
+        hits = sum(embedding is not None for embedding in embeddings)
+        EMBEDDING_CACHE_LOOKUPS.inc(hits, result="hit")
+        EMBEDDING_CACHE_LOOKUPS.inc(len(texts) - hits, result="miss")
+        if missing:
+            missing_counts = None
+            if token_counts is not None:
+                counts = dict(zip(texts, token_counts))
+                missing_counts = [counts[text] for text in missing]
+            created = dict(zip(missing, await self._create_uncached(missing, missing_counts)))
+            await self._cache_call(
+                self.cache.set_many, self.model, self.dimensions, missing, list(created.values())
             )
-            return response.data[0].embedding
+            embeddings = [
+                embedding if embedding is not None else created[text]
+                for text, embedding in zip(texts, embeddings)
+            ]
+        return embeddings
+
+    async def _cache_call(self, method, *args):
+        """Run a cache method, in a thread when it does SQLite I/O"""
+        if self.cache.on_disk:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def _create_uncached(
+        self,
+        texts: List[str],
+        token_counts: Optional[List[int]] = None
+    ) -> List[List[float]]:
+        try:
+            if token_counts is None:
+                token_counts = [self.count_tokens(text) for text in texts]
+            for i, count in enumerate(token_counts):
+                if count > self.max_input_tokens:
+                    raise ValueError(
+                        f"Input {i} has {count} tokens, exceeding the limit of {self.max_input_tokens}"
+                    )
+
+            batches = self._plan_batches(token_counts)
+            logger.info(f"Embedding {len(texts)} texts in {len(batches)} requests")
+
+            semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+
+            async def embed(indices: List[int]) -> List[List[float]]:
+                async with semaphore:
+                    return await self._embed_batch([texts[i] for i in indices])
+
+            results = await asyncio.gather(*[embed(batch) for batch in batches])
+
+            embeddings: List[List[float]] = [None] * len(texts)
+            for batch, vectors in zip(batches, results):
+                for i, vector in zip(batch, vectors):
+                    embeddings[i] = vector
+            return embeddings
         except Exception as e:
-            logger.error(f"Error creating embedding: {str(e)}")
-            raise
\ No newline at end of file
+            logger.error(f"Error creating embeddings: {str(e)}")
+            raise
+
+    def _plan_batches(self, token_counts: List[int]) -> List[List[int]]:
+        """Group input indices into batches within the per-request item and token limits"""
+        batches = []
+        current: List[int] = []
+        current_tokens = 0
+        for i, count in enumerate(token_counts):
+            if current and (
+                len(current) >= self.max_batch_items
+                or current_tokens + count > self.max_batch_tokens
+            ):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(i)
+            current_tokens += count
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        EMBEDDING_BATCH_SIZE.observe(len(texts))
+        return await self.provider.embed(texts)
+
+    async def close(self) -> None:
+        await self.provider.close()
@@ -0,0 +1,212 @@
+from app.config import get_settings
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from array import array
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, int, str]
+
+# Keys per SELECT ... IN (...), within SQLite's default variable limit
+DISK_LOOKUP_BATCH = 500
+
+class EmbeddingCache:
+    """Content-addressed embedding cache with an in-memory LRU and an optional SQLite tier
+
+    The SQLite tier keeps at most max_disk_entries rows, dropping the least
+    recently used. With a path, get_many and set_many do blocking I/O and
+    async callers should run them in a thread (see on_disk).
+    """
+
+    def __init__(self, max_entries: int = 10_000, path: Optional[str] = None, max_disk_entries: int = 100_000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.path = path
+        self._memory: "OrderedDict[CacheKey, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._db = self._open_db(path) if path else None
+        self._disk_entries = (
+            self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] if self._db else 0
+        )
+
+    @property
+    def on_disk(self) -> bool:
+        return self._db is not None
+
+    @staticmethod
+    def _open_db(path: str) -> sqlite3.Connection:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (model, dimensions, content_hash)
+            )
+        """)
+        columns = {row[1] for row in db.execute("PRAGMA table_info(embeddings)")}
+        if "accessed_at" not in columns:
+            # Caches written before the disk tier was bounded
+            db.execute("ALTER TABLE embeddings ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+        db.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed_at ON embeddings (accessed_at)")
+        return db
+
+    @staticmethod
+    def make_key(model: str, dimensions: int, text: str) -> CacheKey:
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return (model, dimensions, content_hash)
+
+    def get_many(self, model: str, dimensions: int, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up embeddings for texts, returning None for each miss"""
+        keys = [self.make_key(model, dimensions, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(keys)
+        with self._lock:
+            from_disk: Dict[CacheKey, List[float]] = {}
+            if self._db is not None:
+                missing = [key for key in dict.fromkeys(keys) if key not in self._memory]
+                if missing:
+                    from_disk = self._read_disk(model, dimensions, [key[2] for key in missing])
+                    self.disk_hits += len(from_disk)
+                    for key, embedding in from_disk.items():
+                        self._remember(key, embedding)
+            for i, key in enumerate(keys):
+                embedding = from_disk.get(key)
+                if embedding is None:
+                    embedding = self._memory.get(key)
+                    if embedding is None:
+                        self.misses += 1
+                        continue
+                    self._memory.move_to_end(key)
+                self.hits += 1
+                results[i] = embedding
+        return results
+
+    def set_many(self, model: str, dimensions: int, texts: List[str], embeddings: List[List[float]]) -> None:
+        """Store embeddings for texts in both tiers"""
+        keys = [self.make_key(model, dimensions, text) for text in texts]
+        with self._lock:
+            for key, embedding in zip(keys, embeddings):
+                self._remember(key, embedding)
+            if self._db is not None:
+                now = time.time()
+                cursor = self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings "
+                    "(model, dimensions, content_hash, embedding, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (key[0], key[1], key[2], array("f", embedding).tobytes(), now, now)
+                        for key, embedding in zip(keys, embeddings)
+                    ]
+                )
+                # Replaced rows are counted too, so this overestimates until the next trim
+                self._disk_entries += max(cursor.rowcount, 0)
+                if self._disk_entries > self.max_disk_entries:
+                    self._trim_disk()
+
+    def invalidate_model(self, model: str) -> int:
+        """Drop every cached embedding produced by a model"""
+        return self._invalidate(lambda key: key[0] == model, "model = ?", (model,))
+
+    def prune_models(self, keep_model: str) -> int:
+        """Drop every cached embedding not produced by keep_model"""
+        return self._invalidate(lambda key: key[0] != keep_model, "model != ?", (keep_model,))
+
+    def stats(self) -> Dict[str, int]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _invalidate(self, matches, where: str, params: tuple) -> int:
+        with self._lock:
+            stale = [key for key in self._memory if matches(key)]
+            for key in stale:
+                del self._memory[key]
+            removed = len(stale)
+            if self._db is not None:
+                cursor = self._db.execute(f"DELETE FROM embeddings WHERE {where}", params)
+                removed = max(removed, cursor.rowcount)
+                self._disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logger.info(f"Invalidated {removed} cached embeddings")
+        return removed
+
+    def _read_disk(self, model: str, dimensions: int, hashes: List[str]) -> Dict[CacheKey, List[float]]:
+        """Fetch many embeddings per query and mark them as recently used"""
+        found: Dict[CacheKey, List[float]] = {}
+        for start in range(0, len(hashes), DISK_LOOKUP_BATCH):
+            batch = hashes[start:start + DISK_LOOKUP_BATCH]
+            placeholders = ", ".join("?" * len(batch))
+            rows = self._db.execute(
+                "SELECT content_hash, embedding FROM embeddings "
+                f"WHERE model = ? AND dimensions = ? AND content_hash IN ({placeholders})",
+                (model, dimensions, *batch)
+            ).fetchall()
+            for content_hash, embedding in rows:
+                found[(model, dimensions, content_hash)] = array("f", embedding).tolist()
+            if rows:
+                self._db.execute(
+                    "UPDATE embeddings SET accessed_at = ? "
+                    f"WHERE model = ? AND dimensions = ? AND content_hash IN ({placeholders})",
+                    (time.time(), model, dimensions, *batch)
+                )
+        return found
+
+    def _trim_disk(self) -> None:
+        """Delete the least recently used rows, down to 90% of max_disk_entries"""
+        self._disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._disk_entries - int(self.max_disk_entries * 0.9)
+        if self._disk_entries <= self.max_disk_entries or excess <= 0:
+            return
+        self._db.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY accessed_at LIMIT ?)",
+            (excess,)
+        )
+        self._disk_entries -= excess
+        logger.info(f"Trimmed {excess} embeddings from the disk cache")
+
+    def _remember(self, key: CacheKey, embedding: List[float]) -> None:
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+@lru_cache()
+def get_embedding_cache() -> EmbeddingCache:
+    return EmbeddingCache(
+        max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+        path=settings.EMBEDDING_CACHE_PATH or None,
+        max_disk_entries=settings.EMBEDDING_CACHE_MAX_DISK_ENTRIES
+    )
@@ -0,0 +1,183 @@
+from abc import ABC, abstractmethod
+from openai import AsyncOpenAI, BadRequestError
+from app.config import get_settings
+from app.utils.metrics import IN_FLIGHT, STAGE_SECONDS
+from app.utils.tokens import get_encoding
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from typing import List, Optional
+import asyncio
+import logging
+import multiprocessing
+import re
+import numpy as np
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\w+")
+
+class EmbeddingProvider(ABC):
+    """Turns texts into vectors of a fixed size
+
+    EmbeddingService handles caching, batching and concurrency; a provider
+    only embeds one batch at a time and reports the limits batches must
+    respect.
+    """
+    model: str
+    dimensions: int
+    max_batch_items: int
+    max_batch_tokens: int
+    max_input_tokens: int
+    max_concurrent_requests: int
+
+    @abstractmethod
+    def count_tokens(self, text: str) -> int:
+        ...
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        model: Optional[str] = None,
+        dimensions: Optional[int] = None
+    ):
+        self.client = client or AsyncOpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
+        self.model = model or settings.DEFAULT_EMBEDDING_MODEL
+        self.dimensions = dimensions or settings.EMBEDDING_DIMENSIONS
+        self.max_batch_items = settings.EMBEDDING_BATCH_MAX_ITEMS
+        self.max_batch_tokens = settings.EMBEDDING_BATCH_MAX_TOKENS
+        self.max_input_tokens = settings.EMBEDDING_MAX_INPUT_TOKENS
+        self.max_concurrent_requests = settings.EMBEDDING_MAX_CONCURRENT_REQUESTS
+        self._encoding = None
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            self._encoding = get_encoding(self.model)
+        return self._encoding
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed a single batch, splitting it in half if the API rejects it as too large"""
+        try:
+            with STAGE_SECONDS.time(stage="embedding_request"), IN_FLIGHT.track(operation="openai_embedding"):
+                response = await self.client.embeddings.create(
+                    model=self.model,
+                    input=texts
+                )
+        except BadRequestError as e:
+            if len(texts) == 1:
+                raise
+            logger.warning(f"Embedding batch of {len(texts)} rejected, splitting and retrying: {str(e)}")
+            middle = len(texts) // 2
+            return (
+                await self.embed(texts[:middle])
+                + await self.embed(texts[middle:])
+            )
+
+        data = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in data]
+
+def _feature_hashes(text: str, ngram_range: int) -> List[bytes]:
+    words = WORD_PATTERN.findall(text.lower())
+    features = []
+    for n in range(1, ngram_range + 1):
+        features.extend(" ".join(words[i:i + n]) for i in range(len(words) - n + 1))
+    # Character trigrams let inflections and typos of a word land near each other
+    for word in words:
+        padded = f"#{word}#"
+        features.extend(f"#3 {padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return [blake2b(feature.encode(), digest_size=8).digest() for feature in features]
+
+def hash_embed(texts: List[str], dimensions: int, ngram_range: int = 2) -> List[List[float]]:
+    """Signed feature hashing of word n-grams and character trigrams, L2-normalised
+
+    Module level so it can run in a worker process. blake2b rather than
+    hash(), which is salted per process, keeps vectors stable across
+    workers and restarts.
+    """
+    vectors = np.zeros((len(texts), dimensions), dtype=np.float32)
+    for row, text in enumerate(texts):
+        digests = _feature_hashes(text, ngram_range)
+        if not digests:
+            continue
+        values = np.frombuffer(b"".join(digests), dtype="<u8")
+        indices = (values % dimensions).astype(np.int64)
+        signs = np.where(values >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+        np.add.at(vectors[row], indices, signs)
+        # Dampen features repeated many times in long documents
+        vectors[row] = np.sign(vectors[row]) * np.log1p(np.abs(vectors[row]))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.maximum(norms, 1e-12)
+    return vectors.tolist()
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Local CPU embeddings by feature hashing, with no model download or API calls
+
+    Lexical rather than semantic: texts sharing words and word fragments
+    are similar. Batches run on a process pool so hashing large uploads
+    does not hold the event loop or the GIL; workers=0 embeds inline.
+    """
+
+    def __init__(
+        self,
+        dimensions: Optional[int] = None,
+        workers: Optional[int] = None,
+        ngram_range: Optional[int] = None
+    ):
+        self.dimensions = dimensions or settings.EMBEDDING_DIMENSIONS
+        self.ngram_range = ngram_range or settings.LOCAL_EMBEDDING_NGRAM_RANGE
+        self.workers = settings.LOCAL_EMBEDDING_WORKERS if workers is None else workers
+        self.model = f"local-hashing-{self.ngram_range}"
+        self.max_batch_items = settings.LOCAL_EMBEDDING_BATCH_SIZE
+        self.max_batch_tokens = settings.LOCAL_EMBEDDING_BATCH_SIZE * settings.EMBEDDING_MAX_INPUT_TOKENS
+        self.max_input_tokens = settings.EMBEDDING_MAX_INPUT_TOKENS
+        # One batch per worker keeps the pool busy without queueing behind it
+        self.max_concurrent_requests = max(self.workers, 1)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def count_tokens(self, text: str) -> int:
+        return len(WORD_PATTERN.findall(text))
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, since forking a process with running threads can deadlock the child
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        with STAGE_SECONDS.time(stage="embedding_request"), IN_FLIGHT.track(operation="local_embedding"):
+            if not self.workers:
+                return hash_embed(texts, self.dimensions, self.ngram_range)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, hash_embed, texts, self.dimensions, self.ngram_range
+            )
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            # Waiting for workers to exit blocks, so do it off the event loop
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+def create_embedding_provider(client: Optional[AsyncOpenAI] = None) -> EmbeddingProvider:
+    """Build the provider named by EMBEDDING_PROVIDER"""
+    if settings.EMBEDDING_PROVIDER == "openai":
+        return OpenAIEmbeddingProvider(client=client)
+    if settings.EMBEDDING_PROVIDER == "local":
+        return HashingEmbeddingProvider()
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER: {settings.EMBEDDING_PROVIDER}")
@@ -0,0 +1,461 @@
+from app.config import get_settings
+from app.services.bulk_upload import BulkUploadService
+from app.services.ingestion_pipeline import Batch
+from app.utils.csv_stream import count_csv_records
+from fastapi import UploadFile
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+import asyncio
+import bisect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+JOB_COLUMNS = [
+    "id", "client_id", "kind", "source_path", "status", "total", "processed", "failed",
+    "errors", "committed_ranges", "cancel_requested", "error", "created_at",
+    "started_at", "rows_at_start", "updated_at", "finished_at", "lease"
+]
+
+class IngestionJobManager:
+    """Runs bulk uploads as background jobs whose progress survives restarts
+
+    Uploads are spooled to INGEST_JOBS_DIR and job state lives in a SQLite file,
+    so any worker on the host can report on or cancel a job. After every
+    committed batch the job records which row ranges are stored, and a resumed
+    job skips those rows instead of embedding them again. Jobs interrupted by a
+    shutdown go back to the queue; jobs left running by a crashed worker are
+    picked up again once their heartbeat is older than INGEST_JOB_STALE_AFTER,
+    by a sweep every INGEST_JOB_SWEEP_INTERVAL seconds. Each run claims its job
+    with a fresh lease token and every write checks it, so a worker whose job
+    was taken over stops instead of ingesting the same rows twice.
+    SQLite is only touched from worker threads, never on the event loop.
+    """
+
+    def __init__(
+        self,
+        bulk_upload_service: BulkUploadService,
+        max_workers: Optional[int] = None,
+        db_path: Optional[str] = None,
+        jobs_dir: Optional[str] = None,
+        stale_after: Optional[float] = None,
+        max_errors: Optional[int] = None,
+        sweep_interval: Optional[float] = None,
+        heartbeat_interval: Optional[float] = None
+    ):
+        self.bulk_upload_service = bulk_upload_service
+        self.jobs_dir = jobs_dir or settings.INGEST_JOBS_DIR
+        self.stale_after = stale_after or settings.INGEST_JOB_STALE_AFTER
+        self.max_errors = settings.INGEST_JOB_MAX_ERRORS if max_errors is None else max_errors
+        self.sweep_interval = sweep_interval or settings.INGEST_JOB_SWEEP_INTERVAL
+        self.heartbeat_interval = heartbeat_interval or settings.INGEST_JOB_HEARTBEAT_INTERVAL
+        self._sweeper: Optional[asyncio.Task] = None
+        self._semaphore = asyncio.Semaphore(max_workers or settings.INGEST_JOB_WORKERS)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._db = self._open_db(db_path or settings.INGEST_JOBS_DB_PATH)
+
+    @staticmethod
+    def _open_db(path: str) -> sqlite3.Connection:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                id TEXT PRIMARY KEY,
+                client_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                source_path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                total INTEGER,
+                processed INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                errors TEXT NOT NULL DEFAULT '[]',
+                committed_ranges TEXT NOT NULL DEFAULT '[]',
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                rows_at_start INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                finished_at REAL,
+                lease TEXT
+            )
+        """)
+        columns = {row[1] for row in db.execute("PRAGMA table_info(ingest_jobs)")}
+        if "lease" not in columns:
+            # Job databases created before runs were leased
+            db.execute("ALTER TABLE ingest_jobs ADD COLUMN lease TEXT")
+        return db
+
+    async def start(self) -> None:
+        """Schedule queued jobs and jobs abandoned by a crashed worker, then keep sweeping for more"""
+        await self._resume_pending()
+        self._sweeper = asyncio.create_task(self._sweep())
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self._resume_pending()
+            except Exception as e:
+                logger.error(f"Error sweeping ingestion jobs: {str(e)}")
+
+    async def _resume_pending(self) -> None:
+        for job_id in await asyncio.to_thread(self._pending_jobs):
+            if job_id not in self._tasks:
+                logger.info(f"Resuming ingestion job {job_id}")
+                self._schedule(job_id)
+
+    def _pending_jobs(self) -> List[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM ingest_jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND updated_at < ?)",
+                (time.time() - self.stale_after,)
+            ).fetchall()
+        return [job_id for (job_id,) in rows]
+
+    async def close(self) -> None:
+        """Stop local jobs, leaving them queued so they resume on the next start"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._db.close()
+
+    async def submit_csv(self, file: UploadFile, client_id: UUID) -> Dict:
+        """Spool a CSV upload to disk and queue it for background ingestion"""
+        job_id = str(uuid4())
+        path = os.path.join(self.jobs_dir, f"{job_id}.csv")
+        size = 0
+        try:
+            with open(path, "wb") as out:
+                while chunk := await file.read(settings.CSV_STREAM_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > settings.MAX_CSV_UPLOAD_SIZE:
+                        raise ValueError(
+                            f"File size exceeds maximum limit of {settings.MAX_CSV_UPLOAD_SIZE} bytes"
+                        )
+                    await asyncio.to_thread(out.write, chunk)
+        except Exception:
+            os.remove(path)
+            raise
+        return await self._create(job_id, client_id, "csv", path, total=None)
+
+    async def submit_json(self, documents: List[Dict], client_id: UUID) -> Dict:
+        """Spool JSON documents to disk and queue them for background ingestion"""
+        job_id = str(uuid4())
+        path = os.path.join(self.jobs_dir, f"{job_id}.json")
+
+        def write():
+            with open(path, "w") as out:
+                json.dump(documents, out)
+
+        await asyncio.to_thread(write)
+        return await self._create(job_id, client_id, "json", path, total=len(documents))
+
+    async def get(self, job_id: str, client_id: UUID) -> Optional[Dict]:
+        job = await asyncio.to_thread(self._load, job_id)
+        if job is None or job["client_id"] != str(client_id):
+            return None
+        return self._describe(job)
+
+    async def cancel(self, job_id: str, client_id: UUID) -> Optional[Dict]:
+        """Cancel a job; a job running in another worker stops after its current batch"""
+        job = await asyncio.to_thread(self._load, job_id)
+        if job is None or job["client_id"] != str(client_id):
+            return None
+        if job["status"] in ("queued", "running"):
+            await asyncio.to_thread(self._request_cancel, job_id, job["status"])
+            task = self._tasks.get(job_id)
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        return await self.get(job_id, client_id)
+
+    def _request_cancel(self, job_id: str, status: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE ingest_jobs SET cancel_requested = 1, updated_at = ? WHERE id = ?",
+                (time.time(), job_id)
+            )
+            if status == "queued":
+                self._db.execute(
+                    "UPDATE ingest_jobs SET status = 'cancelled', finished_at = ? WHERE id = ?",
+                    (time.time(), job_id)
+                )
+
+    async def resume(self, job_id: str, client_id: UUID) -> Optional[Dict]:
+        """Requeue a cancelled job; it continues after its last committed batch"""
+        job = await asyncio.to_thread(self._load, job_id)
+        if job is None or job["client_id"] != str(client_id):
+            return None
+        if job["status"] != "cancelled":
+            raise ValueError(f"Only cancelled jobs can be resumed, job is {job['status']}")
+        await asyncio.to_thread(self._requeue, job_id)
+        self._schedule(job_id)
+        return await self.get(job_id, client_id)
+
+    def _requeue(self, job_id: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE ingest_jobs SET status = 'queued', cancel_requested = 0, "
+                "finished_at = NULL, updated_at = ? WHERE id = ?",
+                (time.time(), job_id)
+            )
+
+    async def _create(self, job_id: str, client_id: UUID, kind: str, path: str, total: Optional[int]) -> Dict:
+        def insert():
+            now = time.time()
+            with self._lock:
+                self._db.execute(
+                    "INSERT INTO ingest_jobs (id, client_id, kind, source_path, status, total, "
+                    "created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+                    (job_id, str(client_id), kind, path, total, now, now)
+                )
+
+        await asyncio.to_thread(insert)
+        logger.info(f"Queued {kind} ingestion job {job_id} for client_id: {client_id}")
+        self._schedule(job_id)
+        return await self.get(job_id, client_id)
+
+    def _schedule(self, job_id: str) -> None:
+        if job_id not in self._tasks:
+            self._tasks[job_id] = asyncio.create_task(self._run(job_id))
+
+    def _claim(self, job_id: str, lease: str) -> bool:
+        """Atomically mark a job as running under a new lease"""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE ingest_jobs SET status = 'running', started_at = ?, "
+                "rows_at_start = processed + failed, updated_at = ?, lease = ? "
+                "WHERE id = ? AND (status = 'queued' OR (status = 'running' AND updated_at < ?))",
+                (now, now, lease, job_id, now - self.stale_after)
+            )
+        return cursor.rowcount == 1
+
+    async def _run(self, job_id: str) -> None:
+        lease = str(uuid4())
+        try:
+            async with self._semaphore:
+                if not await asyncio.to_thread(self._claim, job_id, lease):
+                    return
+                heartbeat = asyncio.create_task(self._heartbeat(job_id, lease))
+                try:
+                    await self._ingest(await asyncio.to_thread(self._load, job_id), lease)
+                finally:
+                    heartbeat.cancel()
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self._interrupted, job_id, lease)
+            raise
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {str(e)}")
+            await asyncio.to_thread(self._finish, job_id, "failed", str(e), lease)
+        finally:
+            self._tasks.pop(job_id, None)
+
+    async def _heartbeat(self, job_id: str, lease: str) -> None:
+        """Keep a running job from looking abandoned; stop it once another worker holds it"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                held = await asyncio.to_thread(self._touch, job_id, lease)
+            except Exception as e:
+                logger.error(f"Error recording heartbeat of ingestion job {job_id}: {str(e)}")
+                continue
+            if not held:
+                logger.warning(f"Ingestion job {job_id} was taken over by another worker, stopping")
+                self._tasks[job_id].cancel()
+                return
+
+    def _touch(self, job_id: str, lease: str) -> bool:
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE ingest_jobs SET updated_at = ? WHERE id = ? AND lease = ? AND status = 'running'",
+                (time.time(), job_id, lease)
+            )
+        return cursor.rowcount == 1
+
+    def _interrupted(self, job_id: str, lease: str) -> None:
+        job = self._load(job_id)
+        if job["lease"] != lease:
+            # Never claimed, or taken over by another worker, which now owns its state
+            return
+        if job["cancel_requested"]:
+            self._finish(job_id, "cancelled", lease=lease)
+            return
+        # Interrupted by shutdown; leave it for the next start to resume
+        with self._lock:
+            self._db.execute(
+                "UPDATE ingest_jobs SET status = 'queued', updated_at = ? "
+                "WHERE id = ? AND status = 'running' AND lease = ?",
+                (time.time(), job_id, lease)
+            )
+
+    async def _ingest(self, job: Dict, lease: str) -> None:
+        job_id = job["id"]
+        ranges: List[List[int]] = job["committed_ranges"]
+        logger.info(f"Running ingestion job {job_id} with {len(ranges)} committed row ranges")
+
+        async def on_batch_committed(batch: Batch) -> None:
+            if await asyncio.to_thread(self._record_batch, job_id, lease, batch):
+                self._tasks[job_id].cancel()
+
+        if job["kind"] == "csv":
+            if job["total"] is None:
+                total = await asyncio.to_thread(count_csv_records, job["source_path"])
+                # Throughput is measured from here, not from the claim
+                await asyncio.to_thread(self._update, job_id, lease, total=total, started_at=time.time())
+            with open(job["source_path"], "rb") as source:
+                documents = self.bulk_upload_service.iter_csv_documents(UploadFile(file=source))
+                await self.bulk_upload_service.pipeline.run(
+                    self._skip_committed(documents, ranges),
+                    job["client_id"],
+                    on_batch_committed=on_batch_committed
+                )
+        else:
+            with open(job["source_path"]) as source:
+                payload = await asyncio.to_thread(json.load, source)
+            documents = self.bulk_upload_service.iter_json_documents(payload)
+            await self.bulk_upload_service.pipeline.run(
+                self._skip_committed(documents, ranges),
+                job["client_id"],
+                on_batch_committed=on_batch_committed
+            )
+
+        await asyncio.to_thread(self._finish, job_id, "completed", None, lease)
+
+    @staticmethod
+    async def _skip_committed(
+        documents: AsyncIterator[Tuple[int, Dict]],
+        ranges: List[List[int]]
+    ) -> AsyncIterator[Tuple[int, Dict]]:
+        starts = [first for first, _ in ranges]
+        async for row, document in documents:
+            i = bisect.bisect_right(starts, row) - 1
+            if i >= 0 and ranges[i][0] <= row <= ranges[i][1]:
+                continue
+            yield row, document
+
+    def _record_batch(self, job_id: str, lease: str, batch: Batch) -> bool:
+        """Persist a committed batch; returns True if the job has been asked to stop
+
+        Nothing is written once another worker holds the job. Only the first
+        max_errors row errors are stored; failed counts them all.
+        """
+        with self._lock:
+            processed, failed, ranges, cancel_requested, holder = self._db.execute(
+                "SELECT processed, failed, committed_ranges, cancel_requested, lease "
+                "FROM ingest_jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+            if holder != lease:
+                logger.warning(f"Ingestion job {job_id} was taken over by another worker, stopping")
+                return True
+            ranges = _merge_range(json.loads(ranges), batch.first_row, batch.last_row)
+            fields = {
+                "processed": processed + batch.processed,
+                "failed": failed + len(batch.errors),
+                "committed_ranges": json.dumps(ranges),
+                "updated_at": time.time()
+            }
+            if batch.errors and failed < self.max_errors:
+                (errors,) = self._db.execute(
+                    "SELECT errors FROM ingest_jobs WHERE id = ?", (job_id,)
+                ).fetchone()
+                fields["errors"] = json.dumps((json.loads(errors) + batch.errors)[:self.max_errors])
+            assignments = ", ".join(f"{column} = ?" for column in fields)
+            self._db.execute(
+                f"UPDATE ingest_jobs SET {assignments} WHERE id = ?",
+                (*fields.values(), job_id)
+            )
+        return bool(cancel_requested)
+
+    def _finish(self, job_id: str, status: str, error: Optional[str] = None, lease: Optional[str] = None) -> None:
+        if not self._update(job_id, lease, status=status, error=error, finished_at=time.time()):
+            logger.warning(f"Ingestion job {job_id} is held by another worker, not marking it {status}")
+            return
+        job = self._load(job_id)
+        if status in ("completed", "failed") and os.path.exists(job["source_path"]):
+            os.remove(job["source_path"])
+        logger.info(f"Ingestion job {job_id} {status}")
+
+    def _update(self, job_id: str, lease: Optional[str] = None, **fields) -> bool:
+        """Set fields of a job, only while lease holds it if one is given"""
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        where, params = "id = ?", (job_id,)
+        if lease is not None:
+            where, params = "id = ? AND lease = ?", (job_id, lease)
+        with self._lock:
+            cursor = self._db.execute(
+                f"UPDATE ingest_jobs SET {assignments} WHERE {where}",
+                (*fields.values(), *params)
+            )
+        return cursor.rowcount == 1
+
+    def _load(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM ingest_jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+        job["errors"] = json.loads(job["errors"])
+        job["committed_ranges"] = json.loads(job["committed_ranges"])
+        return job
+
+    @staticmethod
+    def _describe(job: Dict) -> Dict:
+        done = job["processed"] + job["failed"]
+        throughput = None
+        eta = None
+        if job["started_at"]:
+            end = job["finished_at"] or time.time()
+            elapsed = end - job["started_at"]
+            if elapsed > 0:
+                throughput = (done - job["rows_at_start"]) / elapsed
+            if job["status"] == "running" and throughput and job["total"] is not None:
+                eta = max(job["total"] - done, 0) / throughput
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "kind": job["kind"],
+            "total_documents": job["total"],
+            "processed_documents": job["processed"],
+            "failed_documents": job["failed"],
+            "throughput_per_second": throughput,
+            "eta_seconds": eta,
+            "errors": job["errors"],
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "finished_at": job["finished_at"]
+        }
+
+def _merge_range(ranges: List[List[int]], first: int, last: int) -> List[List[int]]:
+    """Add an inclusive row range to a sorted list of ranges, merging adjacent ones"""
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges + [[first, last]]):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
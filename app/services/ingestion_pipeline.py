@@ -0,0 +1,252 @@
+from app.config import get_settings
+from app.services.chunking import TextChunker, embed_chunked
+from app.services.embedding import EmbeddingService
+from app.services.supabase import SupabaseService
+from dataclasses import dataclass, field
+from openai import BadRequestError
+from typing import AsyncIterable, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from uuid import UUID
+import asyncio
+import logging
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Stage workers stop when they receive this from their input queue
+_DONE = object()
+
+@dataclass
+class Batch:
+    number: int
+    rows: List[int] = field(default_factory=list)
+    documents: List[Dict] = field(default_factory=list)
+    embeddings: List[List[float]] = field(default_factory=list)
+    chunks: Optional[List[List[Dict]]] = None
+    # Tokens per document, when counted before embedding
+    token_counts: Optional[List[int]] = None
+    first_row: int = 0
+    last_row: int = 0
+    processed: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def record_error(self, row: int, error: Exception) -> None:
+        self.errors.append(f"Error processing row {row}: {str(error)}")
+
+@dataclass
+class IngestionReport:
+    total: int = 0
+    processed: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def record_batch(self, batch: Batch) -> None:
+        self.processed += batch.processed
+        self.failed += len(batch.errors)
+        self.errors.extend(batch.errors)
+
+    def to_dict(self) -> Dict:
+        return {
+            "status": "completed",
+            "total_documents": self.total,
+            "processed_documents": self.processed,
+            "failed_documents": self.failed,
+            "errors": self.errors
+        }
+
+class IngestionPipeline:
+    """Staged parse -> batch-embed -> bulk-insert pipeline
+
+    Each stage runs its own workers and hands batches to the next stage through a
+    bounded queue, so a slow stage applies backpressure to the ones before it.
+    Rows too long to embed fail before their batch is sent, and a batch the
+    API rejects is retried row by row, so a bad row only fails itself.
+    """
+
+    def __init__(
+        self,
+        embedding_service: EmbeddingService,
+        supabase: SupabaseService,
+        batch_size: Optional[int] = None,
+        embed_concurrency: Optional[int] = None,
+        insert_concurrency: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        chunker: Optional[TextChunker] = None
+    ):
+        self.embedding_service = embedding_service
+        self.supabase = supabase
+        self.chunker = chunker
+        self.batch_size = batch_size or settings.BATCH_SIZE
+        self.embed_concurrency = embed_concurrency or settings.INGEST_EMBED_CONCURRENCY
+        self.insert_concurrency = insert_concurrency or settings.INGEST_INSERT_CONCURRENCY
+        self.queue_size = queue_size or settings.INGEST_QUEUE_SIZE
+
+    async def run(
+        self,
+        documents: AsyncIterable[Tuple[int, Union[Dict, Exception]]],
+        client_id: UUID,
+        on_batch_committed: Optional[Callable[[Batch], Awaitable[None]]] = None
+    ) -> IngestionReport:
+        """Ingest (row number, document) pairs for a client and report the outcome
+
+        A row paired with an exception instead of a document is recorded as
+        failed. on_batch_committed is awaited after each batch has been fully
+        inserted, with the batch's row range and outcome. Batches may commit
+        out of order.
+        """
+        report = IngestionReport()
+        embed_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        insert_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        async def parse():
+            batch = Batch(number=0)
+            async for row, document in documents:
+                report.total += 1
+                if not batch.rows and not batch.errors:
+                    batch.first_row = row
+                batch.last_row = row
+                if isinstance(document, Exception):
+                    batch.record_error(row, document)
+                else:
+                    batch.rows.append(row)
+                    batch.documents.append(document)
+                if len(batch.rows) + len(batch.errors) >= self.batch_size:
+                    await embed_queue.put(batch)
+                    batch = Batch(number=batch.number + 1)
+            if batch.rows or batch.errors:
+                await embed_queue.put(batch)
+            for _ in range(self.embed_concurrency):
+                await embed_queue.put(_DONE)
+
+        async def embed():
+            while (batch := await embed_queue.get()) is not _DONE:
+                await self._embed_batch(batch)
+                await insert_queue.put(batch)
+
+        async def insert():
+            while (batch := await insert_queue.get()) is not _DONE:
+                await self._insert_batch(batch, client_id)
+                report.record_batch(batch)
+                if on_batch_committed is not None:
+                    await on_batch_committed(batch)
+
+        async def embed_stage():
+            await asyncio.gather(*[embed() for _ in range(self.embed_concurrency)])
+            for _ in range(self.insert_concurrency):
+                await insert_queue.put(_DONE)
+
+        tasks = [
+            asyncio.create_task(parse()),
+            asyncio.create_task(embed_stage()),
+            *[asyncio.create_task(insert()) for _ in range(self.insert_concurrency)]
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        logger.info(
+            f"Ingested {report.processed}/{report.total} documents for client_id: {client_id} "
+            f"({report.failed} failed)"
+        )
+        return report
+
+    async def _embed(
+        self,
+        contents: List[str],
+        token_counts: Optional[List[int]] = None
+    ) -> Tuple[List[List[float]], Optional[List[List[Dict]]]]:
+        if self.chunker is not None:
+            return await embed_chunked(self.embedding_service, self.chunker, contents)
+        return await self.embedding_service.create_embeddings(contents, token_counts=token_counts), None
+
+    async def _drop_oversized(self, batch: Batch) -> None:
+        """Fail rows over the embedding input limit; chunked rows never exceed it
+
+        Tokens are counted off the event loop and kept on the batch, so
+        embedding does not count them again.
+        """
+        limit = self.embedding_service.max_input_tokens
+        counts = await asyncio.to_thread(
+            lambda: [self.embedding_service.count_tokens(doc['content']) for doc in batch.documents]
+        )
+        rows, documents, token_counts = [], [], []
+        for row, doc, count in zip(batch.rows, batch.documents, counts):
+            if count > limit:
+                batch.record_error(row, ValueError(f"Content has {count} tokens, exceeding the limit of {limit}"))
+                continue
+            rows.append(row)
+            documents.append(doc)
+            token_counts.append(count)
+        batch.rows, batch.documents, batch.token_counts = rows, documents, token_counts
+
+    async def _embed_batch(self, batch: Batch) -> None:
+        if not batch.documents:
+            return
+        if self.chunker is None:
+            await self._drop_oversized(batch)
+            if not batch.documents:
+                return
+        contents = [doc['content'] for doc in batch.documents]
+        try:
+            batch.embeddings, batch.chunks = await self._embed(contents, batch.token_counts)
+            return
+        except BadRequestError as e:
+            # The provider already split the batch, so one of its inputs was rejected
+            logger.warning(f"Embedding batch {batch.number} rejected, retrying rows individually: {str(e)}")
+        except Exception as e:
+            # Not specific to any row, so retrying rows one by one would only repeat it
+            logger.error(f"Error embedding batch {batch.number}: {str(e)}")
+            for row in batch.rows:
+                batch.record_error(row, e)
+            batch.rows, batch.documents = [], []
+            return
+
+        rows, documents, embeddings, chunks = [], [], [], []
+        counts = batch.token_counts or [None] * len(batch.documents)
+        for row, doc, count in zip(batch.rows, batch.documents, counts):
+            try:
+                doc_embeddings, doc_chunks = await self._embed(
+                    [doc['content']], [count] if count is not None else None
+                )
+            except Exception as e:
+                batch.record_error(row, e)
+                logger.error(f"Error embedding document: {str(e)}")
+                continue
+            rows.append(row)
+            documents.append(doc)
+            embeddings.append(doc_embeddings[0])
+            chunks.append(doc_chunks[0] if doc_chunks else None)
+        batch.rows, batch.documents, batch.embeddings = rows, documents, embeddings
+        batch.chunks = chunks if self.chunker is not None else None
+
+    async def _insert_batch(self, batch: Batch, client_id: UUID) -> None:
+        if not batch.documents:
+            return
+        records = [
+            {
+                "title": doc["title"],
+                "content": doc["content"],
+                "client_id": str(client_id),
+                "embedding": embedding,
+                "metadata": doc.get("metadata") or {}
+            }
+            for doc, embedding in zip(batch.documents, batch.embeddings)
+        ]
+        try:
+            await self.supabase.create_documents(records, chunks=batch.chunks)
+            batch.processed += len(records)
+            return
+        except Exception as e:
+            logger.warning(f"Inserting batch {batch.number} failed, retrying rows individually: {str(e)}")
+
+        for i, (row, record) in enumerate(zip(batch.rows, records)):
+            try:
+                chunks = [batch.chunks[i]] if batch.chunks else None
+                await self.supabase.create_documents([record], chunks=chunks)
+                batch.processed += 1
+            except Exception as e:
+                batch.record_error(row, e)
+                logger.error(f"Error inserting document: {str(e)}")
@@ -0,0 +1,185 @@
+from app.config import get_settings
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+import asyncio
+import heapq
+import math
+import re
+import time
+
+settings = get_settings()
+
+# Identifiers such as SKU-1234, ERR_42 or v2.1.0 are kept whole and also split into parts
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+SEPARATOR_PATTERN = re.compile(r"[-_./:]")
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = SEPARATOR_PATTERN.split(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+def reciprocal_rank_fusion(rankings: List[List[Dict]], limit: int, k: int = 60) -> List[Dict]:
+    """Merge ranked result lists, scoring each document by the sum of 1 / (k + rank)
+
+    Chunks are merged with their document through document_id; the first list
+    a document appears in supplies the returned row.
+    """
+    scores: Dict[str, float] = {}
+    rows: Dict[str, Dict] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            key = str(row.get('document_id') or row['id'])
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            rows.setdefault(key, row)
+    best = heapq.nlargest(limit, scores, key=scores.get)
+    return [{**rows[key], 'rrf_score': scores[key]} for key in best]
+
+def analyze(rows: Iterable[Dict]) -> List[Tuple[str, Dict[str, int]]]:
+    """Term frequencies of each row's title and content
+
+    Tokenizing is the expensive part of indexing, so loaders run this off the
+    event loop and only apply the result on it.
+    """
+    return [
+        (str(row['id']), dict(Counter(tokenize(f"{row.get('title') or ''}\n{row.get('content') or ''}"))))
+        for row in rows
+    ]
+
+class TenantKeywords:
+    """BM25 inverted index over the titles and contents of one tenant's documents
+
+    Only document ids are kept, with the distinct terms of each document so
+    removals need no re-tokenizing; search returns ids for the caller to fetch.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.terms: Dict[str, Tuple[str, ...]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self.loaded_at = 0.0
+        # Wall-clock time of the last load or refresh from the database
+        self.synced_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def add(self, doc_id: str, frequencies: Dict[str, int]) -> None:
+        """Index a document from its term frequencies, replacing any previous version"""
+        doc_id = str(doc_id)
+        self.remove(doc_id)
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+        length = sum(frequencies.values())
+        self.terms[doc_id] = tuple(frequencies)
+        self.lengths[doc_id] = length
+        self.total_length += length
+
+    def index_rows(self, rows: Iterable[Dict]) -> None:
+        for doc_id, frequencies in analyze(rows):
+            self.add(doc_id, frequencies)
+
+    def upsert(self, row: Dict) -> None:
+        self.index_rows([row])
+
+    def remove(self, doc_id: str) -> None:
+        terms = self.terms.pop(str(doc_id), None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(str(doc_id), None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.lengths.pop(str(doc_id))
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, float]]:
+        """Top-limit (document id, BM25 score) pairs, best first; documents without a query term are left out"""
+        if not self.lengths or limit <= 0:
+            return []
+        count = len(self.lengths)
+        average_length = self.total_length / count or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        best = heapq.nlargest(limit, scores, key=scores.get)
+        return [(doc_id, scores[doc_id]) for doc_id in best]
+
+class KeywordIndex:
+    """Per-tenant BM25 indexes, loaded on first search and kept current by local writes
+
+    After ttl seconds a tenant is refreshed with the documents changed since
+    its last sync, to pick up writes made by other workers.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_documents: int = 100_000):
+        self.ttl = ttl
+        self.max_documents = max_documents
+        self._tenants: Dict[str, TenantKeywords] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def get(self, client_id: UUID) -> Optional[TenantKeywords]:
+        """Return the tenant's index, or None if not loaded or expired"""
+        keywords = self._tenants.get(str(client_id))
+        if keywords is None or time.monotonic() - keywords.loaded_at > self.ttl:
+            return None
+        return keywords
+
+    def peek(self, client_id: UUID) -> Optional[TenantKeywords]:
+        """Return the tenant's index even if it is due for a refresh"""
+        return self._tenants.get(str(client_id))
+
+    def lock(self, client_id: UUID) -> asyncio.Lock:
+        return self._locks.setdefault(str(client_id), asyncio.Lock())
+
+    def install(self, client_id: UUID, keywords: TenantKeywords, fresh: bool = True) -> None:
+        """Store a loaded tenant; one that raced with local writes is used once, then refreshed"""
+        keywords.loaded_at = time.monotonic() if fresh else float("-inf")
+        self._tenants[str(client_id)] = keywords
+
+    def add(self, client_id: UUID, analyzed: Iterable[Tuple[str, Dict[str, int]]]) -> None:
+        """Index documents of a loaded tenant from the output of analyze()"""
+        keywords = self._tenants.get(str(client_id))
+        if keywords is None:
+            return
+        for doc_id, frequencies in analyzed:
+            keywords.add(doc_id, frequencies)
+
+    def discard(self, client_id: UUID) -> None:
+        self._tenants.pop(str(client_id), None)
+
+    def remove(self, client_id: UUID, doc_ids: Iterable[str]) -> None:
+        keywords = self._tenants.get(str(client_id))
+        if keywords is None:
+            return
+        for doc_id in doc_ids:
+            keywords.remove(doc_id)
+
+    def stats(self) -> Dict:
+        return {
+            "tenants": len(self._tenants),
+            "documents": sum(len(keywords) for keywords in self._tenants.values()),
+            "terms": sum(len(keywords.postings) for keywords in self._tenants.values())
+        }
+
+@lru_cache()
+def get_keyword_index() -> KeywordIndex:
+    return KeywordIndex(
+        ttl=settings.KEYWORD_INDEX_TTL,
+        max_documents=settings.KEYWORD_INDEX_MAX_DOCUMENTS
+    )
@@ -0,0 +1,75 @@
+from app.config import get_settings
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+import threading
+import time
+
+settings = get_settings()
+
+# The only user fields kept; secrets such as password_hash never enter the cache
+PRINCIPAL_FIELDS = ("id", "email", "client_id")
+
+def to_principal(user: Dict) -> Dict:
+    return {key: user.get(key) for key in PRINCIPAL_FIELDS}
+
+class PrincipalCache:
+    """Principals resolved from token subjects, reused for up to ttl seconds
+
+    Only PRINCIPAL_FIELDS of each user are stored. Entries are dropped when the user is updated through this process; the
+    TTL bounds staleness from updates made by other workers. The least
+    recently used entries are evicted beyond max_entries.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 10_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._users: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, subject: str) -> Optional[Dict]:
+        """Return the cached principal, or None if unknown or expired"""
+        with self._lock:
+            entry = self._users.get(subject)
+            if entry is None:
+                return None
+            cached_at, user = entry
+            if time.monotonic() - cached_at > self.ttl:
+                del self._users[subject]
+                return None
+            self._users.move_to_end(subject)
+            return user
+
+    def set(self, subject: str, user: Dict) -> None:
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._users[subject] = (time.monotonic(), to_principal(user))
+            self._users.move_to_end(subject)
+            while len(self._users) > self.max_entries:
+                self._users.popitem(last=False)
+
+    def invalidate(self, subject: str) -> None:
+        with self._lock:
+            self._users.pop(subject, None)
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop every entry resolved to the user with this id"""
+        with self._lock:
+            stale = [
+                subject for subject, (_, user) in self._users.items()
+                if str(user.get('id')) == str(user_id)
+            ]
+            for subject in stale:
+                del self._users[subject]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+
+@lru_cache()
+def get_principal_cache() -> PrincipalCache:
+    return PrincipalCache(
+        ttl=settings.AUTH_PRINCIPAL_CACHE_TTL,
+        max_entries=settings.AUTH_PRINCIPAL_CACHE_MAX_ENTRIES
+    )
@@ -0,0 +1,168 @@
+from app.config import get_settings
+from app.utils.metrics import QUERY_LOGS_DROPPED, STAGE_SECONDS
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+from uuid import UUID
+import asyncio
+import json
+import logging
+import os
+import threading
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class QueryLogWriter:
+    """Writes query_logs rows in bulk from a background task
+
+    Requests only append to a bounded in-memory buffer. The buffer is
+    flushed with one insert per batch_size rows, or every flush_interval
+    seconds. When the buffer is full, or an insert fails, rows are appended
+    to spill_path as JSON lines and sent again on the next start; without a
+    spill path they are dropped. Spill files are only written from worker
+    threads: rows overflowing the buffer wait in a second queue of up to
+    max_buffer rows for the background task, and are dropped beyond that.
+    Closing the writer flushes what is left.
+    """
+
+    def __init__(
+        self,
+        insert: Callable[[List[Dict]], Awaitable[None]],
+        max_buffer: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        spill_path: Optional[str] = None
+    ):
+        self.insert = insert
+        self.max_buffer = max_buffer or settings.QUERY_LOG_BUFFER_SIZE
+        self.batch_size = batch_size or settings.QUERY_LOG_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.QUERY_LOG_FLUSH_INTERVAL
+        self.spill_path = settings.QUERY_LOG_SPILL_PATH if spill_path is None else spill_path
+        self._buffer: Deque[Dict] = deque()
+        # Rows waiting to be spilled by the background task
+        self._overflow: List[Dict] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._spill_lock = threading.Lock()
+        self.written = 0
+        self.spilled = 0
+        self.dropped = 0
+
+    async def start(self) -> None:
+        """Queue rows spilled by a previous run and start flushing in the background"""
+        for row in await asyncio.to_thread(self._take_spilled):
+            self._buffer.append(row)
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, user_id: UUID, client_id: UUID, query: str, embedding: List[float]) -> None:
+        """Buffer one query log row; never waits on the database"""
+        row = {
+            'user_id': str(user_id),
+            'client_id': str(client_id),
+            'query': query,
+            'embedding': embedding
+        }
+        if len(self._buffer) >= self.max_buffer:
+            if not self.spill_path or len(self._overflow) >= self.max_buffer:
+                self._drop(1, "overflow")
+                return
+            self._overflow.append(row)
+            self._wakeup.set()
+            return
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._spill_overflow()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Insert every buffered row, one batch at a time"""
+        while self._buffer:
+            batch = [
+                self._buffer.popleft()
+                for _ in range(min(self.batch_size, len(self._buffer)))
+            ]
+            try:
+                with STAGE_SECONDS.time(stage="query_log_flush"):
+                    await self.insert(batch)
+                self.written += len(batch)
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} query logs: {str(e)}")
+                await asyncio.to_thread(self._spill, batch)
+                # Leave the rest for the next flush rather than failing them all now
+                return
+
+    async def close(self) -> None:
+        """Stop the background task and write out the buffer, spilling what cannot be inserted"""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._spill_overflow()
+        await self.flush()
+        if self._buffer:
+            await asyncio.to_thread(self._spill, list(self._buffer))
+            self._buffer.clear()
+        if self.spilled or self.dropped:
+            logger.warning(f"Query logs spilled: {self.spilled}, dropped: {self.dropped}")
+
+    async def _spill_overflow(self) -> None:
+        if self._overflow:
+            rows, self._overflow = self._overflow, []
+            await asyncio.to_thread(self._spill, rows)
+
+    def _drop(self, count: int, reason: str) -> None:
+        self.dropped += count
+        QUERY_LOGS_DROPPED.inc(count, reason=reason)
+
+    def _spill(self, rows: List[Dict]) -> None:
+        """Append rows to the spill file; blocking"""
+        if not self.spill_path:
+            self._drop(len(rows), "no_spill_path")
+            return
+        try:
+            with self._spill_lock:
+                directory = os.path.dirname(self.spill_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                # One write per call so appends from other workers do not interleave
+                with open(self.spill_path, "a") as out:
+                    out.write("".join(json.dumps(row) + "\n" for row in rows))
+            self.spilled += len(rows)
+        except OSError as e:
+            logger.error(f"Error spilling query logs: {str(e)}")
+            self._drop(len(rows), "spill_failed")
+
+    def _take_spilled(self) -> List[Dict]:
+        """Read and remove the spill file, keeping at most max_buffer rows"""
+        if not self.spill_path:
+            return []
+        with self._spill_lock:
+            pending = f"{self.spill_path}.{os.getpid()}"
+            try:
+                os.replace(self.spill_path, pending)
+            except FileNotFoundError:
+                return []
+            rows = []
+            with open(pending) as spilled:
+                for line in spilled:
+                    try:
+                        rows.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+            os.remove(pending)
+        if len(rows) > self.max_buffer:
+            self._spill(rows[self.max_buffer:])
+            rows = rows[:self.max_buffer]
+        logger.info(f"Replaying {len(rows)} spilled query logs")
+        return rows
@@ -1,10 +1,20 @@
+from app.config import get_settings
+from app.services.chunking import TextChunker, embed_chunked
 from app.services.embedding import EmbeddingService
 from app.services.completion import CompletionService
+from app.services.keyword_index import reciprocal_rank_fusion
+from app.services.query_log import QueryLogWriter
+from app.services.single_flight import SingleFlight
+from app.services.source_selection import select_sources
 from app.services.supabase import SupabaseService
-from typing import Dict, List, Optional
+from app.utils.logs import Lazy, fields
+from app.utils.metrics import SEARCH_RESULTS, STAGE_SECONDS
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from uuid import UUID
+import asyncio
 import logging
 
+settings = get_settings()
 logger = logging.getLogger(__name__)
 
 class RAGService:
@@ -12,11 +22,29 @@ class RAGService:
         self,
         embedding_service: EmbeddingService,
         completion_service: CompletionService,
-        supabase_service: SupabaseService
+        supabase_service: SupabaseService,
+        chunker: Optional[TextChunker] = None,
+        hybrid: Optional[bool] = None,
+        select: Optional[bool] = None,
+        query_log: Optional[QueryLogWriter] = None,
+        single_flight: Optional[SingleFlight] = None
     ):
         self.embedding_service = embedding_service
         self.completion_service = completion_service
         self.supabase = supabase_service
+        if chunker is None and settings.CHUNKING_ENABLED:
+            chunker = TextChunker()
+        self.chunker = chunker
+        # Fuse BM25 keyword matches with vector matches at retrieval time
+        self.hybrid = settings.HYBRID_SEARCH_ENABLED if hybrid is None else hybrid
+        # Diversify retrieved sources with MMR and cut them at the largest similarity gap
+        self.select = settings.SOURCE_SELECTION_ENABLED if select is None else select
+        # Background writer for query logs; None inserts each log before returning
+        self.query_log = query_log
+        # Deduplicates identical concurrent queries; None runs every query separately
+        if single_flight is None and settings.SEARCH_COALESCING_ENABLED:
+            single_flight = SingleFlight()
+        self.single_flight = single_flight
 
     async def process_document(
         self,
@@ -26,8 +54,15 @@ class RAGService:
         metadata: Optional[Dict] = None
     ) -> Dict:
         try:
-            # Generate embedding for the document
-            embedding = await self.embedding_service.create_embedding(content)
+            # Generate embedding for the document, chunk by chunk if chunking is enabled
+            chunks = None
+            if self.chunker is not None:
+                embeddings, chunk_rows = await embed_chunked(
+                    self.embedding_service, self.chunker, [content]
+                )
+                embedding, chunks = embeddings[0], chunk_rows[0]
+            else:
+                embedding = await self.embedding_service.create_embedding(content)
             
             # Store document with embedding
             result = await self.supabase.create_document(
@@ -35,7 +70,8 @@ class RAGService:
                 content=content,
                 client_id=client_id,
                 embedding=embedding,
-                metadata=metadata
+                metadata=metadata,
+                chunks=chunks
             )
             
             return result
@@ -51,49 +87,272 @@ class RAGService:
         limit: int = 5,
         threshold: float = 0.3  # Lower threshold further to get more results
     ) -> Dict:
+        """Answer a query, sharing the work with identical queries already in flight
+
+        Concurrent requests from the same tenant whose queries differ only in
+        case and whitespace run retrieval and completion once; each caller
+        still logs its own query.
+        """
         try:
-            # Generate embedding for query
-            logger.info(f"Generating embedding for query: {query}")
-            query_embedding = await self.embedding_service.create_embedding(query)
-            logger.info("Embedding generated successfully")
-            
-            # Search for relevant documents
-            logger.info(f"Searching documents for client_id: {client_id}")
-            relevant_docs = await self.supabase.search_documents(
-                embedding=query_embedding,
+            if self.single_flight is None:
+                query_embedding, result = await self._answer(query, client_id, limit, threshold)
+            else:
+                key = (str(client_id), " ".join(query.split()).casefold(), limit, threshold)
+                query_embedding, result = await self.single_flight.do(
+                    key, lambda: self._answer(query, client_id, limit, threshold)
+                )
+
+            if result["sources"]:
+                # Log the query
+                await self._log_query(
+                    user_id=user_id,
+                    client_id=client_id,
+                    query=query,
+                    embedding=query_embedding
+                )
+
+            # Coalesced callers share the result, so each gets its own copy of the top level
+            return dict(result)
+        except Exception as e:
+            logger.error(f"Error in search_and_generate_response: {str(e)}")
+            raise
+
+    async def _answer(
+        self,
+        query: str,
+        client_id: UUID,
+        limit: int,
+        threshold: float
+    ) -> Tuple[List[float], Dict]:
+        query_embedding, relevant_docs = await self._retrieve(
+            query=query,
+            client_id=client_id,
+            limit=limit,
+            threshold=threshold
+        )
+        
+        if not relevant_docs:
+            logger.warning("No relevant documents found")
+            return query_embedding, {
+                "answer": "I don't have enough information to answer that question.",
+                "sources": []
+            }
+        
+        # Generate response using context
+        logger.info("Generating response with context")
+        response = await self.completion_service.generate_response(
+            query=query,
+            context=relevant_docs
+        )
+        logger.info("Response generated successfully")
+        
+        return query_embedding, {
+            "answer": response,
+            "sources": relevant_docs
+        }
+
+    async def stream_search_and_generate_response(
+        self,
+        query: str,
+        client_id: UUID,
+        user_id: UUID,
+        limit: int = 5,
+        threshold: float = 0.3
+    ) -> AsyncIterator[Dict]:
+        """Yield a sources event as soon as retrieval finishes, then answer tokens"""
+        try:
+            query_embedding, relevant_docs = await self._retrieve(
+                query=query,
                 client_id=client_id,
                 limit=limit,
                 threshold=threshold
             )
-            logger.info(f"Found {len(relevant_docs)} relevant documents with content: {[doc['content'] for doc in relevant_docs]}")
-            
+            yield {"event": "sources", "data": relevant_docs}
+
             if not relevant_docs:
                 logger.warning("No relevant documents found")
-                return {
-                    "answer": "I don't have enough information to answer that question.",
-                    "sources": []
+                yield {
+                    "event": "token",
+                    "data": "I don't have enough information to answer that question."
                 }
-            
-            # Generate response using context
-            logger.info("Generating response with context")
-            response = await self.completion_service.generate_response(
+                yield {"event": "done", "data": {}}
+                return
+
+            async for token in self.completion_service.stream_response(
                 query=query,
                 context=relevant_docs
-            )
-            logger.info("Response generated successfully")
-            
-            # Log the query
-            await self.supabase.log_query(
+            ):
+                yield {"event": "token", "data": token}
+            yield {"event": "done", "data": {}}
+            logger.info("Streamed response successfully")
+
+            # Log the query once the answer has been delivered
+            await self._log_query(
                 user_id=user_id,
                 client_id=client_id,
                 query=query,
                 embedding=query_embedding
             )
-            
-            return {
-                "answer": response,
-                "sources": relevant_docs
-            }
         except Exception as e:
-            logger.error(f"Error in search_and_generate_response: {str(e)}")
-            raise
\ No newline at end of file
+            logger.error(f"Error in stream_search_and_generate_response: {str(e)}")
+            raise
+
+    async def batch_search_and_generate_response(
+        self,
+        queries: List[str],
+        client_id: UUID,
+        user_id: UUID,
+        limit: int = 5,
+        threshold: float = 0.3
+    ) -> List[Dict]:
+        """Answer many queries at once, returning one result or error per query in order
+
+        Queries are embedded together; searches and completions then run with
+        bounded concurrency so one batch cannot monopolize the pools.
+        """
+        embeddings = await self._embed_queries(queries)
+        searches = asyncio.Semaphore(settings.BATCH_SEARCH_CONCURRENCY)
+        completions = asyncio.Semaphore(settings.BATCH_COMPLETION_CONCURRENCY)
+
+        async def answer(query: str, embedding) -> Dict:
+            try:
+                if isinstance(embedding, Exception):
+                    raise embedding
+                async with searches:
+                    _, relevant_docs = await self._retrieve(
+                        query=query,
+                        client_id=client_id,
+                        limit=limit,
+                        threshold=threshold,
+                        query_embedding=embedding
+                    )
+                if not relevant_docs:
+                    return {
+                        "query": query,
+                        "answer": "I don't have enough information to answer that question.",
+                        "sources": []
+                    }
+                async with completions:
+                    response = await self.completion_service.generate_response(
+                        query=query,
+                        context=relevant_docs
+                    )
+                await self._log_query(
+                    user_id=user_id,
+                    client_id=client_id,
+                    query=query,
+                    embedding=embedding
+                )
+                return {"query": query, "answer": response, "sources": relevant_docs}
+            except Exception as e:
+                logger.error(f"Error answering batch query: {str(e)}")
+                return {"query": query, "error": str(e)}
+
+        results = await asyncio.gather(*[
+            answer(query, embedding) for query, embedding in zip(queries, embeddings)
+        ])
+        failed = sum(1 for result in results if "error" in result)
+        logger.info(f"Answered batch of {len(queries)} queries, {failed} failed")
+        return results
+
+    async def _log_query(self, user_id: UUID, client_id: UUID, query: str, embedding: List[float]) -> None:
+        if self.query_log is not None:
+            self.query_log.submit(user_id=user_id, client_id=client_id, query=query, embedding=embedding)
+            return
+        await self.supabase.log_query(
+            user_id=user_id,
+            client_id=client_id,
+            query=query,
+            embedding=embedding
+        )
+
+    async def _embed_queries(self, queries: List[str]) -> List:
+        """Embed queries in one request, falling back to one request per query if that fails
+
+        Entries for queries that cannot be embedded hold the exception instead.
+        """
+        try:
+            return await self.embedding_service.create_embeddings(queries)
+        except Exception as e:
+            logger.error(f"Error embedding query batch, retrying queries one by one: {str(e)}")
+        embeddings = []
+        for query in queries:
+            try:
+                embeddings.append(await self.embedding_service.create_embedding(query))
+            except Exception as e:
+                embeddings.append(e)
+        return embeddings
+
+    async def _retrieve(
+        self,
+        query: str,
+        client_id: UUID,
+        limit: int,
+        threshold: float,
+        query_embedding: Optional[List[float]] = None
+    ) -> Tuple[List[float], List[Dict]]:
+        # Source selection picks from a wider pool of candidates
+        fetch = max(limit, settings.SOURCE_CANDIDATES) if self.select else limit
+        if self.hybrid:
+            # Keyword search runs while the query is embedded and vector-searched
+            candidates = max(fetch, settings.HYBRID_SEARCH_CANDIDATES)
+            (query_embedding, vector_docs), keyword_docs = await asyncio.gather(
+                self._vector_search(query, client_id, candidates, threshold, query_embedding),
+                self._keyword_search(query, client_id, candidates)
+            )
+            relevant_docs = reciprocal_rank_fusion(
+                [vector_docs, keyword_docs],
+                limit=fetch,
+                k=settings.HYBRID_RRF_K
+            )
+        else:
+            query_embedding, relevant_docs = await self._vector_search(
+                query, client_id, fetch, threshold, query_embedding
+            )
+
+        if self.select and relevant_docs:
+            with STAGE_SECONDS.time(stage="select_sources", tenant=client_id):
+                await self.supabase.attach_embeddings(relevant_docs, client_id)
+                relevant_docs = [
+                    {key: value for key, value in doc.items() if key != 'embedding'}
+                    for doc in select_sources(query_embedding, relevant_docs, limit)
+                ]
+        SEARCH_RESULTS.observe(len(relevant_docs), tenant=client_id)
+        logger.info(
+            f"Found {len(relevant_docs)} relevant documents",
+            extra=fields(
+                client_id=client_id,
+                ids=Lazy(lambda: [doc.get('document_id') or doc.get('id') for doc in relevant_docs]),
+                similarities=Lazy(lambda: [doc.get('similarity') for doc in relevant_docs])
+            )
+        )
+        return query_embedding, relevant_docs
+
+    async def _vector_search(
+        self,
+        query: str,
+        client_id: UUID,
+        limit: int,
+        threshold: float,
+        query_embedding: Optional[List[float]] = None
+    ) -> Tuple[List[float], List[Dict]]:
+        # Generate embedding for query unless it was embedded with its batch
+        if query_embedding is None:
+            logger.debug("Embedding query", extra=fields(query=query))
+            with STAGE_SECONDS.time(stage="embed_query", tenant=client_id):
+                query_embedding = await self.embedding_service.create_embedding(query)
+        
+        # Search for relevant documents, or their best chunks if documents are chunked
+        search = self.supabase.search_chunks if self.chunker is not None else self.supabase.search_documents
+        with STAGE_SECONDS.time(stage="vector_search", tenant=client_id):
+            relevant_docs = await search(
+                embedding=query_embedding,
+                client_id=client_id,
+                limit=limit,
+                threshold=threshold
+            )
+        return query_embedding, relevant_docs
+
+    async def _keyword_search(self, query: str, client_id: UUID, limit: int) -> List[Dict]:
+        with STAGE_SECONDS.time(stage="keyword_search", tenant=client_id):
+            return await self.supabase.search_keywords(query=query, client_id=client_id, limit=limit)
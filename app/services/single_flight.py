@@ -0,0 +1,56 @@
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Shares one execution of a coroutine between concurrent callers with the same key
+
+    The first caller for a key starts the work as a task; callers arriving
+    while it runs wait on the same task and receive its result or its
+    exception. A caller that is cancelled, e.g. because its client
+    disconnected, stops waiting without affecting the others; the work
+    itself is cancelled once nobody is waiting for it. Keys are forgotten
+    as soon as the work finishes, so results are never reused afterwards.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        call.waiters += 1
+        try:
+            # shield, so one waiter being cancelled does not cancel the shared task
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                logger.debug(f"Cancelling abandoned call for {key!r}")
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        # A newer call may already own the key
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -0,0 +1,107 @@
+from app.config import get_settings
+from typing import Dict, List, Optional
+import numpy as np
+
+settings = get_settings()
+
+def adaptive_cutoff(scores: List[float], max_k: int, min_gap: float) -> int:
+    """Number of results to keep, cutting after the largest drop in score among the first max_k
+
+    Scores must be sorted best first. Without a drop of at least min_gap all
+    max_k results are kept.
+    """
+    scores = scores[:max_k]
+    if len(scores) < 2:
+        return len(scores)
+    gaps = np.diff(-np.asarray(scores, dtype=np.float32))
+    largest = int(np.argmax(gaps))
+    return largest + 1 if gaps[largest] >= min_gap else len(scores)
+
+def maximal_marginal_relevance(
+    query: np.ndarray,
+    embeddings: np.ndarray,
+    k: int,
+    diversity_weight: float,
+    duplicate_similarity: float = 1.0,
+    relevance: Optional[np.ndarray] = None
+) -> List[int]:
+    """Greedily pick up to k rows balancing relevance to the query against similarity to picks so far
+
+    diversity_weight is the MMR lambda: 1.0 ranks by relevance alone. Rows
+    at least duplicate_similarity similar to an earlier pick are never chosen.
+    Relevance defaults to the cosine similarity of each row to the query.
+    """
+    embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    if relevance is None:
+        query = query / max(np.linalg.norm(query), 1e-12)
+        relevance = embeddings @ query
+    redundancy = np.full(len(embeddings), -np.inf)
+    available = np.ones(len(embeddings), dtype=bool)
+    selected: List[int] = []
+    while len(selected) < k and available.any():
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        scores = diversity_weight * relevance - (1 - diversity_weight) * penalty
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        similarity = embeddings @ embeddings[best]
+        redundancy = np.maximum(redundancy, similarity)
+        available &= redundancy < duplicate_similarity
+    return selected
+
+def select_sources(
+    query_embedding: List[float],
+    documents: List[Dict],
+    limit: int,
+    diversity_weight: Optional[float] = None,
+    min_gap: Optional[float] = None,
+    duplicate_similarity: Optional[float] = None
+) -> List[Dict]:
+    """Cut retrieved candidates at their largest similarity gap, then pick up to limit with MMR
+
+    Documents are expected best first with an 'embedding'; those without one
+    are kept in their rank order after the diversified ones. The cutoff only
+    applies to documents with a 'similarity', in similarity order, since
+    hybrid results are ranked by fusion and keyword matches have none. For
+    fused results MMR takes the 'rrf_score' as relevance, so keyword matches
+    keep the rank fusion gave them.
+    """
+    diversity_weight = settings.MMR_LAMBDA if diversity_weight is None else diversity_weight
+    min_gap = settings.SOURCE_MIN_GAP if min_gap is None else min_gap
+    if duplicate_similarity is None:
+        duplicate_similarity = settings.SOURCE_DUPLICATE_SIMILARITY
+
+    scores = sorted(
+        (doc['similarity'] for doc in documents if doc.get('similarity') is not None),
+        reverse=True
+    )
+    if scores:
+        floor = scores[adaptive_cutoff(scores, len(scores), min_gap) - 1]
+        documents = [
+            doc for doc in documents
+            if doc.get('similarity') is None or doc['similarity'] >= floor
+        ]
+
+    embedded = [doc for doc in documents if doc.get('embedding') is not None]
+    others = [doc for doc in documents if doc.get('embedding') is None]
+    if not embedded:
+        return documents[:limit]
+    relevance = None
+    if all(doc.get('rrf_score') is not None for doc in embedded):
+        # Rescaled to [0, 1] so it weighs against redundancy like a cosine similarity
+        fused = np.asarray([doc['rrf_score'] for doc in embedded], dtype=np.float32)
+        spread = fused.max() - fused.min()
+        relevance = (fused - fused.min()) / spread if spread > 0 else np.ones_like(fused)
+    elif all(doc.get('similarity') is not None for doc in embedded):
+        # Search similarity is the relevance when every document has one
+        relevance = np.asarray([doc['similarity'] for doc in embedded], dtype=np.float32)
+    picks = maximal_marginal_relevance(
+        np.asarray(query_embedding, dtype=np.float32),
+        np.asarray([doc['embedding'] for doc in embedded], dtype=np.float32),
+        k=limit,
+        diversity_weight=diversity_weight,
+        duplicate_similarity=duplicate_similarity,
+        relevance=relevance
+    )
+    return ([embedded[i] for i in picks] + others)[:limit]
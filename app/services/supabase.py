@@ -1,45 +1,149 @@
-from supabase import create_client
+from supabase import create_client, Client
+from postgrest.types import ReturnMethod
+from postgrest.utils import SyncClient
 from app.config import get_settings
-from typing import Dict, List, Optional, Any
+from app.services.keyword_index import KeywordIndex, TenantKeywords, analyze, get_keyword_index
+from app.services.principal_cache import PrincipalCache, get_principal_cache
+from app.services.tenant_registry import TenantRegistry, get_tenant_registry
+from app.services.vector_index import (
+    InMemoryVectorIndex,
+    TenantVectors,
+    get_vector_index,
+    parse_embedding,
+    parse_rows
+)
+from app.utils.http import get_pool_limits
+from app.utils.logs import Lazy, fields
+from app.utils.metrics import IN_FLIGHT, STAGE_SECONDS
+from typing import Any, AsyncIterator, Collection, Dict, List, Optional
 from uuid import UUID
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import asyncio
 import logging
+import time
 from fastapi import HTTPException
 
 settings = get_settings()
 
+# Columns returned from document writes; leaves out the embedding so it is not echoed back
+DOCUMENT_COLUMNS = "id,title,content,client_id,metadata,created_at,updated_at"
+# Refreshes of in-process indexes fetch again the rows changed this many seconds
+# before the last sync, covering clock skew and writes that committed late
+SYNC_OVERLAP_SECONDS = 300.0
+
 class SupabaseService:
-    def __init__(self):
-        self.client = create_client(
+    def __init__(
+        self,
+        client: Optional[Client] = None,
+        max_workers: Optional[int] = None,
+        tenants: Optional[TenantRegistry] = None,
+        vector_index: Optional[InMemoryVectorIndex] = None,
+        keyword_index: Optional[KeywordIndex] = None,
+        principals: Optional[PrincipalCache] = None,
+        embedding_dimensions: Optional[int] = None
+    ):
+        self.client = client or create_client(
             settings.SUPABASE_URL,
             settings.SUPABASE_SERVICE_KEY
         )
         self.logger = logging.getLogger(__name__)
+        self.tenants = tenants or get_tenant_registry()
+        self.principals = principals or get_principal_cache()
+        # Size of the vectors the configured embedding provider produces
+        self.embedding_dimensions = embedding_dimensions or settings.EMBEDDING_DIMENSIONS
+        # Optional in-process search backend; None searches with the match_documents RPC
+        if vector_index is None and settings.VECTOR_SEARCH_BACKEND == "memory":
+            vector_index = get_vector_index()
+        self.vector_index = vector_index
+        # BM25 index for hybrid retrieval; None disables search_keywords
+        if keyword_index is None and settings.HYBRID_SEARCH_ENABLED:
+            keyword_index = get_keyword_index()
+        self.keyword_index = keyword_index
+        # supabase-py is synchronous, so queries run on a bounded pool off the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.SUPABASE_MAX_WORKERS,
+            thread_name_prefix="supabase"
+        )
+
+    @classmethod
+    def create_pooled(cls, **kwargs) -> "SupabaseService":
+        """Create a service whose PostgREST session uses the tuned keep-alive pool"""
+        service = cls(**kwargs)
+        postgrest = service.client.postgrest
+        session = postgrest.session
+        postgrest.session = SyncClient(
+            base_url=session.base_url,
+            headers=session.headers,
+            timeout=session.timeout,
+            limits=get_pool_limits()
+        )
+        session.close()
+        return service
+
+    @property
+    def http_session(self) -> SyncClient:
+        return self.client.postgrest.session
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self.client.postgrest.aclose()
+
+    async def _execute(self, query) -> Any:
+        """Run a supabase-py query on the worker pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        with IN_FLIGHT.track(operation="supabase_query"):
+            return await loop.run_in_executor(self._executor, query.execute)
+
+    def _check_embedding(self, embedding: List[float]) -> None:
+        if not isinstance(embedding, list) or len(embedding) != self.embedding_dimensions:
+            raise ValueError(
+                f"Invalid embedding format. Expected list of {self.embedding_dimensions} floats, "
+                f"got length: {len(embedding)}"
+            )
+
+    @staticmethod
+    def _returning(query, columns: str = DOCUMENT_COLUMNS):
+        """Limit the columns PostgREST sends back from a write"""
+        query.params = query.params.add("select", columns)
+        return query
 
-    def get_user_by_email(self, email: str):
+    async def get_document_count(self, client_id: UUID) -> int:
+        """Return the number of documents a client has, served from the tenant registry when fresh"""
+        count = self.tenants.get_count(client_id)
+        if count is None:
+            response = await self._execute(
+                self.client.table('documents')
+                .select('id', count="exact")
+                .eq('client_id', str(client_id))
+                .limit(1)
+            )
+            count = response.count or 0
+            self.tenants.set_count(client_id, count)
+        return count
+
+    async def get_user_by_email(self, email: str):
         try:
-            print(f"Checking email: {email}")  # Debug print
-            response = self.client.table('users')\
-                .select("*")\
-                .eq('email', email)\
-                .execute()
-            
-            print(f"Response data: {response.data}")  # Debug print
+            response = await self._execute(
+                self.client.table('users')
+                .select("*")
+                .eq('email', email)
+            )
             data = response.data
-            result = data[0] if data else None
-            print(f"Returning result: {result}")  # Debug print
-            return result
+            return data[0] if data else None
         except Exception as e:
-            print(f"Error in get_user_by_email: {str(e)}")  # Debug print
+            self.logger.error(f"Error fetching user by email: {str(e)}")
             return None
 
     async def get_user_by_id(self, user_id: UUID) -> Optional[Dict]:
         """Retrieve user by ID"""
         try:
-            response = self.client.table('users')\
-                .select("*")\
-                .eq('id', str(user_id))\
-                .single()\
-                .execute()
+            response = await self._execute(
+                self.client.table('users')
+                .select("*")
+                .eq('id', str(user_id))
+                .single()
+            )
             return response.data
         except Exception as e:
             self.logger.error(f"Error fetching user by ID: {str(e)}")
@@ -51,16 +155,13 @@ class SupabaseService:
         content: str,
         client_id: UUID,
         embedding: List[float],
-        metadata: Optional[Dict] = None
+        metadata: Optional[Dict] = None,
+        chunks: Optional[List[Dict]] = None
     ) -> Dict:
-        """Create a new document with embedding"""
+        """Create a new document with embedding, and its chunks if the document was chunked"""
         try:
-            self.logger.info(f"Creating document for client_id: {client_id}")
-            self.logger.info(f"Embedding length: {len(embedding)}")
-            
             # Verify embedding format
-            if not isinstance(embedding, list) or len(embedding) != 1536:
-                raise ValueError(f"Invalid embedding format. Expected list of 1536 floats, got length: {len(embedding)}")
+            self._check_embedding(embedding)
             
             document_data = {
                 'title': title,
@@ -70,34 +171,88 @@ class SupabaseService:
                 'metadata': metadata or {}
             }
             
-            self.logger.info("Inserting document with data structure:")
-            self.logger.info(f"Title: {title}")
-            self.logger.info(f"Content length: {len(content)}")
-            self.logger.info(f"Client ID: {client_id}")
-            
-            response = self.client.table('documents')\
-                .insert(document_data)\
-                .execute()
+            with STAGE_SECONDS.time(stage="insert_documents", tenant=client_id):
+                response = await self._execute(self._returning(
+                    self.client.table('documents')
+                    .insert(document_data)
+                ))
             
             if not response.data:
                 raise HTTPException(status_code=400, detail="Failed to create document")
             
             created_doc = response.data[0]
-            self.logger.info(f"Document created successfully: {created_doc['id']}")
-            
-            # Verify the document was created with embedding
-            verify = self.client.table('documents')\
-                .select('id, embedding')\
-                .eq('id', created_doc['id'])\
-                .execute()
-            
-            self.logger.info(f"Verification - document has embedding: {bool(verify.data[0].get('embedding'))}")
+            if chunks:
+                await self._create_chunks([created_doc], [chunks])
+            self.tenants.record_created(client_id)
+            await self._index_created(client_id, [created_doc], [embedding])
+            self.logger.debug(
+                "Document created",
+                extra=fields(document_id=created_doc['id'], client_id=client_id, content_chars=len(content))
+            )
             
             return created_doc
         except Exception as e:
             self.logger.error(f"Error creating document: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
 
+    async def create_documents(
+        self,
+        documents: List[Dict],
+        chunks: Optional[List[List[Dict]]] = None
+    ) -> List[Dict]:
+        """Insert several documents with embeddings in a single request
+
+        chunks, if given, holds the chunk rows (content and embedding) of each document.
+        """
+        try:
+            for document in documents:
+                self._check_embedding(document['embedding'])
+            with STAGE_SECONDS.time(stage="insert_documents"):
+                response = await self._execute(self._returning(
+                    self.client.table('documents')
+                    .insert(documents)
+                ))
+            if chunks:
+                await self._create_chunks(response.data, chunks)
+            created: Dict[str, List] = {}
+            for doc, document in zip(response.data, documents):
+                self.tenants.record_created(doc['client_id'])
+                rows, embeddings = created.setdefault(str(doc['client_id']), ([], []))
+                rows.append(doc)
+                embeddings.append(document['embedding'])
+            for client_id, (rows, embeddings) in created.items():
+                await self._index_created(client_id, rows, embeddings)
+            return response.data
+        except Exception as e:
+            self.logger.error(f"Error creating documents: {str(e)}")
+            raise
+
+    async def _create_chunks(self, documents: List[Dict], chunks: List[List[Dict]]) -> None:
+        """Insert the chunks of freshly created documents, removing the documents if that fails"""
+        rows = [
+            {
+                'document_id': doc['id'],
+                'client_id': doc['client_id'],
+                'chunk_index': index,
+                'content': chunk['content'],
+                'embedding': chunk['embedding']
+            }
+            for doc, doc_chunks in zip(documents, chunks)
+            for index, chunk in enumerate(doc_chunks)
+        ]
+        try:
+            await self._execute(
+                self.client.table('document_chunks')
+                .insert(rows, returning=ReturnMethod.minimal)
+            )
+        except Exception:
+            await self._execute(
+                self.client.table('documents')
+                .delete(returning=ReturnMethod.minimal)
+                .in_('id', [doc['id'] for doc in documents])
+            )
+            raise
+
     async def search_documents(
         self,
         embedding: List[float],
@@ -106,35 +261,297 @@ class SupabaseService:
         threshold: float = 0.5
     ) -> List[Dict]:
         """Search documents using vector similarity"""
+        if self.vector_index is not None:
+            vectors = await self._tenant_vectors(client_id)
+            if vectors is not None:
+                return vectors.search(embedding, limit, threshold)
+        return await self._match('match_documents', embedding, client_id, limit, threshold)
+
+    async def _tenant_vectors(self, client_id: UUID) -> Optional[TenantVectors]:
+        """Return the tenant's in-memory vectors, loading or refreshing them if needed
+
+        A tenant already resident, or mapped from a snapshot, is refreshed with
+        the documents changed since its last sync rather than reloaded. JSON
+        embeddings are parsed off the event loop. Returns None for tenants
+        above VECTOR_INDEX_MAX_DOCUMENTS, which keep using the RPC.
+        """
+        vectors = self.vector_index.get(client_id)
+        if vectors is not None:
+            return vectors
+        async with self.vector_index.lock(client_id):
+            vectors = self.vector_index.get(client_id)
+            if vectors is not None:
+                return vectors
+            # Explicit None checks: a loaded tenant without documents has len() 0
+            vectors = self.vector_index.peek(client_id)
+            if vectors is None:
+                vectors = await self.vector_index.restore(client_id)
+            if vectors is not None and self.vector_index.get(client_id) is vectors:
+                return vectors
+
+            document_count = await self.get_document_count(client_id)
+            if document_count > self.vector_index.max_documents:
+                self.vector_index.invalidate(client_id)
+                return None
+
+            loop = asyncio.get_running_loop()
+            columns = f"{DOCUMENT_COLUMNS},embedding"
+            version = self.tenants.get_version(client_id)
+            synced_at = time.time()
+            if vectors is None:
+                vectors = self.vector_index.new_vectors(document_count)
+                # Not installed yet, so it can be filled from the executor directly
+                async for page in self._iter_client_pages(client_id, columns):
+                    await loop.run_in_executor(None, vectors.load_rows, page)
+                vectors.synced_at = synced_at
+                # Writes made while loading may be missing from this snapshot
+                fresh = self.tenants.get_version(client_id) == version
+                vectors = await self.vector_index.install(client_id, vectors, fresh=fresh)
+                self.logger.info(f"Loaded {len(vectors)} document vectors for client_id: {client_id}")
+                return vectors
+
+            changed = 0
+            async for page in self._iter_client_pages(client_id, columns, since=vectors.synced_at):
+                for row, embedding in await loop.run_in_executor(None, parse_rows, page):
+                    vectors.upsert(row, embedding)
+                changed += len(page)
+            removed = await self._removed_document_ids(client_id, list(vectors.positions))
+            for doc_id in removed:
+                vectors.remove(doc_id)
+            vectors.synced_at = synced_at
+            self.vector_index.refreshed(vectors, fresh=self.tenants.get_version(client_id) == version)
+            self.logger.debug(
+                "Refreshed document vectors",
+                extra=fields(client_id=client_id, changed=changed, removed=len(removed))
+            )
+            return vectors
+
+    async def search_keywords(
+        self,
+        query: str,
+        client_id: UUID,
+        limit: int = 5
+    ) -> List[Dict]:
+        """Search documents by BM25 keyword relevance
+
+        The index holds only ids; the matching rows are fetched in one query.
+        Returns no results for tenants above KEYWORD_INDEX_MAX_DOCUMENTS.
+        """
+        keywords = self.keyword_index.get(client_id)
+        if keywords is None:
+            keywords = await self._load_tenant_keywords(client_id)
+            if keywords is None:
+                return []
+        ranked = keywords.search(query, limit)
+        if not ranked:
+            return []
+        response = await self._execute(
+            self.client.table('documents')
+            .select(DOCUMENT_COLUMNS)
+            .eq('client_id', str(client_id))
+            .in_('id', [doc_id for doc_id, _ in ranked])
+        )
+        rows = {str(row['id']): row for row in response.data}
+        # Documents deleted by another worker since the last refresh are skipped
+        return [{**rows[doc_id], 'bm25': score} for doc_id, score in ranked if doc_id in rows]
+
+    async def _load_tenant_keywords(self, client_id: UUID) -> Optional[TenantKeywords]:
+        """Build the tenant's keyword index, or refresh it with the documents changed since its last sync
+
+        Tokenizing runs in a thread so large tenants do not block the event loop.
+        """
+        async with self.keyword_index.lock(client_id):
+            keywords = self.keyword_index.get(client_id)
+            if keywords is not None:
+                return keywords
+
+            document_count = await self.get_document_count(client_id)
+            if document_count > self.keyword_index.max_documents:
+                self.logger.warning(f"Too many documents for keyword search for client_id: {client_id}")
+                self.keyword_index.discard(client_id)
+                return None
+
+            version = self.tenants.get_version(client_id)
+            synced_at = time.time()
+            keywords = self.keyword_index.peek(client_id)
+            if keywords is None:
+                keywords = TenantKeywords()
+                # Not installed yet, so it can be filled from the thread directly
+                async for page in self._iter_client_pages(client_id, "id,title,content"):
+                    await asyncio.to_thread(keywords.index_rows, page)
+                self.logger.info(f"Indexed {len(keywords)} documents for keyword search for client_id: {client_id}")
+            else:
+                changed = 0
+                async for page in self._iter_client_pages(client_id, "id,title,content", since=keywords.synced_at):
+                    for doc_id, frequencies in await asyncio.to_thread(analyze, page):
+                        keywords.add(doc_id, frequencies)
+                    changed += len(page)
+                removed = await self._removed_document_ids(client_id, keywords.lengths.keys())
+                for doc_id in removed:
+                    keywords.remove(doc_id)
+                self.logger.debug(
+                    "Refreshed keyword index",
+                    extra=fields(client_id=client_id, changed=changed, removed=len(removed))
+                )
+            keywords.synced_at = synced_at
+
+            # Writes made while loading may be missing from this index
+            fresh = self.tenants.get_version(client_id) == version
+            self.keyword_index.install(client_id, keywords, fresh=fresh)
+            return keywords
+
+    async def attach_embeddings(self, results: List[Dict], client_id: UUID) -> None:
+        """Add the stored 'embedding' to search results that lack one
+
+        Document embeddings come from the in-memory vector index when the
+        tenant is loaded; the rest, and chunk embeddings, take one query per table.
+        """
+        missing = [row for row in results if row.get('embedding') is None]
+        vectors = self.vector_index.get(client_id) if self.vector_index is not None else None
+        if vectors is not None:
+            for row in missing:
+                position = vectors.positions.get(str(row['id']))
+                if position is not None and 'document_id' not in row:
+                    row['embedding'] = vectors.vector(position).tolist()
+
+        for table, is_chunk in (('documents', False), ('document_chunks', True)):
+            rows = [
+                row for row in results
+                if row.get('embedding') is None and ('document_id' in row) == is_chunk
+            ]
+            if not rows:
+                continue
+            response = await self._execute(
+                self.client.table(table)
+                .select('id,embedding')
+                .eq('client_id', str(client_id))
+                .in_('id', [str(row['id']) for row in rows])
+            )
+            embeddings = {str(item['id']): parse_embedding(item['embedding']) for item in response.data}
+            for row in rows:
+                row['embedding'] = embeddings.get(str(row['id']))
+
+    async def _iter_client_pages(
+        self,
+        client_id: UUID,
+        columns: str,
+        since: Optional[float] = None
+    ) -> AsyncIterator[List[Dict]]:
+        """Yield a client's documents in pages of VECTOR_INDEX_PAGE_SIZE
+
+        With since, a wall-clock time, only documents updated after it (less
+        SYNC_OVERLAP_SECONDS) are fetched.
+        """
+        page_size = settings.VECTOR_INDEX_PAGE_SIZE
+        offset = 0
+        while True:
+            query = (
+                self.client.table('documents')
+                .select(columns)
+                .eq('client_id', str(client_id))
+            )
+            if since is not None:
+                changed_after = datetime.fromtimestamp(since - SYNC_OVERLAP_SECONDS, tz=timezone.utc)
+                query = query.gte('updated_at', changed_after.isoformat())
+            response = await self._execute(
+                query
+                .order('id')
+                .range(offset, offset + page_size - 1)
+            )
+            if response.data:
+                yield response.data
+            if len(response.data) < page_size:
+                break
+            offset += page_size
+
+    async def _removed_document_ids(self, client_id: UUID, indexed: Collection[str]) -> List[str]:
+        """Ids held by a tenant index whose documents no longer exist
+
+        The tenant's ids are only listed when its document count is below the
+        number indexed, which is the case once anything has been deleted.
+        """
+        if await self.get_document_count(client_id) >= len(indexed):
+            return []
+        existing = set()
+        async for page in self._iter_client_pages(client_id, "id"):
+            existing.update(str(row['id']) for row in page)
+        return [doc_id for doc_id in indexed if doc_id not in existing]
+
+    async def _index_created(self, client_id: UUID, rows: List[Dict], embeddings: List[List[float]]) -> None:
+        """Add new documents to the in-process search indexes that are enabled"""
+        if self.vector_index is not None:
+            self.vector_index.upsert(client_id, rows, embeddings)
+        await self._index_keywords(client_id, rows)
+
+    async def _index_updated(self, client_id: UUID, row: Dict, embedding: Optional[List[float]]) -> None:
+        if self.vector_index is not None:
+            self.vector_index.update(client_id, row, embedding)
+        await self._index_keywords(client_id, [row])
+
+    async def _index_keywords(self, client_id: UUID, rows: List[Dict]) -> None:
+        if self.keyword_index is None or self.keyword_index.peek(client_id) is None:
+            return
+        self.keyword_index.add(client_id, await asyncio.to_thread(analyze, rows))
+
+    def _index_deleted(self, client_id: UUID, doc_ids: List[str]) -> None:
+        if self.vector_index is not None:
+            self.vector_index.remove(client_id, doc_ids)
+        if self.keyword_index is not None:
+            self.keyword_index.remove(client_id, doc_ids)
+
+    async def search_chunks(
+        self,
+        embedding: List[float],
+        client_id: UUID,
+        limit: int = 5,
+        threshold: float = 0.5
+    ) -> List[Dict]:
+        """Search document chunks using vector similarity"""
+        return await self._match('match_document_chunks', embedding, client_id, limit, threshold)
+
+    async def _match(
+        self,
+        function: str,
+        embedding: List[float],
+        client_id: UUID,
+        limit: int,
+        threshold: float
+    ) -> List[Dict]:
         try:
-            self.logger.info(f"Searching documents for client_id: {client_id}")
-            
             # First, check if documents exist for this client
-            docs_check = self.client.table('documents')\
-                .select('id, title')\
-                .eq('client_id', str(client_id))\
-                .execute()
-            
-            self.logger.info(f"Found {len(docs_check.data)} total documents for client")
+            with STAGE_SECONDS.time(stage="document_count", tenant=client_id):
+                document_count = await self.get_document_count(client_id)
             
-            if not docs_check.data:
+            if not document_count:
                 self.logger.warning("No documents found for this client")
                 return []
             
             # Then perform the vector search
-            response = self.client.rpc(
-                'match_documents',
-                {
-                    'query_embedding': embedding,
-                    'client_id': str(client_id),
-                    'match_threshold': threshold,
-                    'match_count': limit
-                }
-            ).execute()
+            with STAGE_SECONDS.time(stage=function, tenant=client_id):
+                response = await self._execute(
+                    self.client.rpc(
+                        function,
+                        {
+                            'query_embedding': embedding,
+                            'client_id': str(client_id),
+                            'match_threshold': threshold,
+                            'match_count': limit
+                        }
+                    )
+                )
             
-            self.logger.info(f"Vector search response: {response.data}")
-            
-            return response.data if response.data else []
+            results = response.data if response.data else []
+            self.logger.debug(
+                "Vector search",
+                extra=fields(
+                    function=function,
+                    client_id=client_id,
+                    documents=document_count,
+                    results=len(results),
+                    ids=Lazy(lambda: [row.get('id') for row in results])
+                )
+            )
+            return results
         except Exception as e:
             self.logger.error(f"Error searching documents: {str(e)}")
             raise
@@ -148,18 +565,27 @@ class SupabaseService:
     ) -> None:
         """Log search query with embedding"""
         try:
-            self.client.table('query_logs')\
-                .insert({
-                    'user_id': str(user_id),
-                    'client_id': str(client_id),
-                    'query': query,
-                    'embedding': embedding
-                })\
-                .execute()
+            with STAGE_SECONDS.time(stage="log_query", tenant=client_id):
+                await self._execute(
+                    self.client.table('query_logs')
+                    .insert({
+                        'user_id': str(user_id),
+                        'client_id': str(client_id),
+                        'query': query,
+                        'embedding': embedding
+                    })
+                )
         except Exception as e:
             self.logger.error(f"Error logging query: {str(e)}")
             # Don't raise exception for logging errors
 
+    async def insert_query_logs(self, rows: List[Dict]) -> None:
+        """Insert query log rows in one request; errors are left to the caller"""
+        await self._execute(
+            self.client.table('query_logs')
+            .insert(rows, returning=ReturnMethod.minimal)
+        )
+
     async def get_client_documents(
         self,
         client_id: UUID,
@@ -169,20 +595,22 @@ class SupabaseService:
         """Get paginated documents for a client"""
         try:
             # Get total count
-            count_response = self.client.table('documents')\
-                .select("id", count="exact")\
-                .eq('client_id', str(client_id))\
-                .execute()
+            count_response = await self._execute(
+                self.client.table('documents')
+                .select("id", count="exact")
+                .eq('client_id', str(client_id))
+            )
             
             total = count_response.count or 0
 
             # Get documents
-            response = self.client.table('documents')\
-                .select("*")\
-                .eq('client_id', str(client_id))\
-                .range((page - 1) * page_size, page * page_size - 1)\
-                .order('created_at', desc=True)\
-                .execute()
+            response = await self._execute(
+                self.client.table('documents')
+                .select("*")
+                .eq('client_id', str(client_id))
+                .range((page - 1) * page_size, page * page_size - 1)
+                .order('created_at', desc=True)
+            )
 
             return {
                 "data": response.data,
@@ -203,15 +631,20 @@ class SupabaseService:
     ) -> Dict:
         """Update document details"""
         try:
-            response = self.client.table('documents')\
-                .update(updates)\
-                .eq('id', str(document_id))\
-                .eq('client_id', str(client_id))\
-                .execute()
+            # Bump updated_at so other workers' index refreshes pick the change up
+            changes = {**updates, 'updated_at': datetime.now(timezone.utc).isoformat()}
+            response = await self._execute(self._returning(
+                self.client.table('documents')
+                .update(changes)
+                .eq('id', str(document_id))
+                .eq('client_id', str(client_id))
+            ))
             
             if not response.data:
                 raise HTTPException(status_code=404, detail="Document not found")
-                
+            
+            self.tenants.record_updated(client_id)
+            await self._index_updated(client_id, response.data[0], updates.get('embedding'))
             return response.data[0]
         except Exception as e:
             self.logger.error(f"Error updating document: {str(e)}")
@@ -224,26 +657,34 @@ class SupabaseService:
     ) -> bool:
         """Delete a document"""
         try:
-            response = self.client.table('documents')\
-                .delete()\
-                .eq('id', str(document_id))\
-                .eq('client_id', str(client_id))\
-                .execute()
+            response = await self._execute(self._returning(
+                self.client.table('documents')
+                .delete()
+                .eq('id', str(document_id))
+                .eq('client_id', str(client_id)),
+                columns='id'
+            ))
             
+            if response.data:
+                self.tenants.record_deleted(client_id, len(response.data))
+                self._index_deleted(client_id, [doc['id'] for doc in response.data])
             return bool(response.data)
         except Exception as e:
             self.logger.error(f"Error deleting document: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
 
     async def create_user(self, user_data: dict):
-        response = self.client.table('users')\
-            .insert(user_data)\
-            .execute()
+        response = await self._execute(
+            self.client.table('users')
+            .insert(user_data)
+        )
         return response.data[0] if response.data else None
 
     async def update_user(self, user_id: str, update_data: dict):
-        response = self.client.table('users')\
-            .update(update_data)\
-            .eq('id', user_id)\
-            .execute()
+        response = await self._execute(
+            self.client.table('users')
+            .update(update_data)
+            .eq('id', user_id)
+        )
+        self.principals.invalidate_user(user_id)
         return response.data[0] if response.data else None
\ No newline at end of file
@@ -0,0 +1,72 @@
+from app.config import get_settings
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional
+from uuid import UUID
+import threading
+import time
+
+settings = get_settings()
+
+@dataclass
+class TenantState:
+    count: Optional[int] = None
+    version: int = 0
+    loaded_at: float = 0.0
+
+class TenantRegistry:
+    """In-process document counts and write versions per client_id
+
+    Counts are loaded from the database at most once per TTL and kept current
+    by the write paths of this process; the TTL bounds staleness from writes
+    made by other workers. Versions increase on every local write so that
+    per-tenant caches can tell when they are out of date.
+    """
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._tenants: Dict[str, TenantState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, client_id: UUID) -> TenantState:
+        return self._tenants.setdefault(str(client_id), TenantState())
+
+    def get_count(self, client_id: UUID) -> Optional[int]:
+        """Return the cached document count, or None if unknown or expired"""
+        with self._lock:
+            state = self._tenants.get(str(client_id))
+            if state is None or state.count is None:
+                return None
+            if time.monotonic() - state.loaded_at > self.ttl:
+                return None
+            return state.count
+
+    def set_count(self, client_id: UUID, count: int) -> None:
+        with self._lock:
+            state = self._state(client_id)
+            state.count = count
+            state.loaded_at = time.monotonic()
+
+    def get_version(self, client_id: UUID) -> int:
+        with self._lock:
+            return self._state(client_id).version
+
+    def record_created(self, client_id: UUID, count: int = 1) -> None:
+        self._record(client_id, count)
+
+    def record_updated(self, client_id: UUID) -> None:
+        self._record(client_id, 0)
+
+    def record_deleted(self, client_id: UUID, count: int = 1) -> None:
+        self._record(client_id, -count)
+
+    def _record(self, client_id: UUID, delta: int) -> None:
+        with self._lock:
+            state = self._state(client_id)
+            state.version += 1
+            if state.count is not None:
+                state.count = max(state.count + delta, 0)
+
+@lru_cache()
+def get_tenant_registry() -> TenantRegistry:
+    return TenantRegistry(ttl=settings.TENANT_REGISTRY_TTL)
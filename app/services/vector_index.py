@@ -0,0 +1,795 @@
+from app.config import get_settings
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID, uuid4
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+import numpy as np
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Storage types of tenant vectors; int8 rows carry a float32 scale each
+QUANTIZATIONS = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+# Rows scored per step, which bounds the float32 temporaries of quantized scoring
+SCORE_BLOCK_ROWS = 16_384
+
+# Unfinished snapshot directories older than this were left by a crashed writer
+SNAPSHOT_TEMP_MAX_AGE = 3600.0
+
+def _generation_time(name: str) -> Optional[int]:
+    """Creation time in nanoseconds encoded in a snapshot generation name"""
+    try:
+        return int(name.split("-")[0])
+    except ValueError:
+        return None
+
+def parse_embedding(value) -> List[float]:
+    """Read an embedding as returned by PostgREST, where pgvector columns arrive as text"""
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+def parse_rows(rows: Iterable[Dict]) -> List[Tuple[Dict, np.ndarray]]:
+    """Split fetched rows into (row, float32 embedding), skipping rows without one
+
+    Decoding the JSON embeddings is the costly part of loading a tenant, so
+    callers run this off the event loop.
+    """
+    parsed = []
+    for row in rows:
+        embedding = row.pop('embedding', None)
+        if embedding is not None:
+            parsed.append((row, np.asarray(parse_embedding(embedding), dtype=np.float32)))
+    return parsed
+
+def _normalize(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def quantize(vectors: np.ndarray, quantization: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Convert float32 rows to the storage type; int8 rows come with a float32 scale each"""
+    if quantization == "float32":
+        return vectors, None
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    peak = np.abs(vectors).max(axis=1)
+    scales = np.where(peak > 0, peak / 127, 1.0).astype(np.float32)
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales
+
+class MappedRows:
+    """Document rows stored as JSON in a memory-mapped file, decoded only when read
+
+    Writes go to an in-memory overlay, so a mapped snapshot behaves like the
+    list of rows it was saved from.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self._data = data
+        self._offsets = offsets
+        self._overlay: Dict[int, Dict] = {}
+        self._size = len(offsets) - 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, position: int) -> Dict:
+        row = self._overlay.get(position)
+        if row is None:
+            start, end = self._offsets[position], self._offsets[position + 1]
+            row = json.loads(self._data[start:end].tobytes())
+        return row
+
+    def __setitem__(self, position: int, row: Dict) -> None:
+        self._overlay[position] = row
+
+    def __iter__(self) -> Iterator[Dict]:
+        return (self[position] for position in range(self._size))
+
+    def append(self, row: Dict) -> None:
+        self._overlay[self._size] = row
+        self._size += 1
+
+    def pop(self) -> None:
+        self._size -= 1
+        self._overlay.pop(self._size, None)
+
+class TenantVectors:
+    """One tenant's document embeddings as a contiguous matrix of unit-normalized rows
+
+    Row i of the matrix belongs to rows[i]. Similarity is the dot product with
+    a normalized query, which is the cosine similarity match_documents uses.
+    Rows are stored as float32, float16 or int8 with a per-row scale. A tenant
+    opened from a snapshot maps its arrays read-only and copies them on the
+    first write; the float32 vectors of the snapshot stay mapped so the top
+    candidates of a quantized search can be rescored at full precision.
+    """
+
+    def __init__(self, dimensions: int, capacity: int = 0, quantization: str = "float32"):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.quantization = quantization
+        capacity = max(capacity, 16)
+        self.matrix = np.empty((capacity, dimensions), dtype=QUANTIZATIONS[quantization])
+        self.scales = np.ones(capacity, dtype=np.float32) if quantization == "int8" else None
+        self.size = 0
+        self.rows = []
+        self._positions: Optional[Dict[str, int]] = {}
+        self._ids: Optional[np.ndarray] = None
+        # Float32 vectors of a mapped snapshot, and of rows written since it was taken
+        self.full: Optional[np.ndarray] = None
+        self.full_overlay: Dict[int, np.ndarray] = {}
+        # Candidates per result rescored at full precision; 0 disables rescoring
+        self.rescore = 0
+        self.dirty = False
+        self.loaded_at = 0.0
+        self.saved_at = 0.0
+        # Wall-clock time of the last load or refresh from the database
+        self.synced_at = 0.0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def dimensions(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def positions(self) -> Dict[str, int]:
+        if self._positions is None:
+            self._positions = {str(doc_id): i for i, doc_id in enumerate(self._ids[:self.size])}
+        return self._positions
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the vectors, whether in process memory or mapped"""
+        total = self.matrix.nbytes + sum(vector.nbytes for vector in self.full_overlay.values())
+        if self.scales is not None:
+            total += self.scales.nbytes
+        return total
+
+    def _writable(self) -> None:
+        """Copy arrays mapped from a snapshot into memory before the first write"""
+        if not self.matrix.flags.writeable:
+            self.matrix = np.array(self.matrix)
+            if self.scales is not None:
+                self.scales = np.array(self.scales)
+
+    def _grow(self) -> None:
+        grown = np.empty((max(len(self.matrix) * 2, 16), self.dimensions), dtype=self.matrix.dtype)
+        grown[:self.size] = self.matrix[:self.size]
+        self.matrix = grown
+        if self.scales is not None:
+            scales = np.ones(len(self.matrix), dtype=np.float32)
+            scales[:self.size] = self.scales[:self.size]
+            self.scales = scales
+
+    def _store(self, position: int, vector: np.ndarray) -> None:
+        stored, scales = quantize(vector[None, :], self.quantization)
+        self.matrix[position] = stored[0]
+        if scales is not None:
+            self.scales[position] = scales[0]
+        if self.full is not None:
+            self.full_overlay[position] = vector
+
+    def _move(self, source: int, target: int) -> None:
+        self.matrix[target] = self.matrix[source]
+        if self.scales is not None:
+            self.scales[target] = self.scales[source]
+        if self.full is not None:
+            self.full_overlay[target] = self.vector(source)
+
+    def _candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Positions worth scoring for a query, or None to score every row"""
+        return None
+
+    def vector(self, position: int) -> np.ndarray:
+        """The float32 vector of a row, at full precision when the snapshot has it"""
+        return self.vectors([position])[0]
+
+    def vectors(self, positions) -> np.ndarray:
+        positions = np.asarray(positions, dtype=np.int64)
+        if self.full is None:
+            vectors = self.matrix[positions].astype(np.float32)
+            if self.scales is not None:
+                vectors *= self.scales[positions][:, None]
+            return vectors
+        vectors = np.empty((len(positions), self.dimensions), dtype=np.float32)
+        mapped = positions < len(self.full)
+        vectors[mapped] = self.full[positions[mapped]]
+        if self.full_overlay:
+            for i, position in enumerate(positions.tolist()):
+                vector = self.full_overlay.get(position)
+                if vector is not None:
+                    vectors[i] = vector
+        return vectors
+
+    def requantize(self, quantization: str) -> None:
+        """Convert the stored rows of an in-memory tenant to another storage type"""
+        self.matrix, self.scales = quantize(self.vectors(np.arange(self.size)), quantization)
+        self.quantization = quantization
+
+    def upsert(self, row: Dict, embedding: List[float]) -> None:
+        doc_id = str(row['id'])
+        position = self.positions.get(doc_id)
+        self._writable()
+        if position is None:
+            if self.size == len(self.matrix):
+                self._grow()
+            position = self.size
+            self.size += 1
+            self.rows.append(row)
+            self.positions[doc_id] = position
+        else:
+            self.rows[position] = row
+        self._store(position, _normalize(embedding))
+        self.dirty = True
+
+    def load_rows(self, rows: Iterable[Dict]) -> None:
+        """Parse and add fetched rows; for tenants being loaded, off the event loop"""
+        for row, embedding in parse_rows(rows):
+            self.upsert(row, embedding)
+
+    def update(self, row: Dict, embedding: Optional[List[float]] = None) -> None:
+        """Replace a document's row, and its vector if a new embedding is given"""
+        position = self.positions.get(str(row['id']))
+        if position is None:
+            return
+        if embedding is not None:
+            self._writable()
+            self._store(position, _normalize(embedding))
+        self.rows[position] = row
+        self.dirty = True
+
+    def remove(self, doc_id: str) -> None:
+        """Drop a document by moving the last row into its slot"""
+        position = self.positions.pop(str(doc_id), None)
+        if position is None:
+            return
+        self._writable()
+        last = self.size - 1
+        if position != last:
+            self._move(last, position)
+            self.rows[position] = self.rows[last]
+            self.positions[str(self.rows[position]['id'])] = position
+        self.rows.pop()
+        self.full_overlay.pop(last, None)
+        self.size -= 1
+        self.dirty = True
+
+    def _score(self, query: np.ndarray, positions: Optional[np.ndarray]) -> np.ndarray:
+        count = self.size if positions is None else len(positions)
+        if self.quantization == "float32":
+            matrix = self.matrix[:self.size] if positions is None else self.matrix[positions]
+            return matrix @ query
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, count)
+            rows = slice(start, end) if positions is None else positions[start:end]
+            scores[start:end] = self.matrix[rows].astype(np.float32) @ query
+            if self.scales is not None:
+                scores[start:end] *= self.scales[rows]
+        return scores
+
+    def search(self, embedding: List[float], limit: int, threshold: float) -> List[Dict]:
+        """Top-limit rows with cosine similarity above threshold, best first"""
+        if not self.size or limit <= 0:
+            return []
+        query = _normalize(embedding)
+        positions = self._candidates(query)
+        scores = self._score(query, positions)
+        rescore = self.rescore and self.full is not None
+        keep = limit * self.rescore if rescore else limit
+        if keep < len(scores):
+            top = np.argpartition(-scores, keep - 1)[:keep]
+        else:
+            top = np.arange(len(scores))
+        ranked = top if positions is None else positions[top]
+        scores = scores[top]
+        if rescore:
+            scores = self.vectors(ranked) @ query
+        order = np.argsort(-scores, kind="stable")[:limit]
+        order = order[scores[order] > threshold]
+        return [
+            {**self.rows[position], 'similarity': float(score)}
+            for position, score in zip(ranked[order], scores[order])
+        ]
+
+    def save(self, directory: str, quantization: Optional[str] = None) -> None:
+        """Write the tenant as a new snapshot generation and make it current
+
+        Vectors are stored with the given quantization, by default the
+        tenant's own. The generation is written to a temporary directory and
+        renamed into place, so workers snapshotting the same tenant never see
+        or delete each other's partial writes. CURRENT only moves forward, and
+        only generations older than the one it names are removed; tenants that
+        still map them keep reading them until they let go.
+        """
+        quantization = quantization or self.quantization
+        generation = f"{time.time_ns()}-{uuid4().hex[:8]}"
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f".tmp-{generation}")
+        os.makedirs(path)
+        full = self.vectors(np.arange(self.size))
+        stored, scales = quantize(full, quantization)
+        np.save(os.path.join(path, "vectors.npy"), stored)
+        if scales is not None:
+            np.save(os.path.join(path, "scales.npy"), scales)
+        # Full-precision vectors for rescoring, unless they were already lost to quantization
+        if quantization != "float32" and (self.full is not None or self.quantization == "float32"):
+            np.save(os.path.join(path, "full.npy"), full)
+        rows = [json.dumps(row, default=str).encode() for row in self.rows]
+        np.save(os.path.join(path, "rows.npy"), np.frombuffer(b"".join(rows), dtype=np.uint8))
+        np.save(os.path.join(path, "offsets.npy"), np.cumsum([0] + [len(row) for row in rows], dtype=np.int64))
+        np.save(os.path.join(path, "ids.npy"), np.array([str(row['id']) for row in self.rows], dtype=str))
+        self._save_index(path)
+        saved_at = time.time()
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({
+                "quantization": quantization,
+                "dimensions": self.dimensions,
+                "size": self.size,
+                "saved_at": saved_at,
+                "synced_at": self.synced_at
+            }, f)
+
+        os.rename(path, os.path.join(directory, generation))
+
+        current = self._current_generation(directory)
+        current_time = _generation_time(current) if current else None
+        if current_time is None or current_time < _generation_time(generation):
+            pointer = os.path.join(directory, f".CURRENT-{generation}")
+            with open(pointer, "w") as f:
+                f.write(generation)
+            os.replace(pointer, os.path.join(directory, "CURRENT"))
+        self._prune_generations(directory)
+        self.dirty = False
+        self.saved_at = saved_at
+
+    def _save_index(self, path: str) -> None:
+        pass
+
+    @staticmethod
+    def _current_generation(directory: str) -> Optional[str]:
+        try:
+            with open(os.path.join(directory, "CURRENT")) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _prune_generations(directory: str) -> None:
+        """Remove generations older than CURRENT and temporary directories of crashed writers"""
+        current = TenantVectors._current_generation(directory)
+        current_time = _generation_time(current) if current else None
+        if current_time is None:
+            return
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith("."):
+                try:
+                    stale = time.time() - os.path.getmtime(path) > SNAPSHOT_TEMP_MAX_AGE
+                except FileNotFoundError:
+                    continue
+                if stale:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        os.remove(path)
+                continue
+            created = _generation_time(name)
+            if created is not None and created < current_time:
+                shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def open(directory: str) -> Optional["TenantVectors"]:
+        """Map the current snapshot generation of a tenant, or return None if there is none
+
+        A generation replaced and pruned by another worker between reading
+        CURRENT and mapping it is retried against the newer one.
+        """
+        for attempt in range(3):
+            generation = TenantVectors._current_generation(directory)
+            if generation is None:
+                return None
+            try:
+                return TenantVectors._open_generation(os.path.join(directory, generation))
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+
+    @staticmethod
+    def _open_generation(path: str) -> "TenantVectors":
+        def load(name: str) -> Optional[np.ndarray]:
+            file = os.path.join(path, f"{name}.npy")
+            return np.load(file, mmap_mode="r") if os.path.exists(file) else None
+
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        centroids = load("centroids")
+        if centroids is not None:
+            vectors = IVFVectors(meta["dimensions"], quantization=meta["quantization"])
+            vectors.centroids = np.array(centroids)
+            vectors.assignments = load("assignments")
+        else:
+            vectors = TenantVectors(meta["dimensions"], quantization=meta["quantization"])
+        vectors.matrix = load("vectors")
+        vectors.scales = load("scales")
+        vectors.full = load("full")
+        vectors.size = meta["size"]
+        vectors.rows = MappedRows(load("rows"), load("offsets"))
+        vectors._ids = load("ids")
+        vectors._positions = None
+        vectors.saved_at = meta["saved_at"]
+        vectors.synced_at = meta.get("synced_at", meta["saved_at"])
+        # Optional arrays read as None if the generation was pruned while loading
+        if not os.path.isdir(path):
+            raise FileNotFoundError(path)
+        return vectors
+
+class IVFVectors(TenantVectors):
+    """Inverted-file index over a tenant's vectors for approximate search
+
+    Vectors are clustered with spherical k-means; a query scores only the rows
+    of its nprobe closest clusters. Writes assign new vectors to their closest
+    centroid, so the index is kept current without retraining. Until train()
+    has run, search is exact.
+    """
+
+    def __init__(
+        self,
+        dimensions: int,
+        capacity: int = 0,
+        nprobe: int = 8,
+        quantization: str = "float32"
+    ):
+        super().__init__(dimensions, capacity, quantization)
+        self.nprobe = nprobe
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.zeros(len(self.matrix), dtype=np.int32)
+
+    @property
+    def nbytes(self) -> int:
+        return super().nbytes + self.assignments.nbytes
+
+    def _writable(self) -> None:
+        super()._writable()
+        if not self.assignments.flags.writeable:
+            self.assignments = np.array(self.assignments)
+
+    def _grow(self) -> None:
+        super()._grow()
+        grown = np.zeros(len(self.matrix), dtype=np.int32)
+        grown[:self.size] = self.assignments[:self.size]
+        self.assignments = grown
+
+    def _store(self, position: int, vector: np.ndarray) -> None:
+        super()._store(position, vector)
+        if self.centroids is not None:
+            self.assignments[position] = int(np.argmax(self.centroids @ vector))
+
+    def _move(self, source: int, target: int) -> None:
+        super()._move(source, target)
+        self.assignments[target] = self.assignments[source]
+
+    def _candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        if self.centroids is None or self.nprobe >= len(self.centroids):
+            return None
+        probed = np.argpartition(-(self.centroids @ query), self.nprobe - 1)[:self.nprobe]
+        mask = np.zeros(len(self.centroids), dtype=bool)
+        mask[probed] = True
+        return np.flatnonzero(mask[self.assignments[:self.size]])
+
+    def _assign(self, block: int = 65_536) -> None:
+        for offset in range(0, self.size, block):
+            end = min(offset + block, self.size)
+            self.assignments[offset:end] = np.argmax(
+                self.vectors(np.arange(offset, end)) @ self.centroids.T, axis=1
+            )
+
+    def train(
+        self,
+        previous: Optional["IVFVectors"] = None,
+        iterations: int = 10,
+        seed: int = 0
+    ) -> None:
+        """Cluster the vectors, reusing the centroids of a previous snapshot when there is one
+
+        With a previous index, rows whose vector is unchanged keep their
+        cluster and only new or changed rows are assigned.
+        """
+        self._writable()
+        if not self.size:
+            return
+        if previous is not None and previous.centroids is not None:
+            self.centroids = previous.centroids
+            reassign = []
+            for position, row in enumerate(self.rows):
+                old = previous.positions.get(str(row['id']))
+                # Quantized snapshots only approximate the vector they were built from
+                if old is not None and np.allclose(previous.vector(old), self.vector(position), atol=1e-2):
+                    self.assignments[position] = previous.assignments[old]
+                else:
+                    reassign.append(position)
+            if reassign:
+                self.assignments[reassign] = np.argmax(self.vectors(reassign) @ self.centroids.T, axis=1)
+            return
+
+        rng = np.random.default_rng(seed)
+        nlist = int(min(max(np.sqrt(self.size), 1), 4096))
+        sample_size = min(self.size, nlist * 40)
+        sample = self.vectors(rng.choice(self.size, sample_size, replace=False))
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty clusters from random sample rows
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = sums / norms
+        self.centroids = centroids.astype(np.float32)
+        self._assign()
+
+    def _save_index(self, path: str) -> None:
+        if self.centroids is not None:
+            np.save(os.path.join(path, "centroids.npy"), self.centroids)
+            np.save(os.path.join(path, "assignments.npy"), self.assignments[:self.size])
+
+def recall_report(
+    vectors: IVFVectors,
+    queries: np.ndarray,
+    limit: int = 10,
+    nprobes: Iterable[int] = (1, 2, 4, 8, 16, 32)
+) -> List[Dict]:
+    """Measure recall@limit and latency of IVF search against exact search for each nprobe"""
+    nprobe = vectors.nprobe
+
+    def run(probe: Optional[int]):
+        vectors.nprobe = probe if probe is not None else len(vectors.centroids)
+        start = time.perf_counter()
+        results = [
+            {row['id'] for row in vectors.search(query, limit, threshold=-1.0)}
+            for query in queries
+        ]
+        return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+    try:
+        exact, exact_ms = run(None)
+        report = []
+        for probe in nprobes:
+            approximate, latency_ms = run(probe)
+            recall = np.mean([len(a & e) / max(len(e), 1) for a, e in zip(approximate, exact)])
+            report.append({
+                "nprobe": probe,
+                "recall": float(recall),
+                "latency_ms": latency_ms,
+                "exact_latency_ms": exact_ms
+            })
+        return report
+    finally:
+        vectors.nprobe = nprobe
+
+class InMemoryVectorIndex:
+    """Per-tenant in-process vector search, an alternative to the match_documents RPC
+
+    Tenants are loaded on first search and kept current by the write paths of
+    this process. After ttl seconds they are refreshed with the documents
+    changed since their last sync, to pick up writes made by other workers. Tenants with at least ivf_min_documents vectors get an
+    IVF index.
+
+    With a snapshot_dir, every loaded tenant is written to disk in its
+    quantized form and searched from memory-mapped files, so workers on one
+    host share its pages and a restarted worker only refreshes it. Resident
+    tenants are kept within memory_budget bytes by evicting the least
+    recently searched ones.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 60.0,
+        max_documents: int = 100_000,
+        dimensions: int = 1536,
+        ivf_min_documents: int = 20_000,
+        nprobe: int = 8,
+        snapshot_dir: str = "",
+        quantization: str = "float32",
+        rescore: int = 0,
+        memory_budget: int = 0
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.ttl = ttl
+        self.max_documents = max_documents
+        self.dimensions = dimensions
+        self.ivf_min_documents = ivf_min_documents
+        self.nprobe = nprobe
+        self.snapshot_dir = snapshot_dir
+        self.quantization = quantization
+        self.rescore = rescore
+        self.memory_budget = memory_budget
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+        self._tenants: "OrderedDict[str, TenantVectors]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.evictions = 0
+
+    def get(self, client_id: UUID) -> Optional[TenantVectors]:
+        """Return the tenant's vectors, or None if not loaded or expired"""
+        key = str(client_id)
+        vectors = self._tenants.get(key)
+        if vectors is None or time.monotonic() - vectors.loaded_at > self.ttl:
+            return None
+        self._tenants.move_to_end(key)
+        return vectors
+
+    def peek(self, client_id: UUID) -> Optional[TenantVectors]:
+        """Return the tenant's resident vectors even if they are due for a refresh"""
+        return self._tenants.get(str(client_id))
+
+    def refreshed(self, vectors: TenantVectors, fresh: bool = True) -> None:
+        """Restart the TTL of a tenant refreshed in place; one that raced with local writes is refreshed again"""
+        vectors.loaded_at = time.monotonic() if fresh else float("-inf")
+
+    def lock(self, client_id: UUID) -> asyncio.Lock:
+        """Serialize loads of one tenant so concurrent searches share a single load"""
+        return self._locks.setdefault(str(client_id), asyncio.Lock())
+
+    def new_vectors(self, count: int) -> TenantVectors:
+        """Empty float32 vectors for a tenant about to be loaded with count documents"""
+        if count >= self.ivf_min_documents:
+            return IVFVectors(self.dimensions, capacity=count, nprobe=self.nprobe)
+        return TenantVectors(self.dimensions, capacity=count)
+
+    def _snapshot_path(self, client_id) -> str:
+        return os.path.join(self.snapshot_dir, str(client_id))
+
+    def _open_snapshot(self, client_id) -> Optional[TenantVectors]:
+        if not self.snapshot_dir:
+            return None
+        try:
+            vectors = TenantVectors.open(self._snapshot_path(client_id))
+        except Exception as e:
+            logger.error(f"Error reading vector snapshot for client_id {client_id}: {str(e)}")
+            return None
+        if vectors is not None and vectors.dimensions != self.dimensions:
+            return None
+        return vectors
+
+    def _configure(self, vectors: TenantVectors) -> None:
+        vectors.rescore = self.rescore
+        if isinstance(vectors, IVFVectors):
+            vectors.nprobe = self.nprobe
+
+    async def restore(self, client_id: UUID) -> Optional[TenantVectors]:
+        """Map the tenant's snapshot; one synced longer than the TTL ago is due for a refresh"""
+        loop = asyncio.get_running_loop()
+        vectors = await loop.run_in_executor(None, self._open_snapshot, client_id)
+        if vectors is None or vectors.quantization != self.quantization:
+            return None
+        age = max(time.time() - vectors.synced_at, 0.0)
+        self._configure(vectors)
+        vectors.loaded_at = time.monotonic() - age
+        await self._admit(client_id, vectors)
+        return vectors
+
+    def _compact(self, client_id, vectors: TenantVectors, previous: Optional[TenantVectors]) -> TenantVectors:
+        """Train, quantize and snapshot a freshly loaded float32 tenant"""
+        if isinstance(vectors, IVFVectors):
+            if not isinstance(previous, IVFVectors):
+                previous = None
+            vectors.train(previous)
+        if self.snapshot_dir:
+            vectors.save(self._snapshot_path(client_id), quantization=self.quantization)
+            return TenantVectors.open(self._snapshot_path(client_id))
+        if self.quantization != "float32":
+            vectors.requantize(self.quantization)
+        return vectors
+
+    async def install(self, client_id: UUID, vectors: TenantVectors, fresh: bool = True) -> TenantVectors:
+        """Store a loaded tenant; a snapshot that raced with local writes is used once, then reloaded
+
+        Training, quantization and snapshotting run off the event loop. IVF
+        tenants reuse the centroids of their previous in-memory or on-disk
+        index. Returns the vectors to search, which are mapped from the
+        snapshot when there is one.
+        """
+        loop = asyncio.get_running_loop()
+        previous = self._tenants.get(str(client_id))
+        if previous is None and isinstance(vectors, IVFVectors):
+            previous = await loop.run_in_executor(None, self._open_snapshot, client_id)
+        vectors = await loop.run_in_executor(None, self._compact, client_id, vectors, previous)
+        self._configure(vectors)
+        vectors.loaded_at = time.monotonic() if fresh else float("-inf")
+        await self._admit(client_id, vectors)
+        return vectors
+
+    async def _admit(self, client_id: UUID, vectors: TenantVectors) -> None:
+        """Make a tenant resident, evicting least recently used tenants over the memory budget"""
+        key = str(client_id)
+        self._tenants[key] = vectors
+        self._tenants.move_to_end(key)
+        if not self.memory_budget:
+            return
+        loop = asyncio.get_running_loop()
+        while self.resident_bytes() > self.memory_budget and len(self._tenants) > 1:
+            evicted_key, evicted = next(iter(self._tenants.items()))
+            if evicted_key == key:
+                break
+            del self._tenants[evicted_key]
+            self.evictions += 1
+            if evicted.dirty and self.snapshot_dir:
+                await loop.run_in_executor(None, self._save, evicted_key, evicted)
+            logger.info(f"Evicted vectors of client_id {evicted_key} ({evicted.nbytes} bytes)")
+
+    def _save(self, client_id, vectors: TenantVectors) -> None:
+        try:
+            vectors.save(self._snapshot_path(client_id))
+        except Exception as e:
+            logger.error(f"Error saving vector snapshot for client_id {client_id}: {str(e)}")
+
+    def resident_bytes(self) -> int:
+        return sum(vectors.nbytes for vectors in self._tenants.values())
+
+    def upsert(self, client_id: UUID, rows: Iterable[Dict], embeddings: Iterable[List[float]]) -> None:
+        vectors = self._tenants.get(str(client_id))
+        if vectors is None:
+            return
+        for row, embedding in zip(rows, embeddings):
+            vectors.upsert(row, embedding)
+
+    def update(self, client_id: UUID, row: Dict, embedding: Optional[List[float]] = None) -> None:
+        vectors = self._tenants.get(str(client_id))
+        if vectors is not None:
+            vectors.update(row, embedding)
+
+    def remove(self, client_id: UUID, doc_ids: Iterable[str]) -> None:
+        vectors = self._tenants.get(str(client_id))
+        if vectors is None:
+            return
+        for doc_id in doc_ids:
+            vectors.remove(doc_id)
+
+    def invalidate(self, client_id: UUID) -> None:
+        self._tenants.pop(str(client_id), None)
+
+    def save_snapshots(self) -> None:
+        """Snapshot tenants written since their last snapshot so a restarted worker can map them"""
+        if not self.snapshot_dir:
+            return
+        for client_id, vectors in list(self._tenants.items()):
+            if vectors.dirty:
+                self._save(client_id, vectors)
+
+    def stats(self) -> Dict:
+        return {
+            "tenants": len(self._tenants),
+            "ivf_tenants": sum(isinstance(v, IVFVectors) for v in self._tenants.values()),
+            "documents": sum(len(vectors) for vectors in self._tenants.values()),
+            "bytes": self.resident_bytes(),
+            "memory_budget": self.memory_budget,
+            "evictions": self.evictions
+        }
+
+@lru_cache()
+def get_vector_index() -> InMemoryVectorIndex:
+    return InMemoryVectorIndex(
+        ttl=settings.VECTOR_INDEX_TTL,
+        max_documents=settings.VECTOR_INDEX_MAX_DOCUMENTS,
+        dimensions=settings.EMBEDDING_DIMENSIONS,
+        ivf_min_documents=settings.VECTOR_INDEX_IVF_MIN_DOCUMENTS,
+        nprobe=settings.VECTOR_INDEX_IVF_NPROBE,
+        snapshot_dir=settings.VECTOR_INDEX_SNAPSHOT_DIR,
+        quantization=settings.VECTOR_INDEX_QUANTIZATION,
+        rescore=settings.VECTOR_INDEX_RESCORE,
+        memory_budget=settings.VECTOR_INDEX_MEMORY_BUDGET
+    )
@@ -0,0 +1,119 @@
+from typing import AsyncIterator, Dict, List, Optional
+from fastapi import UploadFile
+import codecs
+import csv
+
+# Quote states of a record being read, following the csv module's default dialect
+FIELD_START, UNQUOTED, QUOTED, QUOTE_IN_QUOTED = range(4)
+
+def _quote_state(line: str, state: int) -> int:
+    """Advance the quote state over one line
+
+    A quote only opens a quoted field at the start of the field, as in csv,
+    so a stray quote inside an unquoted value (12" pipe) is literal.
+    """
+    if '"' not in line:
+        if state == QUOTED:
+            return QUOTED
+        return FIELD_START if line.endswith("\n") else UNQUOTED
+    for char in line:
+        if state == QUOTED:
+            if char == '"':
+                state = QUOTE_IN_QUOTED
+        elif char == ",":
+            state = FIELD_START
+        elif char == '"' and state in (FIELD_START, QUOTE_IN_QUOTED):
+            # Opens a quoted field, or is the second half of an escaped ""
+            state = QUOTED
+        elif char == "\n":
+            state = FIELD_START
+        else:
+            state = UNQUOTED
+    return state
+
+def count_csv_records(path: str, encoding: str = "utf-8-sig") -> int:
+    """Number of data records in a CSV file, as iter_csv_records would yield them
+
+    Blocking; reads the file a line at a time without parsing fields.
+    """
+    count = 0
+    state = FIELD_START
+    blank = True
+    with open(path, encoding=encoding, newline="\n") as source:
+        for line in source:
+            blank = blank and not line.strip()
+            state = _quote_state(line, state)
+            if state == QUOTED:
+                continue
+            if not blank:
+                count += 1
+            blank = True
+            state = FIELD_START
+    # The first record is the header
+    return max(count - 1, 0)
+
+async def iter_csv_records(
+    file: UploadFile,
+    chunk_size: int = 1 << 20,
+    max_size: Optional[int] = None,
+    encoding: str = "utf-8-sig",
+    max_record_size: int = 1 << 20
+) -> AsyncIterator[Dict[str, str]]:
+    """Parse an uploaded CSV incrementally, yielding one dict per row
+
+    The file is read in fixed-size chunks and only the current partial record is
+    held in memory. Quoted fields may contain newlines: each line advances the
+    record's quote state, and the record is complete at a newline outside a
+    quoted field. Records and lines longer than max_record_size characters are
+    rejected, so a file without newlines is never buffered whole.
+    As with csv.DictReader, fields missing from a short record are None.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    header: Optional[List[str]] = None
+    pending = ""
+    record: List[str] = []
+    record_size = 0
+    state = FIELD_START
+    bytes_read = 0
+
+    async def lines() -> AsyncIterator[str]:
+        nonlocal pending, bytes_read
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            bytes_read += len(chunk)
+            if max_size is not None and bytes_read > max_size:
+                raise ValueError(f"File size exceeds maximum limit of {max_size} bytes")
+            pending += decoder.decode(chunk)
+            *complete, pending = pending.split("\n")
+            if len(pending) > max_record_size:
+                raise ValueError(f"CSV line exceeds {max_record_size} characters")
+            for line in complete:
+                yield line + "\n"
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            yield pending
+
+    async for line in lines():
+        record.append(line)
+        record_size += len(line)
+        state = _quote_state(line, state)
+        if state == QUOTED:
+            # Inside a quoted field that spans lines
+            if record_size > max_record_size:
+                raise ValueError(f"CSV record exceeds {max_record_size} characters; is a quote left open?")
+            continue
+        text = "".join(record)
+        if text.strip():
+            values = next(csv.reader([text]))
+            if header is None:
+                header = [value.strip() for value in values]
+            else:
+                yield dict(zip(header, values + [None] * (len(header) - len(values))))
+        record = []
+        record_size = 0
+        state = FIELD_START
+
+    if record:
+        raise ValueError("CSV ended inside a quoted field")
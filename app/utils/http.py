@@ -0,0 +1,26 @@
+from app.config import get_settings
+from typing import Dict, Union
+import httpx
+
+settings = get_settings()
+
+def get_pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+    )
+
+def pool_stats(client: Union[httpx.Client, httpx.AsyncClient]) -> Dict[str, int]:
+    """Summarize the connections held by an httpx client's connection pool"""
+    # httpx does not expose pool state publicly, so read it from the httpcore pool
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []))
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "max_connections": settings.HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": settings.HTTP_MAX_KEEPALIVE_CONNECTIONS
+    }
@@ -1,9 +1,14 @@
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from typing import Optional, Dict
+from typing import Callable, Dict, Optional
 from jose import JWTError, jwt
 from app.config import get_settings
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+from functools import lru_cache
 from uuid import UUID
+import asyncio
+import threading
 
 settings = get_settings()
 
@@ -16,6 +21,58 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+class PasswordHasher:
+    """Runs bcrypt on a small thread pool so it never blocks the event loop
+
+    bcrypt releases the GIL, so the workers hash in parallel with request
+    handling. Once max_pending operations are queued or running, further
+    calls are rejected with 503 at once rather than queueing behind a
+    login storm.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.max_pending = max_pending or settings.PASSWORD_HASH_MAX_PENDING
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.PASSWORD_HASH_WORKERS,
+            thread_name_prefix="bcrypt"
+        )
+        self._pending = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def _release(self, future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def _run(self, fn: Callable, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many password operations in progress",
+                    headers={"Retry-After": "1"}
+                )
+            self._pending += 1
+        # A hash keeps its slot until the worker finishes, even if the request is cancelled
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"pending": self._pending, "rejected": self._rejected}
+
+@lru_cache()
+def get_password_hasher() -> PasswordHasher:
+    return PasswordHasher()
+
 def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -0,0 +1,12 @@
+from functools import lru_cache
+import tiktoken
+
+DEFAULT_ENCODING = "cl100k_base"
+
+@lru_cache()
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """Return the tiktoken encoding for a model, falling back to cl100k_base"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
@@ -0,0 +1,57 @@
+"""Recall and latency of the IVF vector index against exact search
+
+Usage:
+    python -m benchmarks.ann_recall --documents 200000 --dimensions 1536
+    python -m benchmarks.ann_recall --snapshot .cache/vector_index/<client_id>
+
+Without a snapshot, clustered synthetic vectors are generated.
+"""
+from app.services.vector_index import IVFVectors, TenantVectors, recall_report
+import argparse
+import json
+import time
+import numpy as np
+
+def synthetic_index(documents: int, dimensions: int, seed: int) -> IVFVectors:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(documents // 500, 1), dimensions)).astype(np.float32)
+    vectors = IVFVectors(dimensions, capacity=documents)
+    for start in range(0, documents, 10_000):
+        count = min(10_000, documents - start)
+        block = centers[rng.integers(len(centers), size=count)]
+        block += 0.3 * rng.normal(size=block.shape).astype(np.float32)
+        for offset, embedding in enumerate(block):
+            vectors.upsert({"id": str(start + offset)}, embedding)
+    return vectors
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snapshot", help="Tenant snapshot directory written by the vector index")
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.snapshot:
+        vectors = TenantVectors.open(args.snapshot)
+        if vectors is None:
+            raise SystemExit(f"No snapshot in {args.snapshot}")
+        if not isinstance(vectors, IVFVectors):
+            raise SystemExit("Snapshot has no IVF index; it belongs to a tenant searched exactly")
+    else:
+        vectors = synthetic_index(args.documents, args.dimensions, args.seed)
+        start = time.perf_counter()
+        vectors.train(seed=args.seed)
+        print(f"Trained {len(vectors.centroids)} clusters in {time.perf_counter() - start:.1f}s")
+
+    rng = np.random.default_rng(args.seed + 1)
+    sample = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    queries = vectors.vectors(sample) + 0.1 * rng.normal(size=(len(sample), vectors.matrix.shape[1]))
+    report = recall_report(vectors, queries, limit=args.limit, nprobes=args.nprobe)
+    print(json.dumps({"documents": len(vectors), "limit": args.limit, "report": report}, indent=2))
+
+if __name__ == "__main__":
+    main()
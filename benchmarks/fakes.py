@@ -0,0 +1,268 @@
+"""Local stand-ins for the OpenAI API and Supabase's PostgREST, for benchmarks
+
+Usage:
+    python -m benchmarks.fakes openai --port 8101 --latency 0.05 --jitter 0.01
+    python -m benchmarks.fakes postgrest --port 8102 --latency 0.005
+
+The OpenAI fake serves /v1/embeddings with deterministic hashed
+bag-of-words vectors, so texts sharing words are similar, and
+/v1/chat/completions with or without streaming. The PostgREST fake keeps
+tables in memory and supports the filters, ranges, counts and
+match_documents/match_document_chunks RPCs this service uses.
+"""
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Dict, List, Optional
+from uuid import uuid4
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+import time
+import zlib
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\w+")
+
+def fake_embedding(text: str, dimensions: int = 1536) -> np.ndarray:
+    """Unit-length sum of one seeded random vector per distinct word"""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in set(WORD_PATTERN.findall(text.lower())):
+        vector += np.random.default_rng(zlib.crc32(word.encode())).standard_normal(dimensions, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+async def delay(latency: float, jitter: float) -> None:
+    await asyncio.sleep(max(0.0, random.gauss(latency, jitter)))
+
+def create_openai_app(
+    latency: float = 0.05,
+    jitter: float = 0.01,
+    token_latency: float = 0.002,
+    answer_words: int = 60
+) -> FastAPI:
+    app = FastAPI()
+    answer = " ".join(["Based on the documents, the answer is"] + ["detail"] * answer_words)
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await delay(latency, jitter)
+        dimensions = body.get("dimensions") or 1536
+        data = []
+        for index, text in enumerate(texts):
+            vector = fake_embedding(text, dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(len(text.split()) for text in texts)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body["model"],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt_tokens = sum(len(message["content"].split()) for message in body["messages"])
+        completion_id = f"chatcmpl-{uuid4().hex}"
+        created = int(time.time())
+        await delay(latency, jitter)
+
+        if not body.get("stream"):
+            await asyncio.sleep(token_latency * answer_words)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(answer.split()),
+                    "total_tokens": prompt_tokens + len(answer.split())
+                }
+            }
+
+        async def events():
+            for word in answer.split(" "):
+                await asyncio.sleep(token_latency)
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+class Table:
+    def __init__(self):
+        self.rows: List[Dict] = []
+
+def _matches(row: Dict, filters: List) -> bool:
+    for column, operator, value in filters:
+        actual = row.get(column)
+        actual = None if actual is None else str(actual)
+        if operator == "eq" and actual != value:
+            return False
+        if operator == "in" and actual not in value:
+            return False
+    return True
+
+def _parse_filters(params) -> List:
+    filters = []
+    for column, raw in params.multi_items():
+        if column in ("select", "order", "limit", "offset", "on_conflict"):
+            continue
+        operator, _, value = raw.partition(".")
+        if operator == "in":
+            value = {item.strip('"') for item in value.strip("()").split(",") if item}
+        filters.append((column, operator, value))
+    return filters
+
+def _project(row: Dict, select: Optional[str]) -> Dict:
+    if not select or select == "*":
+        columns = row.keys()
+    else:
+        columns = [column.strip() for column in select.split(",")]
+    projected = {column: row.get(column) for column in columns}
+    # pgvector columns come back from PostgREST as text
+    if projected.get("embedding") is not None:
+        projected["embedding"] = json.dumps(projected["embedding"])
+    return projected
+
+def create_postgrest_app(latency: float = 0.005, jitter: float = 0.001) -> FastAPI:
+    app = FastAPI()
+    tables: Dict[str, Table] = {}
+
+    def table(name: str) -> Table:
+        return tables.setdefault(name, Table())
+
+    def select_rows(name: str, request: Request) -> List[Dict]:
+        rows = [row for row in table(name).rows if _matches(row, _parse_filters(request.query_params))]
+        order = request.query_params.get("order")
+        if order:
+            column, _, direction = order.partition(".")
+            rows.sort(key=lambda row: str(row.get(column) or ""), reverse=direction.startswith("desc"))
+        return rows
+
+    def respond(request: Request, rows: List[Dict], total: Optional[int] = None, status: int = 200) -> Response:
+        prefer = request.headers.get("prefer", "")
+        headers = {}
+        if "count=" in prefer:
+            total = len(rows) if total is None else total
+            headers["Content-Range"] = f"0-{max(len(rows) - 1, 0)}/{total}"
+        if "return=minimal" in prefer or request.method == "HEAD":
+            return Response(status_code=status, headers=headers)
+        select = request.query_params.get("select")
+        return JSONResponse([_project(row, select) for row in rows], status_code=status, headers=headers)
+
+    @app.get("/rest/v1/{name}")
+    @app.head("/rest/v1/{name}")
+    async def read(name: str, request: Request):
+        await delay(latency, jitter)
+        rows = select_rows(name, request)
+        total = len(rows)
+        start, end = 0, len(rows)
+        if "range" in request.headers:
+            first, _, last = request.headers["range"].partition("-")
+            start, end = int(first), int(last) + 1
+        if "offset" in request.query_params:
+            start = int(request.query_params["offset"])
+        if "limit" in request.query_params:
+            end = min(end, start + int(request.query_params["limit"]))
+        return respond(request, rows[start:end], total)
+
+    @app.post("/rest/v1/{name}")
+    async def insert(name: str, request: Request):
+        await delay(latency, jitter)
+        body = await request.json()
+        now = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+        created = [
+            {"id": str(uuid4()), "created_at": now, "updated_at": now, **row}
+            for row in (body if isinstance(body, list) else [body])
+        ]
+        table(name).rows.extend(created)
+        return respond(request, created, status=201)
+
+    @app.patch("/rest/v1/{name}")
+    async def update(name: str, request: Request):
+        await delay(latency, jitter)
+        changes = await request.json()
+        rows = select_rows(name, request)
+        for row in rows:
+            row.update(changes)
+        return respond(request, rows)
+
+    @app.delete("/rest/v1/{name}")
+    async def delete(name: str, request: Request):
+        await delay(latency, jitter)
+        rows = select_rows(name, request)
+        removed = {id(row) for row in rows}
+        table(name).rows = [row for row in table(name).rows if id(row) not in removed]
+        return respond(request, rows)
+
+    @app.post("/rest/v1/rpc/{function}")
+    async def rpc(function: str, request: Request):
+        await delay(latency, jitter)
+        params = await request.json()
+        name = {"match_documents": "documents", "match_document_chunks": "document_chunks"}.get(function)
+        if name is None:
+            return JSONResponse({"message": f"Unknown function {function}"}, status_code=404)
+        rows = [row for row in table(name).rows if row.get("client_id") == params["client_id"]]
+        if not rows:
+            return []
+        matrix = np.asarray([row["embedding"] for row in rows], dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        query = np.asarray(params["query_embedding"], dtype=np.float32)
+        scores = matrix @ (query / max(np.linalg.norm(query), 1e-12))
+        order = [i for i in np.argsort(-scores) if scores[i] > params["match_threshold"]]
+        return [
+            {**{k: v for k, v in rows[i].items() if k != "embedding"}, "similarity": float(scores[i])}
+            for i in order[:params["match_count"]]
+        ]
+
+    return app
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("service", choices=["openai", "postgrest"])
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--latency", type=float, default=None, help="Mean seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=None, help="Standard deviation of the added latency")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="Seconds per generated word")
+    args = parser.parse_args()
+
+    import uvicorn
+    if args.service == "openai":
+        app = create_openai_app(
+            latency=0.05 if args.latency is None else args.latency,
+            jitter=0.01 if args.jitter is None else args.jitter,
+            token_latency=args.token_latency
+        )
+    else:
+        app = create_postgrest_app(
+            latency=0.005 if args.latency is None else args.latency,
+            jitter=0.001 if args.jitter is None else args.jitter
+        )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
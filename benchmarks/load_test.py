@@ -0,0 +1,259 @@
+"""Load test of the API against local OpenAI and PostgREST stand-ins
+
+Usage:
+    python -m benchmarks.load_test --concurrency 16 --duration 20 --output results.json
+    python -m benchmarks.load_test --scenarios search --openai-latency 0.2
+
+Starts benchmarks.fakes servers and the app under uvicorn as subprocesses,
+seeds a user and --documents documents, then drives each scenario for
+--duration seconds at --concurrency. Per scenario it reports throughput,
+latency percentiles and, from /metrics, the mean time spent per stage.
+Results are JSON, keyed so runs from different commits can be diffed.
+"""
+from benchmarks.fakes import fake_embedding
+from passlib.hash import bcrypt
+from typing import Dict, List, Tuple
+from uuid import uuid4
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import httpx
+import numpy as np
+
+# Dummy credentials; supabase-py only checks that the key looks like a JWT
+SERVICE_KEY = "bench.bench.bench"
+STAGE_PATTERN = re.compile(r'^rag_stage_duration_seconds_(sum|count)\{([^}]*)\} (\S+)$')
+LABEL_PATTERN = re.compile(r'(\w+)="([^"]*)"')
+WORDS = (
+    "invoice refund shipping account password billing export report api token "
+    "warehouse order delivery tracking subscription plan upgrade support ticket"
+).split()
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start(args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], env=env, stdout=subprocess.DEVNULL)
+
+async def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not start")
+                await asyncio.sleep(0.2)
+
+def sentence(rng: np.random.Generator, words: int) -> str:
+    return " ".join(rng.choice(WORDS, size=words))
+
+async def seed(postgrest: str, documents: int, rng: np.random.Generator) -> Dict:
+    client_id = str(uuid4())
+    email = "bench@example.com"
+    password = "bench-password"
+    headers = {"apikey": SERVICE_KEY, "Prefer": "return=minimal"}
+    async with httpx.AsyncClient(base_url=f"{postgrest}/rest/v1", headers=headers) as client:
+        await client.post("/users", json={
+            "email": email,
+            # Low cost so logins do not dominate setup
+            "password_hash": bcrypt.using(rounds=4).hash(password),
+            "client_id": client_id
+        })
+        for start in range(0, documents, 500):
+            rows = []
+            for i in range(start, min(start + 500, documents)):
+                content = sentence(rng, 40)
+                rows.append({
+                    "title": f"Document {i}",
+                    "content": content,
+                    "client_id": client_id,
+                    "metadata": {},
+                    "embedding": fake_embedding(content).tolist()
+                })
+            await client.post("/documents", json=rows)
+    return {"client_id": client_id, "email": email, "password": password}
+
+def csv_upload(rng: np.random.Generator, rows: int) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["title", "content"])
+    for i in range(rows):
+        writer.writerow([f"Upload {i}", sentence(rng, 40)])
+    return out.getvalue().encode()
+
+def make_request(scenario: str, rng: np.random.Generator, batch: int) -> Tuple[str, Dict]:
+    if scenario == "search":
+        return "/search/query", {"json": {"query": sentence(rng, 6)}}
+    if scenario == "documents":
+        return "/documents/", {"json": {"title": "Bench", "content": sentence(rng, 40)}}
+    if scenario == "upload_json":
+        return "/upload/json", {"json": [
+            {"title": f"Upload {i}", "content": sentence(rng, 40)} for i in range(batch)
+        ]}
+    if scenario == "upload_csv":
+        return "/upload/csv", {"files": {"file": ("bench.csv", csv_upload(rng, batch), "text/csv")}}
+    raise ValueError(f"Unknown scenario {scenario}")
+
+def stage_totals(metrics: str) -> Dict[Tuple[str, str], List[float]]:
+    totals: Dict[Tuple[str, str], List[float]] = {}
+    for line in metrics.splitlines():
+        match = STAGE_PATTERN.match(line)
+        if not match:
+            continue
+        labels = dict(LABEL_PATTERN.findall(match.group(2)))
+        entry = totals.setdefault((labels.get("route", ""), labels["stage"]), [0.0, 0.0])
+        entry[0 if match.group(1) == "sum" else 1] += float(match.group(3))
+    return totals
+
+def stage_breakdown(before: Dict, after: Dict) -> Dict[str, Dict]:
+    breakdown = {}
+    for (route, stage), (total, count) in sorted(after.items()):
+        previous_total, previous_count = before.get((route, stage), [0.0, 0.0])
+        calls = count - previous_count
+        if calls:
+            breakdown[f"{route or 'background'} {stage}"] = {
+                "calls": int(calls),
+                "mean_ms": round((total - previous_total) / calls * 1000, 2)
+            }
+    return breakdown
+
+async def run_scenario(client: httpx.AsyncClient, scenario: str, args, seed_value: int) -> Dict:
+    rng = np.random.default_rng(seed_value)
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    deadline = time.monotonic() + args.duration
+
+    async def worker() -> None:
+        while time.monotonic() < deadline:
+            path, kwargs = make_request(scenario, rng, args.batch)
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, **kwargs)
+                if response.status_code >= 400:
+                    errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+                    continue
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    before = stage_totals((await client.get("/metrics")).text)
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - started
+    after = stage_totals((await client.get("/metrics")).text)
+
+    values = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": {
+            "mean": round(float(values.mean()), 2) if len(values) else None,
+            **{
+                f"p{q}": round(float(np.percentile(values, q)), 2) if len(values) else None
+                for q in (50, 95, 99)
+            }
+        },
+        "stages": stage_breakdown(before, after)
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+async def run(args) -> Dict:
+    ports = {name: free_port() for name in ("openai", "postgrest", "app")}
+    openai_url = f"http://127.0.0.1:{ports['openai']}"
+    postgrest_url = f"http://127.0.0.1:{ports['postgrest']}"
+    app_url = f"http://127.0.0.1:{ports['app']}"
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "SUPABASE_URL": postgrest_url,
+        "SUPABASE_KEY": SERVICE_KEY,
+        "SUPABASE_SERVICE_KEY": SERVICE_KEY,
+        "JWT_SECRET": os.environ.get("JWT_SECRET", "bench-secret"),
+        "EMBEDDING_CACHE_ENABLED": "false",
+        "QUERY_LOG_SPILL_PATH": "",
+        "LOG_LEVEL": "WARNING"
+    }
+    processes = [
+        start(["-m", "benchmarks.fakes", "openai", "--port", str(ports["openai"]),
+               "--latency", str(args.openai_latency), "--jitter", str(args.openai_jitter)], env),
+        start(["-m", "benchmarks.fakes", "postgrest", "--port", str(ports["postgrest"]),
+               "--latency", str(args.db_latency), "--jitter", str(args.db_jitter)], env),
+    ]
+    try:
+        await wait_until_up(f"{openai_url}/docs")
+        await wait_until_up(f"{postgrest_url}/docs")
+        user = await seed(postgrest_url, args.documents, np.random.default_rng(args.seed))
+        processes.append(start(["-m", "uvicorn", "app.main:app", "--port", str(ports["app"]),
+                                "--log-level", "warning"], env))
+        await wait_until_up(f"{app_url}/health")
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=120) as client:
+            login = await client.post("/auth/login", data={"username": user["email"], "password": user["password"]})
+            login.raise_for_status()
+            client.headers["Authorization"] = f"Bearer {login.json()['access_token']}"
+            scenarios = {}
+            for index, scenario in enumerate(args.scenarios):
+                scenarios[scenario] = await run_scenario(client, scenario, args, args.seed + index + 1)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    return {
+        "commit": git_commit(),
+        "config": {
+            key: getattr(args, key)
+            for key in ("concurrency", "duration", "documents", "batch", "openai_latency",
+                        "openai_jitter", "db_latency", "db_jitter", "seed")
+        },
+        "scenarios": scenarios
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=["search", "documents", "upload_json", "upload_csv"],
+                        choices=["search", "documents", "upload_json", "upload_csv"])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--documents", type=int, default=2000, help="Documents seeded for the tenant")
+    parser.add_argument("--batch", type=int, default=50, help="Documents per upload request")
+    parser.add_argument("--openai-latency", type=float, default=0.05)
+    parser.add_argument("--openai-jitter", type=float, default=0.01)
+    parser.add_argument("--db-latency", type=float, default=0.005)
+    parser.add_argument("--db-jitter", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as out:
+            out.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
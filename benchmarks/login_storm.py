@@ -0,0 +1,83 @@
+"""Search latency while a storm of logins verifies bcrypt hashes
+
+Usage:
+    python -m benchmarks.login_storm --logins 40 --duration 5
+
+Simulated searches (an awaited round-trip plus a little scoring) run
+alongside concurrent logins. Logins verify passwords either inline on the
+event loop, as the auth routes used to, or on the PasswordHasher pool.
+Search p50/p99 are reported for each mode and for a run with no logins.
+"""
+from app.utils.security import PasswordHasher, pwd_context, verify_password
+from fastapi import HTTPException
+from typing import Dict, List
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+
+def percentile(values: List[float], q: float) -> float:
+    return round(float(np.percentile(values, q)) * 1000, 2) if values else 0.0
+
+async def search_loop(stop: asyncio.Event, latencies: List[float], matrix: np.ndarray) -> None:
+    query = matrix[0]
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.002)
+        np.argpartition(-(matrix @ query), 10)[:10]
+        latencies.append(time.perf_counter() - start)
+
+async def login_loop(stop: asyncio.Event, mode: str, hashed: str, hasher: PasswordHasher, counts: Dict) -> None:
+    while not stop.is_set():
+        try:
+            if mode == "inline":
+                verify_password("password", hashed)
+            else:
+                await hasher.verify("password", hashed)
+            counts["logins"] += 1
+        except HTTPException:
+            counts["rejected"] += 1
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0)
+
+async def run(mode: str, args, hashed: str) -> Dict:
+    matrix = np.random.default_rng(0).normal(size=(5_000, 64)).astype(np.float32)
+    hasher = PasswordHasher(max_workers=args.workers, max_pending=args.max_pending)
+    stop = asyncio.Event()
+    latencies: List[float] = []
+    counts = {"logins": 0, "rejected": 0}
+    tasks = [asyncio.create_task(search_loop(stop, latencies, matrix)) for _ in range(args.searches)]
+    if mode != "baseline":
+        tasks += [
+            asyncio.create_task(login_loop(stop, mode, hashed, hasher, counts))
+            for _ in range(args.logins)
+        ]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return {
+        "mode": mode,
+        "searches": len(latencies),
+        "search_p50_ms": percentile(latencies, 50),
+        "search_p99_ms": percentile(latencies, 99),
+        "logins_per_second": round(counts["logins"] / args.duration, 1),
+        "rejected": counts["rejected"]
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40, help="Concurrent clients logging in")
+    parser.add_argument("--searches", type=int, default=20, help="Concurrent clients searching")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor of the stored hash")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=16)
+    args = parser.parse_args()
+
+    hashed = pwd_context.handler("bcrypt").using(rounds=args.rounds).hash("password")
+    report = [asyncio.run(run(mode, args, hashed)) for mode in ("baseline", "inline", "pool")]
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
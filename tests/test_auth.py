@@ -0,0 +1,122 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+from uuid import uuid4
+import pytest
+from fastapi import HTTPException
+from app.api.dependencies.auth import get_current_user, get_token_principal
+from app.api.routes.auth import change_password
+from app.services.principal_cache import PrincipalCache
+from app.services.supabase import SupabaseService
+from app.services.tenant_registry import TenantRegistry
+from app.utils.security import PasswordHasher, create_access_token
+
+class UsersQuery:
+    """Builder over a single users row that counts round-trips"""
+    def __init__(self, client):
+        self.client = client
+        self.one = False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def single(self):
+        self.one = True
+        return self
+
+    def execute(self):
+        self.client.calls += 1
+        row = dict(self.client.user)
+        return SimpleNamespace(data=row if self.one else [row])
+
+class UsersClient:
+    def __init__(self, user):
+        self.user = user
+        self.calls = 0
+
+    def table(self, name):
+        return UsersQuery(self)
+
+def make_service(user):
+    return SupabaseService(
+        client=UsersClient(user),
+        tenants=TenantRegistry(),
+        principals=PrincipalCache(ttl=60)
+    )
+
+def test_principal_is_cached_until_the_user_is_updated():
+    user = {"id": str(uuid4()), "email": "a@example.com", "client_id": str(uuid4()), "password_hash": "old"}
+    service = make_service(user)
+    token = create_access_token({"sub": user["email"], "client_id": user["client_id"]})
+
+    async def run():
+        first = await get_current_user(token=token, supabase=service)
+        second = await get_current_user(token=token, supabase=service)
+        service.client.user = {**user, "email": "moved@example.com"}
+        await service.update_user(user["id"], {"email": "moved@example.com"})
+        third = await get_current_user(token=token, supabase=service)
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+
+    assert first == second == {"id": user["id"], "email": user["email"], "client_id": user["client_id"]}
+    assert third["email"] == "moved@example.com"
+    # Two lookups and the update
+    assert service.client.calls == 3
+
+def test_change_password_checks_a_fresh_row_not_the_cached_principal():
+    hasher = PasswordHasher(max_workers=1)
+    user = {"id": str(uuid4()), "email": "c@example.com", "client_id": str(uuid4())}
+    service = make_service(user)
+    token = create_access_token({"sub": user["email"], "client_id": user["client_id"]})
+
+    async def run():
+        service.client.user = {**user, "password_hash": await hasher.hash("old")}
+        current_user = await get_current_user(token=token, supabase=service)
+        assert "password_hash" not in service.principals.get(user["email"])
+        with patch("app.api.routes.auth.get_password_hasher", return_value=hasher):
+            changed = await change_password("old", "new", current_user=current_user, supabase=service)
+            # The fake client does not apply updates; store the new hash as the database would
+            service.client.user["password_hash"] = await hasher.hash("new")
+            with pytest.raises(HTTPException) as rejected:
+                await change_password("old", "newer", current_user=current_user, supabase=service)
+        return changed, rejected.value
+
+    changed, rejected = asyncio.run(run())
+
+    assert changed == {"message": "Password updated successfully"}
+    assert rejected.status_code == 400
+
+def test_read_only_principal_can_trust_signed_claims(monkeypatch):
+    user = {"id": str(uuid4()), "email": "b@example.com", "client_id": str(uuid4())}
+    service = make_service(user)
+    claims = {"sub": user["email"], "client_id": user["client_id"], "user_id": user["id"]}
+
+    monkeypatch.setattr("app.api.dependencies.auth.settings.AUTH_TRUST_TOKEN_CLAIMS", True)
+    principal = asyncio.run(get_token_principal(token=create_access_token(claims), supabase=service))
+    assert principal == {"id": user["id"], "email": user["email"], "client_id": user["client_id"]}
+    assert service.client.calls == 0
+
+    # Tokens issued before the user_id claim are looked up
+    legacy = create_access_token({"sub": user["email"], "client_id": user["client_id"]})
+    assert asyncio.run(get_token_principal(token=legacy, supabase=service))["id"] == user["id"]
+    assert service.client.calls == 1
+
+def test_password_hasher_rejects_when_saturated():
+    hasher = PasswordHasher(max_workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def run():
+        busy = asyncio.ensure_future(hasher._run(release.wait))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as rejected:
+            await hasher.verify("password", "hash")
+        release.set()
+        await busy
+        return rejected.value
+
+    rejected = asyncio.run(run())
+
+    assert rejected.status_code == 503
+    assert hasher.stats() == {"pending": 0, "rejected": 1}
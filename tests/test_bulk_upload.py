@@ -0,0 +1,178 @@
+import asyncio
+import io
+from uuid import uuid4
+import pytest
+import httpx
+from fastapi import UploadFile
+from openai import BadRequestError
+from app.services.bulk_upload import BulkUploadService
+from app.utils.csv_stream import iter_csv_records
+
+CSV = (
+    'title,content,metadata\n'
+    'First,"Plain content",\n'
+    'Second,"Content with a\nline break and ""quotes""","{""source"": ""crm""}"\n'
+    'Third,Bad row,not-json\n'
+).encode("utf-8")
+
+class FakeEmbeddingService:
+    max_input_tokens = 5
+
+    def __init__(self, fail_on=None, error=None):
+        self.fail_on = fail_on
+        self.error = error
+        self.calls = []
+        self.token_counts = []
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+    async def create_embeddings(self, texts, token_counts=None):
+        self.calls.append(texts)
+        self.token_counts.append(token_counts)
+        return [await self.create_embedding(text) for text in texts]
+
+    async def create_embedding(self, text):
+        if self.error is not None:
+            raise self.error
+        if text == self.fail_on:
+            request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+            raise BadRequestError("embedding failed", response=httpx.Response(400, request=request), body=None)
+        return [0.1] * 3
+
+class FakeSupabaseService:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.inserted = []
+
+    async def create_documents(self, documents, chunks=None):
+        if any(doc["title"] == self.fail_on for doc in documents):
+            raise ValueError("insert failed")
+        self.inserted.extend(documents)
+        return documents
+
+class FakeRAGService:
+    def __init__(self, supabase, embedding_service=None):
+        self.embedding_service = embedding_service or FakeEmbeddingService()
+        self.supabase = supabase
+        self.chunker = None
+
+async def collect(records):
+    return [record async for record in records]
+
+def make_upload(data):
+    return UploadFile(file=io.BytesIO(data), filename="documents.csv")
+
+def test_iter_csv_records_handles_records_split_across_chunks():
+    rows = asyncio.run(collect(iter_csv_records(make_upload(CSV), chunk_size=7)))
+
+    assert [row["title"] for row in rows] == ["First", "Second", "Third"]
+    assert rows[1]["content"] == 'Content with a\nline break and "quotes"'
+    assert rows[1]["metadata"] == '{"source": "crm"}'
+
+def test_iter_csv_records_treats_stray_quotes_in_unquoted_fields_as_text():
+    data = 'title,content\nPipe,foo 12" pipe\nNext,"quoted, with comma"\nLast,plain\n'.encode()
+
+    rows = asyncio.run(collect(iter_csv_records(make_upload(data), chunk_size=5)))
+
+    assert [row["content"] for row in rows] == ['foo 12" pipe', "quoted, with comma", "plain"]
+
+def test_iter_csv_records_rejects_unterminated_quotes_early():
+    data = ('title,content\nOpen,"never closed\n' + "more text\n" * 1000).encode()
+
+    with pytest.raises(ValueError, match="exceeds 100 characters"):
+        asyncio.run(collect(iter_csv_records(make_upload(data), max_record_size=100)))
+
+def test_iter_csv_records_rejects_long_lines_without_buffering_them():
+    data = b"title,content\n" + b"x" * (1 << 20)
+    upload = make_upload(data)
+
+    with pytest.raises(ValueError, match="line exceeds 4096 characters"):
+        asyncio.run(collect(iter_csv_records(upload, chunk_size=1024, max_record_size=4096)))
+    assert upload.file.tell() < 8192
+
+def test_iter_csv_records_enforces_max_size():
+    with pytest.raises(ValueError):
+        asyncio.run(collect(iter_csv_records(make_upload(CSV), chunk_size=16, max_size=32)))
+
+def test_process_csv_stream_isolates_failed_rows():
+    supabase = FakeSupabaseService(fail_on="Second")
+    service = BulkUploadService(rag_service=FakeRAGService(supabase))
+    service.pipeline.batch_size = 2
+
+    result = asyncio.run(service.process_csv_stream(make_upload(CSV), client_id=uuid4()))
+
+    assert result["total_documents"] == 3
+    assert result["processed_documents"] == 2
+    assert result["failed_documents"] == 1
+    assert result["errors"][0].startswith("Error processing row 1")
+    inserted = {doc["title"]: doc for doc in supabase.inserted}
+    assert sorted(inserted) == ["First", "Third"]
+    assert inserted["Third"]["metadata"] == {"raw": "not-json"}
+
+def test_process_csv_stream_records_short_rows_as_failed():
+    supabase = FakeSupabaseService()
+    service = BulkUploadService(rag_service=FakeRAGService(supabase))
+    service.pipeline.batch_size = 2
+    data = b"title,content\nFirst,one\nShort\nThird,three\n"
+
+    result = asyncio.run(service.process_csv_stream(make_upload(data), client_id=uuid4()))
+
+    assert result["total_documents"] == 3
+    assert result["processed_documents"] == 2
+    assert result["errors"] == ["Error processing row 1: Missing column(s): content"]
+    assert sorted(doc["title"] for doc in supabase.inserted) == ["First", "Third"]
+
+def test_process_json_pipelines_batches_and_isolates_embedding_failures():
+    supabase = FakeSupabaseService()
+    embedding_service = FakeEmbeddingService(fail_on="content 4")
+    service = BulkUploadService(rag_service=FakeRAGService(supabase, embedding_service))
+    service.pipeline.batch_size = 3
+    service.pipeline.queue_size = 1
+    documents = [{"title": f"doc {i}", "content": f"content {i}"} for i in range(10)]
+
+    result = asyncio.run(service.process_json(documents, client_id=uuid4()))
+
+    assert result == {
+        "status": "completed",
+        "total_documents": 10,
+        "processed_documents": 9,
+        "failed_documents": 1,
+        "errors": ["Error processing row 4: embedding failed"]
+    }
+    assert sorted(doc["title"] for doc in supabase.inserted) == sorted(
+        f"doc {i}" for i in range(10) if i != 4
+    )
+
+def test_pipeline_fails_oversized_rows_without_retrying_the_batch():
+    supabase = FakeSupabaseService()
+    embedding_service = FakeEmbeddingService()
+    service = BulkUploadService(rag_service=FakeRAGService(supabase, embedding_service))
+    service.pipeline.batch_size = 3
+    documents = [
+        {"title": "short", "content": "a b"},
+        {"title": "long", "content": "a b c d e f"},
+        {"title": "also short", "content": "c"}
+    ]
+
+    result = asyncio.run(service.process_json(documents, client_id=uuid4()))
+
+    assert result["processed_documents"] == 2
+    assert result["errors"] == ["Error processing row 1: Content has 6 tokens, exceeding the limit of 5"]
+    assert embedding_service.calls == [["a b", "c"]]
+    # Counted once by the pipeline and handed to the embedding service
+    assert embedding_service.token_counts == [[2, 1]]
+
+def test_pipeline_fails_batch_on_errors_not_caused_by_an_input():
+    supabase = FakeSupabaseService()
+    embedding_service = FakeEmbeddingService(error=ConnectionError("connection reset"))
+    service = BulkUploadService(rag_service=FakeRAGService(supabase, embedding_service))
+    service.pipeline.batch_size = 2
+    documents = [{"title": f"doc {i}", "content": f"content {i}"} for i in range(2)]
+
+    result = asyncio.run(service.process_json(documents, client_id=uuid4()))
+
+    assert result["failed_documents"] == 2
+    assert result["errors"] == [f"Error processing row {i}: connection reset" for i in range(2)]
+    assert len(embedding_service.calls) == 1
+    assert supabase.inserted == []
@@ -0,0 +1,44 @@
+from app.services.context_builder import ContextBuilder
+
+class WordEncoding:
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+def make_builder(**kwargs):
+    builder = ContextBuilder(**kwargs)
+    builder._encoding = WordEncoding()
+    return builder
+
+FILLER = " ".join(f"Filler sentence number {i} about nothing." for i in range(20))
+
+def test_small_context_is_kept_whole_without_duplicates():
+    builder = make_builder(max_tokens=1000)
+    documents = [
+        {"id": "1", "title": "A", "content": "Reset the router.", "similarity": 0.9},
+        {"id": "2", "title": "A copy", "content": "reset  the Router.", "similarity": 0.8},
+        {"id": "3", "title": "B", "content": "Invoices are monthly.", "similarity": 0.7}
+    ]
+
+    built = builder.build("how to reset", documents)
+
+    assert [doc["id"] for doc in built.documents] == ["1", "3"]
+    assert built.documents[0]["content"] == "Reset the router."
+    assert built.dropped == 1
+
+def test_large_document_is_trimmed_to_relevant_passages_within_budget():
+    builder = make_builder(max_tokens=60, passage_tokens=12, min_document_tokens=6)
+    long_doc = f"{FILLER} Error ERR-4012 means the router must be reset. {FILLER}"
+    documents = [
+        {"id": "1", "title": "Manual", "content": long_doc, "similarity": 0.9},
+        {"id": "2", "title": "Short", "content": "Routers blink when reset.", "similarity": 0.5}
+    ]
+
+    built = builder.build("What does ERR-4012 mean?", documents)
+
+    assert built.tokens <= 60
+    assert "ERR-4012 means the router must be reset." in built.documents[0]["content"]
+    assert built.documents[1]["content"] == "Routers blink when reset."
+    assert len(built.documents[0]["content"].split()) > len(built.documents[1]["content"].split())
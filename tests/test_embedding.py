@@ -0,0 +1,167 @@
+import asyncio
+from types import SimpleNamespace
+import httpx
+import pytest
+from openai import BadRequestError
+from app.services.embedding import EmbeddingService
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embedding_providers import HashingEmbeddingProvider, OpenAIEmbeddingProvider
+
+class FakeEncoding:
+    """One token per whitespace-separated word"""
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+class FakeEmbeddings:
+    def __init__(self, max_inputs=None):
+        self.calls = []
+        self.max_inputs = max_inputs
+
+    async def create(self, model, input):
+        self.calls.append(list(input))
+        if self.max_inputs and len(input) > self.max_inputs:
+            request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+            raise BadRequestError(
+                "batch too large",
+                response=httpx.Response(400, request=request),
+                body=None
+            )
+        # Return items out of order to check that the service re-sorts them
+        data = [
+            SimpleNamespace(index=i, embedding=[float(len(text))])
+            for i, text in enumerate(input)
+        ]
+        return SimpleNamespace(data=list(reversed(data)))
+
+@pytest.fixture
+def embedding_service():
+    provider = OpenAIEmbeddingProvider(client=SimpleNamespace(embeddings=FakeEmbeddings()))
+    provider._encoding = FakeEncoding()
+    return EmbeddingService(cache=EmbeddingCache(max_entries=100), provider=provider)
+
+def test_create_embeddings_batches_by_item_and_token_limits(embedding_service):
+    embedding_service.max_batch_items = 3
+    embedding_service.max_batch_tokens = 4
+    texts = ["a", "b b", "c", "d", "e e e", "f"]
+
+    embeddings = asyncio.run(embedding_service.create_embeddings(texts))
+
+    assert embeddings == [[float(len(text))] for text in texts]
+    assert embedding_service.provider.client.embeddings.calls == [
+        ["a", "b b", "c"],
+        ["d", "e e e"],
+        ["f"],
+    ]
+
+def test_create_embeddings_splits_rejected_batches(embedding_service):
+    embedding_service.provider.client.embeddings.max_inputs = 2
+    texts = ["one", "two", "three", "four", "five"]
+
+    embeddings = asyncio.run(embedding_service.create_embeddings(texts))
+
+    assert embeddings == [[float(len(text))] for text in texts]
+
+def test_create_embeddings_rejects_oversized_input(embedding_service):
+    embedding_service.max_input_tokens = 2
+
+    with pytest.raises(ValueError):
+        asyncio.run(embedding_service.create_embeddings(["too many tokens here"]))
+
+    assert embedding_service.provider.client.embeddings.calls == []
+
+def test_create_embeddings_uses_token_counts_from_the_caller(embedding_service, monkeypatch):
+    asyncio.run(embedding_service.create_embeddings(["a"]))
+    monkeypatch.setattr(embedding_service, "count_tokens", lambda text: pytest.fail("counted again"))
+    embedding_service.max_batch_tokens = 4
+
+    embeddings = asyncio.run(embedding_service.create_embeddings(["a", "b b", "c c c"], token_counts=[1, 2, 3]))
+
+    assert embeddings == [[1.0], [3.0], [5.0]]
+    # "a" was cached; the uncached texts are batched by the given counts
+    assert embedding_service.provider.client.embeddings.calls[1:] == [["b b"], ["c c c"]]
+
+def test_create_embeddings_reuses_cached_vectors(embedding_service):
+    asyncio.run(embedding_service.create_embeddings(["a", "b b"]))
+    embeddings = asyncio.run(embedding_service.create_embeddings(["b b", "c", "c"]))
+
+    assert embeddings == [[3.0], [1.0], [1.0]]
+    assert embedding_service.provider.client.embeddings.calls == [["a", "b b"], ["c"]]
+    assert embedding_service.cache.stats()["hits"] == 1
+
+def test_embedding_cache_persists_and_invalidates_by_model(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(max_entries=1, path=path)
+    cache.set_many("model-a", 3, ["x", "y"], [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+    assert cache.evictions == 1
+    cache.set_many("model-b", 3, ["x"], [[7.0, 8.0, 9.0]])
+    cache.close()
+
+    reopened = EmbeddingCache(max_entries=10, path=path)
+    assert reopened.get_many("model-a", 3, ["x", "y", "z"]) == [
+        [1.0, 2.0, 3.0], [4.0, 5.0, 6.0], None
+    ]
+    assert reopened.disk_hits == 2
+
+    reopened.prune_models(keep_model="model-b")
+    assert reopened.get_many("model-a", 3, ["x"]) == [None]
+    assert reopened.get_many("model-b", 3, ["x"]) == [[7.0, 8.0, 9.0]]
+
+def test_embedding_cache_trims_least_recently_used_disk_rows(tmp_path):
+    cache = EmbeddingCache(max_entries=1, path=str(tmp_path / "embeddings.sqlite3"), max_disk_entries=10)
+    texts = [f"text {i}" for i in range(10)]
+    cache.set_many("model", 2, texts, [[float(i), 0.0] for i in range(10)])
+    # Read the first five back from disk so they count as recently used
+    cache._memory.clear()
+    assert cache.get_many("model", 2, texts[:5]) == [[float(i), 0.0] for i in range(5)]
+    assert cache.disk_hits == 5
+
+    cache.set_many("model", 2, ["new"], [[1.0, 1.0]])
+    count = cache._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    assert count == 9
+    cache._memory.clear()
+    found = cache.get_many("model", 2, texts + ["new"])
+    assert found[:4] == [[float(i), 0.0] for i in range(4)]
+    assert found[-1] == [1.0, 1.0]
+    assert found.count(None) == 2
+
+def test_embedding_service_reads_disk_cache_off_the_event_loop(tmp_path, monkeypatch):
+    service = EmbeddingService(
+        cache=EmbeddingCache(max_entries=10, path=str(tmp_path / "embeddings.sqlite3")),
+        provider=HashingEmbeddingProvider(dimensions=8, workers=0)
+    )
+    threads = []
+    original = asyncio.to_thread
+
+    async def to_thread(fn, *args):
+        threads.append(fn.__name__)
+        return await original(fn, *args)
+
+    monkeypatch.setattr(asyncio, "to_thread", to_thread)
+    first = asyncio.run(service.create_embeddings(["a b", "c"]))
+    assert asyncio.run(service.create_embeddings(["c", "a b"])) == [first[1], first[0]]
+    assert threads == ["get_many", "set_many", "get_many"]
+
+def test_local_provider_embeds_in_worker_processes():
+    provider = HashingEmbeddingProvider(dimensions=256, workers=1)
+    service = EmbeddingService(cache=None, provider=provider)
+    texts = ["refund my invoice", "refunds for invoices", "warehouse shipping delay"]
+
+    async def run():
+        try:
+            return await service.create_embeddings(texts)
+        finally:
+            await service.close()
+
+    embeddings = asyncio.run(run())
+    inline = asyncio.run(HashingEmbeddingProvider(dimensions=256, workers=0).embed(texts))
+
+    assert service.dimensions == 256
+    assert service.model.startswith("local-")
+    assert all(len(vector) == 256 for vector in embeddings)
+    # Hashing is stable across processes
+    assert embeddings == inline
+    similarity = [sum(a * b for a, b in zip(embeddings[0], other)) for other in embeddings[1:]]
+    assert similarity[0] > similarity[1]
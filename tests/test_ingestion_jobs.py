@@ -0,0 +1,256 @@
+import asyncio
+import io
+import json
+import time
+from uuid import uuid4
+import pytest
+from fastapi import UploadFile
+from app.services.bulk_upload import BulkUploadService
+from app.services.ingestion_jobs import IngestionJobManager
+from app.services.ingestion_pipeline import Batch
+
+class FakeEmbeddingService:
+    max_input_tokens = 8191
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+    async def create_embeddings(self, texts, token_counts=None):
+        return [[0.1] * 3 for _ in texts]
+
+class FakeSupabaseService:
+    def __init__(self, pause_after=None):
+        self.inserted = []
+        self.pause_after = pause_after
+        self.paused = asyncio.Event()
+
+    async def create_documents(self, documents, chunks=None):
+        if self.pause_after is not None and len(self.inserted) >= self.pause_after:
+            self.paused.set()
+            await asyncio.Event().wait()
+        self.inserted.extend(documents)
+        return documents
+
+class FakeRAGService:
+    def __init__(self, supabase):
+        self.embedding_service = FakeEmbeddingService()
+        self.supabase = supabase
+        self.chunker = None
+
+def make_manager(tmp_path, supabase):
+    service = BulkUploadService(rag_service=FakeRAGService(supabase))
+    service.pipeline.batch_size = 2
+    service.pipeline.embed_concurrency = 1
+    service.pipeline.insert_concurrency = 1
+    return IngestionJobManager(
+        service,
+        max_workers=1,
+        db_path=str(tmp_path / "jobs.sqlite3"),
+        jobs_dir=str(tmp_path / "jobs")
+    )
+
+async def wait_for_status(manager, job_id, client_id, status):
+    for _ in range(200):
+        job = await manager.get(job_id, client_id)
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job never reached {status}: {job}")
+
+DOCUMENTS = [{"title": f"doc {i}", "content": f"content {i}"} for i in range(7)]
+
+def test_json_job_runs_in_background(tmp_path):
+    client_id = uuid4()
+
+    async def run():
+        supabase = FakeSupabaseService()
+        manager = make_manager(tmp_path, supabase)
+        job = await manager.submit_json(DOCUMENTS, client_id)
+        assert job["status"] == "queued"
+        job = await wait_for_status(manager, job["job_id"], client_id, "completed")
+        assert await manager.get(job["job_id"], uuid4()) is None
+        await manager.close()
+        return job, supabase
+
+    job, supabase = asyncio.run(run())
+
+    assert job["total_documents"] == 7
+    assert job["processed_documents"] == 7
+    assert job["failed_documents"] == 0
+    assert len(supabase.inserted) == 7
+
+def test_interrupted_job_resumes_after_last_committed_batch(tmp_path):
+    client_id = uuid4()
+
+    async def interrupted():
+        supabase = FakeSupabaseService(pause_after=4)
+        manager = make_manager(tmp_path, supabase)
+        job = await manager.submit_json(DOCUMENTS, client_id)
+        await supabase.paused.wait()
+        await manager.close()
+        return job["job_id"], supabase
+
+    async def resumed(job_id):
+        supabase = FakeSupabaseService()
+        manager = make_manager(tmp_path, supabase)
+        assert (await manager.get(job_id, client_id))["status"] == "queued"
+        await manager.start()
+        job = await wait_for_status(manager, job_id, client_id, "completed")
+        await manager.close()
+        return job, supabase
+
+    job_id, first = asyncio.run(interrupted())
+    job, second = asyncio.run(resumed(job_id))
+
+    titles = [doc["title"] for doc in first.inserted + second.inserted]
+    assert sorted(titles) == sorted(doc["title"] for doc in DOCUMENTS)
+    assert len(second.inserted) == 3
+    assert job["processed_documents"] == 7
+
+def test_cancelled_job_can_be_resumed(tmp_path):
+    client_id = uuid4()
+
+    async def run():
+        supabase = FakeSupabaseService(pause_after=2)
+        manager = make_manager(tmp_path, supabase)
+        job = await manager.submit_json(DOCUMENTS, client_id)
+        await supabase.paused.wait()
+        job = await manager.cancel(job["job_id"], client_id)
+        assert job["status"] == "cancelled"
+        assert job["processed_documents"] == 2
+
+        supabase.pause_after = None
+        await manager.resume(job["job_id"], client_id)
+        job = await wait_for_status(manager, job["job_id"], client_id, "completed")
+        await manager.close()
+        return job, supabase
+
+    job, supabase = asyncio.run(run())
+
+    assert job["processed_documents"] == 7
+    assert len(supabase.inserted) == 7
+
+def test_job_stores_only_the_first_errors(tmp_path):
+    client_id = uuid4()
+
+    async def run():
+        manager = make_manager(tmp_path, FakeSupabaseService())
+        manager.max_errors = 3
+        manager._db.execute(
+            "INSERT INTO ingest_jobs (id, client_id, kind, source_path, status, total, created_at, updated_at) "
+            "VALUES ('job', ?, 'json', 'missing.json', 'queued', 10, ?, ?)",
+            (str(client_id), time.time(), time.time())
+        )
+        assert manager._claim("job", "lease")
+        for first in range(0, 10, 2):
+            batch = Batch(number=first // 2, first_row=first, last_row=first + 1)
+            batch.record_error(first, ValueError("bad"))
+            batch.record_error(first + 1, ValueError("bad"))
+            await asyncio.to_thread(manager._record_batch, "job", "lease", batch)
+        job = await manager.get("job", client_id)
+        await manager.close()
+        return job
+
+    job = asyncio.run(run())
+
+    assert job["failed_documents"] == 10
+    assert job["errors"] == [f"Error processing row {row}: bad" for row in range(3)]
+
+def test_sweep_picks_up_job_abandoned_after_start(tmp_path):
+    client_id = uuid4()
+
+    async def run():
+        supabase = FakeSupabaseService()
+        manager = make_manager(tmp_path, supabase)
+        manager.stale_after = 0.05
+        manager.sweep_interval = 0.02
+        await manager.start()
+        # A worker that crashed and restarted quickly left this job running
+        path = tmp_path / "jobs" / "abandoned.json"
+        path.write_text(json.dumps(DOCUMENTS))
+        manager._db.execute(
+            "INSERT INTO ingest_jobs (id, client_id, kind, source_path, status, total, created_at, updated_at) "
+            "VALUES ('abandoned', ?, 'json', ?, 'running', 7, ?, ?)",
+            (str(client_id), str(path), time.time(), time.time())
+        )
+        job = await wait_for_status(manager, "abandoned", client_id, "completed")
+        await manager.close()
+        return job, supabase
+
+    job, supabase = asyncio.run(run())
+
+    assert job["processed_documents"] == 7
+    assert len(supabase.inserted) == 7
+
+def test_worker_stops_writing_once_its_job_is_taken_over(tmp_path):
+    client_id = uuid4()
+
+    async def run():
+        manager = make_manager(tmp_path, FakeSupabaseService())
+        manager._db.execute(
+            "INSERT INTO ingest_jobs (id, client_id, kind, source_path, status, total, created_at, updated_at) "
+            "VALUES ('job', ?, 'json', 'missing.json', 'queued', 4, ?, ?)",
+            (str(client_id), time.time(), time.time())
+        )
+        assert manager._claim("job", "first")
+        # The first worker stalls past stale_after and a sweep claims the job again
+        manager._db.execute("UPDATE ingest_jobs SET updated_at = 0 WHERE id = 'job'")
+        assert manager._claim("job", "second")
+
+        batch = Batch(number=0, first_row=0, last_row=1, processed=2)
+        assert manager._record_batch("job", "first", batch)
+        assert not manager._touch("job", "first")
+        manager._finish("job", "completed", lease="first")
+        job = await manager.get("job", client_id)
+        await manager.close()
+        return job
+
+    job = asyncio.run(run())
+
+    assert job["status"] == "running"
+    assert job["processed_documents"] == 0
+
+class SlowSupabaseService(FakeSupabaseService):
+    async def create_documents(self, documents, chunks=None):
+        await asyncio.sleep(0.15)
+        return await super().create_documents(documents, chunks)
+
+def test_heartbeat_keeps_slow_job_from_being_taken_over(tmp_path):
+    client_id = uuid4()
+
+    async def run():
+        supabase, other = SlowSupabaseService(), FakeSupabaseService()
+        manager, sweeper = make_manager(tmp_path, supabase), make_manager(tmp_path, other)
+        for worker in (manager, sweeper):
+            worker.stale_after = 0.1
+            worker.heartbeat_interval = 0.02
+            worker.sweep_interval = 0.02
+        await sweeper.start()
+        job = await manager.submit_json(DOCUMENTS, client_id)
+        job = await wait_for_status(manager, job["job_id"], client_id, "completed")
+        await sweeper.close()
+        await manager.close()
+        return job, supabase, other
+
+    job, supabase, other = asyncio.run(run())
+
+    assert job["processed_documents"] == 7
+    assert len(supabase.inserted) == 7
+    assert other.inserted == []
+
+def test_csv_job_counts_rows_before_ingesting(tmp_path):
+    client_id = uuid4()
+    data = b'title,content\nOne,"multi\nline"\n\nTwo,two\nThree,three\n'
+
+    async def run():
+        supabase = FakeSupabaseService()
+        manager = make_manager(tmp_path, supabase)
+        job = await manager.submit_csv(UploadFile(file=io.BytesIO(data)), client_id)
+        job = await wait_for_status(manager, job["job_id"], client_id, "completed")
+        await manager.close()
+        return job
+
+    job = asyncio.run(run())
+
+    assert job["total_documents"] == 3
+    assert job["processed_documents"] == 3
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timezone
+from uuid import uuid4
+from app.services.keyword_index import KeywordIndex, TenantKeywords, reciprocal_rank_fusion, tokenize
+from app.services.supabase import SupabaseService
+from app.services.tenant_registry import TenantRegistry
+from tests.test_vector_index import FakeClient
+
+DOCUMENTS = [
+    {"id": "1", "title": "Router manual", "content": "Reset the router when error ERR-4012 appears."},
+    {"id": "2", "title": "Billing", "content": "Invoices are sent monthly. Error codes are listed in the manual."},
+    {"id": "3", "title": "Catalog", "content": "SKU_99812 is the blue router, SKU_99813 the red one."},
+]
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    assert tokenize("Error ERR-4012 on v2.1") == ["error", "err-4012", "err", "4012", "on", "v2.1", "v2", "1"]
+
+def test_bm25_ranks_exact_identifiers_and_tracks_writes():
+    keywords = TenantKeywords()
+    for row in DOCUMENTS:
+        keywords.upsert(row)
+
+    assert [doc_id for doc_id, _ in keywords.search("what does ERR-4012 mean", 3)][0] == "1"
+    assert [doc_id for doc_id, _ in keywords.search("sku_99813", 3)] == ["3"]
+    assert keywords.search("unrelated words", 3) == []
+
+    keywords.upsert({"id": "3", "title": "Catalog", "content": "Discontinued."})
+    keywords.remove("1")
+    assert keywords.search("sku_99813", 3) == []
+    assert keywords.search("err-4012", 3) == []
+    assert keywords.total_length == sum(keywords.lengths.values())
+    assert set(keywords.terms) == {"2", "3"}
+
+def test_tenant_keywords_refresh_with_changed_and_deleted_documents(monkeypatch):
+    monkeypatch.setattr("app.services.supabase.settings.VECTOR_INDEX_PAGE_SIZE", 2)
+    client = FakeClient()
+    client_id = uuid4()
+    client.documents = [
+        {**row, "client_id": str(client_id), "embedding": [0.0], "updated_at": "2020-01-01T00:00:00+00:00"}
+        for row in DOCUMENTS
+    ]
+    service = SupabaseService(
+        client=client,
+        tenants=TenantRegistry(ttl=0),
+        keyword_index=KeywordIndex(ttl=60)
+    )
+
+    async def run():
+        first = await service.search_keywords("sku_99813", client_id)
+        # Another worker rewrites document 3 and deletes document 1
+        client.documents[2].update(content="Discontinued.", updated_at=datetime.now(timezone.utc).isoformat())
+        del client.documents[0]
+        service.keyword_index.peek(client_id).loaded_at = float("-inf")
+        client.calls.clear()
+        second = await service.search_keywords("sku_99813", client_id)
+        third = await service.search_keywords("manual", client_id)
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+
+    assert [row["id"] for row in first] == ["3"]
+    assert first[0]["content"].startswith("SKU_99812")
+    assert second == []
+    assert [row["id"] for row in third] == ["2"]
+    keywords = service.keyword_index.peek(client_id)
+    assert set(keywords.lengths) == {"2", "3"}
+
+def test_reciprocal_rank_fusion_merges_by_document():
+    vector = [{"id": "a", "similarity": 0.9}, {"id": "b", "similarity": 0.8}]
+    keyword = [{"id": "c", "bm25": 3.0}, {"id": "b", "bm25": 2.0}]
+
+    fused = reciprocal_rank_fusion([vector, keyword], limit=2, k=60)
+
+    assert [row["id"] for row in fused] == ["b", "a"]
+    assert fused[0]["similarity"] == 0.8
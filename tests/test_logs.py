@@ -0,0 +1,55 @@
+import json
+import logging
+import queue
+from app.utils.logs import (
+    Lazy,
+    NonBlockingQueueHandler,
+    SamplingFilter,
+    StructuredFormatter,
+    fields,
+    request_id_var
+)
+
+def make_record(name, level, message, **values):
+    record = logging.LogRecord(name, level, __file__, 1, message, None, None)
+    record.fields = values
+    return record
+
+def test_records_are_queued_unformatted_and_rendered_with_capped_fields():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    calls = []
+    token = request_id_var.set("req-1")
+    try:
+        handler.emit(make_record("app.services.rag", logging.INFO, "Found", ids=Lazy(lambda: calls.append(1) or "x" * 50)))
+        handler.emit(make_record("app.services.rag", logging.INFO, "Dropped"))
+    finally:
+        request_id_var.reset(token)
+
+    assert handler.dropped == 1
+    record = handler.queue.get_nowait()
+    # Lazy fields are only computed when the record is written
+    assert calls == []
+    entry = json.loads(StructuredFormatter(max_chars=10).format(record))
+    assert entry["request_id"] == "req-1"
+    assert entry["message"] == "Found"
+    assert entry["ids"] == "xxxxxxxxxx... (50 chars)"
+    assert calls == [1]
+
+def test_sampling_uses_longest_prefix_and_keeps_warnings():
+    sampler = SamplingFilter({"app.services": 1.0, "app.services.rag": 0.0})
+    assert not sampler.filter(make_record("app.services.rag", logging.INFO, "m"))
+    assert sampler.filter(make_record("app.services.rag", logging.WARNING, "m"))
+    assert sampler.filter(make_record("app.services.supabase", logging.INFO, "m"))
+    assert sampler.filter(make_record("app.services.ragged", logging.INFO, "m"))
+
+def test_text_format_appends_fields_from_extra():
+    handler = NonBlockingQueueHandler(queue.Queue())
+    logger = logging.getLogger("tests.logs")
+    logger.addHandler(handler)
+    try:
+        logger.warning("Searched", extra=fields(results=3, client_id="c1"))
+    finally:
+        logger.removeHandler(handler)
+
+    line = StructuredFormatter(json_lines=False).format(handler.queue.get_nowait())
+    assert line.endswith('- WARNING - [-] Searched results=3 client_id="c1"')
@@ -0,0 +1,30 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.utils.metrics import Counter, Histogram, MetricsMiddleware, render
+
+def test_metrics_are_labelled_by_route_and_rendered_as_prometheus_text():
+    stage = Histogram("test_stage_seconds", "Test stage latency", labels=("stage",), buckets=(0.1, 1.0))
+    lookups = Counter("test_lookups_total", "Test lookups", labels=("result",))
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        stage.observe(0.05, stage="load")
+        stage.observe(0.5, stage="load")
+        lookups.inc(3, result="hit")
+        return {"id": item_id}
+
+    client = TestClient(app)
+    assert client.get("/items/1").status_code == 200
+    client.get("/items/2")
+    text = render()
+
+    labels = 'route="/items/{item_id}",stage="load"'
+    assert f'test_stage_seconds_bucket{{{labels},le="0.1"}} 2' in text
+    assert f'test_stage_seconds_bucket{{{labels},le="1.0"}} 4' in text
+    assert f'test_stage_seconds_bucket{{{labels},le="+Inf"}} 4' in text
+    assert f"test_stage_seconds_count{{{labels}}} 4" in text
+    assert 'test_lookups_total{route="/items/{item_id}",result="hit"} 6' in text
+    assert "# TYPE test_stage_seconds histogram" in text
+    assert 'http_request_duration_seconds_count{route="/items/{item_id}",status="200"} 2' in text
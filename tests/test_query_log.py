@@ -0,0 +1,88 @@
+import asyncio
+from uuid import uuid4
+from app.services.query_log import QueryLogWriter
+
+class FlakyInsert:
+    """Records bulk inserts, failing while down is set"""
+    def __init__(self):
+        self.batches = []
+        self.down = False
+
+    async def __call__(self, rows):
+        if self.down:
+            raise ConnectionError("database unavailable")
+        self.batches.append([row['query'] for row in rows])
+
+def submit(writer, query):
+    writer.submit(user_id=uuid4(), client_id=uuid4(), query=query, embedding=[0.1, 0.2])
+
+def test_writer_batches_in_background_and_drains_on_close(tmp_path):
+    insert = FlakyInsert()
+    writer = QueryLogWriter(insert, max_buffer=10, batch_size=3, flush_interval=60, spill_path=str(tmp_path / "spill.jsonl"))
+
+    async def run():
+        await writer.start()
+        for i in range(4):
+            submit(writer, f"q{i}")
+        # Nothing is written on the request path
+        assert insert.batches == []
+        await asyncio.sleep(0.01)
+        full_batch = list(insert.batches)
+        submit(writer, "q4")
+        await writer.close()
+        return full_batch
+
+    full_batch = asyncio.run(run())
+
+    # A full batch wakes the writer, which then sends everything buffered
+    assert full_batch == [["q0", "q1", "q2"], ["q3"]]
+    assert insert.batches == [["q0", "q1", "q2"], ["q3"], ["q4"]]
+    assert writer.written == 5
+
+def test_writer_spills_under_backpressure_and_failures_then_replays(tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+    insert = FlakyInsert()
+    insert.down = True
+    writer = QueryLogWriter(insert, max_buffer=2, batch_size=10, flush_interval=60, spill_path=spill_path)
+
+    async def first_run():
+        await writer.start()
+        for i in range(3):
+            submit(writer, f"q{i}")
+        await writer.close()
+
+    asyncio.run(first_run())
+    # q2 found the buffer full; q0 and q1 failed to insert at shutdown
+    assert writer.spilled == 3
+    assert insert.batches == []
+
+    insert.down = False
+    replay = QueryLogWriter(insert, max_buffer=10, batch_size=10, flush_interval=60, spill_path=spill_path)
+
+    async def second_run():
+        await replay.start()
+        await replay.close()
+
+    asyncio.run(second_run())
+    assert sorted(insert.batches[0]) == ["q0", "q1", "q2"]
+    assert not (tmp_path / "spill.jsonl").exists()
+
+def test_submit_never_writes_the_spill_file_on_the_event_loop(tmp_path):
+    spill_path = tmp_path / "spill.jsonl"
+    insert = FlakyInsert()
+    insert.down = True
+    writer = QueryLogWriter(insert, max_buffer=1, batch_size=10, flush_interval=60, spill_path=str(spill_path))
+
+    async def run():
+        await writer.start()
+        for i in range(4):
+            submit(writer, f"q{i}")
+        # q1 waits for the background task; q2 and q3 find both queues full
+        written_on_submit = spill_path.exists()
+        await writer.close()
+        return written_on_submit
+
+    assert asyncio.run(run()) is False
+    assert writer.dropped == 2
+    assert writer.spilled == 2
+    assert len(spill_path.read_text().splitlines()) == 2
@@ -0,0 +1,287 @@
+import asyncio
+from uuid import uuid4
+import pytest
+from app.services.chunking import TextChunker
+from app.services.rag import RAGService
+from app.services.source_selection import select_sources
+
+class FakeEmbeddingService:
+    async def create_embedding(self, text):
+        return [0.1] * 3
+
+class FakeCompletionService:
+    async def generate_response(self, query, context):
+        return "answer"
+
+    async def stream_response(self, query, context):
+        for token in ["an", "swer"]:
+            yield token
+
+class FakeSupabaseService:
+    def __init__(self, documents):
+        self.documents = documents
+        self.logged = []
+
+    async def search_documents(self, embedding, client_id, limit=5, threshold=0.5):
+        return self.documents
+
+    async def log_query(self, user_id, client_id, query, embedding):
+        self.logged.append(query)
+
+    async def attach_embeddings(self, results, client_id):
+        pass
+
+def make_rag_service(documents):
+    return RAGService(
+        embedding_service=FakeEmbeddingService(),
+        completion_service=FakeCompletionService(),
+        supabase_service=FakeSupabaseService(documents)
+    )
+
+async def collect(events):
+    return [event async for event in events]
+
+def test_stream_sends_sources_before_tokens_and_logs_after():
+    documents = [{"id": "1", "title": "Doc", "content": "Text", "similarity": 0.9}]
+    rag_service = make_rag_service(documents)
+
+    events = asyncio.run(collect(rag_service.stream_search_and_generate_response(
+        query="question",
+        client_id=uuid4(),
+        user_id=uuid4()
+    )))
+
+    assert [event["event"] for event in events] == ["sources", "token", "token", "done"]
+    assert events[0]["data"] == documents
+    assert "".join(e["data"] for e in events if e["event"] == "token") == "answer"
+    assert rag_service.supabase.logged == ["question"]
+
+def test_stream_without_sources_skips_completion():
+    rag_service = make_rag_service([])
+
+    events = asyncio.run(collect(rag_service.stream_search_and_generate_response(
+        query="question",
+        client_id=uuid4(),
+        user_id=uuid4()
+    )))
+
+    assert [event["event"] for event in events] == ["sources", "token", "done"]
+    assert rag_service.supabase.logged == []
+
+class WordEncoding:
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+class RecordingEmbeddingService(FakeEmbeddingService):
+    def __init__(self):
+        self.calls = []
+
+    async def create_embeddings(self, texts):
+        self.calls.append(texts)
+        return [[1.0, 0.0] if i % 2 == 0 else [0.0, 1.0] for i, _ in enumerate(texts)]
+
+class RecordingSupabaseService(FakeSupabaseService):
+    def __init__(self):
+        super().__init__([])
+        self.created = []
+        self.chunk_searches = 0
+
+    async def create_document(self, **kwargs):
+        self.created.append(kwargs)
+        return {"id": "1", **kwargs}
+
+    async def search_chunks(self, embedding, client_id, limit=5, threshold=0.5):
+        self.chunk_searches += 1
+        return []
+
+def make_chunker(chunk_size, overlap):
+    chunker = TextChunker(chunk_size=chunk_size, overlap=overlap)
+    chunker._encoding = WordEncoding()
+    return chunker
+
+def test_text_chunker_splits_with_overlap():
+    chunker = make_chunker(chunk_size=4, overlap=1)
+
+    assert chunker.split("a b c") == ["a b c"]
+    assert chunker.split("a b c d e f g h i j") == ["a b c d", "d e f g", "g h i j"]
+
+def test_process_document_stores_chunks_with_pooled_embedding():
+    supabase = RecordingSupabaseService()
+    embedding_service = RecordingEmbeddingService()
+    rag_service = RAGService(
+        embedding_service=embedding_service,
+        completion_service=FakeCompletionService(),
+        supabase_service=supabase,
+        chunker=make_chunker(chunk_size=3, overlap=0)
+    )
+
+    asyncio.run(rag_service.process_document(
+        title="Doc",
+        content="one two three four five six",
+        client_id=uuid4()
+    ))
+    asyncio.run(rag_service.search_and_generate_response(
+        query="question",
+        client_id=uuid4(),
+        user_id=uuid4()
+    ))
+
+    created = supabase.created[0]
+    assert embedding_service.calls[0] == ["one two three", "four five six"]
+    assert [chunk["content"] for chunk in created["chunks"]] == ["one two three", "four five six"]
+    assert created["embedding"] == pytest.approx([2 ** -0.5, 2 ** -0.5])
+    assert supabase.chunk_searches == 1
+
+class HybridSupabaseService(FakeSupabaseService):
+    async def search_keywords(self, query, client_id, limit=5):
+        return [{"id": "sku", "title": "Catalog", "content": "SKU_99812", "bm25": 4.0}]
+
+def test_hybrid_retrieval_fuses_keyword_matches():
+    documents = [
+        {"id": "1", "title": "Doc", "content": "Text", "similarity": 0.9},
+        {"id": "2", "title": "Other", "content": "More", "similarity": 0.8}
+    ]
+    rag_service = RAGService(
+        embedding_service=FakeEmbeddingService(),
+        completion_service=FakeCompletionService(),
+        supabase_service=HybridSupabaseService(documents),
+        hybrid=True
+    )
+
+    result = asyncio.run(rag_service.search_and_generate_response(
+        query="SKU_99812",
+        client_id=uuid4(),
+        user_id=uuid4(),
+        limit=2
+    ))
+
+    assert [doc["id"] for doc in result["sources"]] == ["1", "sku"]
+
+class FusedSupabaseService(FakeSupabaseService):
+    async def search_keywords(self, query, client_id, limit=5):
+        return [
+            {"id": "sku", "title": "Catalog", "content": "SKU_99812", "bm25": 4.0},
+            {"id": "weak", "title": "Weak", "content": "SKU", "bm25": 2.0}
+        ]
+
+def test_source_selection_cuts_hybrid_results_by_similarity():
+    documents = [
+        {"id": "1", "title": "Doc", "content": "Text", "similarity": 0.92},
+        {"id": "weak", "title": "Weak", "content": "SKU", "similarity": 0.50}
+    ]
+    rag_service = RAGService(
+        embedding_service=FakeEmbeddingService(),
+        completion_service=FakeCompletionService(),
+        supabase_service=FusedSupabaseService(documents),
+        hybrid=True,
+        select=True
+    )
+
+    result = asyncio.run(rag_service.search_and_generate_response(
+        query="SKU_99812",
+        client_id=uuid4(),
+        user_id=uuid4(),
+        limit=3
+    ))
+
+    # Fusion ranks "weak" first, but it sits below the similarity gap; the
+    # keyword-only match has no similarity and survives the cut
+    assert [doc["id"] for doc in result["sources"]] == ["1", "sku"]
+
+class QueryAxisEmbeddingService(FakeEmbeddingService):
+    async def create_embedding(self, text):
+        return [1.0, 0.0, 0.0, 0.0]
+
+class EmbeddedFusedSupabaseService(FakeSupabaseService):
+    def __init__(self, documents, embeddings):
+        super().__init__(documents)
+        self.embeddings = embeddings
+
+    async def search_keywords(self, query, client_id, limit=5):
+        return [{"id": "sku", "title": "Catalog", "content": "SKU_99812", "bm25": 4.0}]
+
+    async def attach_embeddings(self, results, client_id):
+        for row in results:
+            row["embedding"] = self.embeddings[row["id"]]
+
+def test_source_selection_keeps_fused_rank_of_keyword_matches():
+    embeddings = {
+        "v1": [1.0, 0.5, 0.0, 0.0], "v2": [1.0, 0.0, 0.5, 0.0], "v3": [1.0, 0.0, 0.0, 0.5],
+        "v4": [1.0, -0.5, 0.0, 0.0], "v5": [1.0, 0.0, -0.5, 0.0], "v6": [1.0, 0.0, 0.0, -0.5],
+        # Dissimilar to the query, but an exact keyword match
+        "sku": [0.0, 1.0, 0.0, 0.0]
+    }
+    documents = [
+        {"id": f"v{i}", "title": "Doc", "content": "Text", "similarity": 0.9 - i / 100}
+        for i in range(1, 7)
+    ]
+    rag_service = RAGService(
+        embedding_service=QueryAxisEmbeddingService(),
+        completion_service=FakeCompletionService(),
+        supabase_service=EmbeddedFusedSupabaseService(documents, embeddings),
+        hybrid=True,
+        select=True
+    )
+
+    result = asyncio.run(rag_service.search_and_generate_response(
+        query="SKU_99812",
+        client_id=uuid4(),
+        user_id=uuid4(),
+        limit=5
+    ))
+
+    ids = [doc["id"] for doc in result["sources"]]
+    assert len(ids) == 5
+    assert ids[:2] == ["v1", "sku"]
+    assert all("embedding" not in doc for doc in result["sources"])
+
+def test_source_selection_drops_near_duplicates_and_weak_tail():
+    near = [1.0, 0.0, 0.01]
+    documents = [
+        {"id": "1", "title": "A", "content": "a", "similarity": 0.92, "embedding": near},
+        {"id": "2", "title": "A again", "content": "a", "similarity": 0.91, "embedding": [1.0, 0.0, 0.0]},
+        {"id": "3", "title": "B", "content": "b", "similarity": 0.90, "embedding": [0.7, 0.7, 0.0]},
+        {"id": "4", "title": "Weak", "content": "w", "similarity": 0.45, "embedding": [0.0, 1.0, 0.0]},
+    ]
+
+    selected = select_sources([1.0, 0.2, 0.0], documents, limit=5)
+
+    assert [doc["id"] for doc in selected] == ["1", "3"]
+
+class BatchEmbeddingService(FakeEmbeddingService):
+    def __init__(self):
+        self.batches = []
+
+    async def create_embeddings(self, texts):
+        self.batches.append(texts)
+        return [[0.1] * 3 for _ in texts]
+
+class FailingCompletionService(FakeCompletionService):
+    async def generate_response(self, query, context):
+        if query == "bad":
+            raise ValueError("completion failed")
+        return f"answer to {query}"
+
+def test_batch_embeds_once_and_reports_errors_per_query():
+    documents = [{"id": "1", "title": "Doc", "content": "Text", "similarity": 0.9}]
+    embedding_service = BatchEmbeddingService()
+    rag_service = RAGService(
+        embedding_service=embedding_service,
+        completion_service=FailingCompletionService(),
+        supabase_service=FakeSupabaseService(documents)
+    )
+
+    results = asyncio.run(rag_service.batch_search_and_generate_response(
+        queries=["first", "bad", "third"],
+        client_id=uuid4(),
+        user_id=uuid4()
+    ))
+
+    assert embedding_service.batches == [["first", "bad", "third"]]
+    assert [result["query"] for result in results] == ["first", "bad", "third"]
+    assert results[0]["answer"] == "answer to first"
+    assert results[1] == {"query": "bad", "error": "completion failed"}
+    assert rag_service.supabase.logged == ["first", "third"]
@@ -0,0 +1,130 @@
+import asyncio
+from types import SimpleNamespace
+from uuid import uuid4
+import pytest
+from app.api.routes.search import ClientDisconnected, _cancel_on_disconnect
+from app.services.rag import RAGService
+from app.services.single_flight import SingleFlight
+from tests.test_rag import FakeCompletionService, FakeEmbeddingService, FakeSupabaseService
+
+class SlowCompletionService(FakeCompletionService):
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_response(self, query, context):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(0.01)
+        return f"answer {call}"
+
+def test_identical_concurrent_queries_share_one_answer_and_log_per_user():
+    documents = [{"id": "1", "title": "Doc", "content": "Text", "similarity": 0.9}]
+    completion = SlowCompletionService()
+    rag_service = RAGService(
+        embedding_service=FakeEmbeddingService(),
+        completion_service=completion,
+        supabase_service=FakeSupabaseService(documents),
+        single_flight=SingleFlight()
+    )
+    client_id = uuid4()
+
+    async def run():
+        return await asyncio.gather(
+            rag_service.search_and_generate_response("What is it?", client_id, uuid4()),
+            rag_service.search_and_generate_response("  what IS it? ", client_id, uuid4()),
+            # Another tenant never shares an answer
+            rag_service.search_and_generate_response("What is it?", uuid4(), uuid4()),
+        )
+
+    first, second, other_tenant = asyncio.run(run())
+
+    assert completion.calls == 2
+    assert first == second and first is not second
+    assert other_tenant["answer"] != first["answer"]
+    assert len(rag_service.supabase.logged) == 3
+    assert len(rag_service.single_flight) == 0
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream failed")
+
+    async def run():
+        return await asyncio.gather(
+            flight.do("key", fail), flight.do("key", fail), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+
+    assert calls == [1]
+    assert [str(result) for result in results] == ["upstream failed"] * 2
+
+def test_leader_disconnect_leaves_followers_and_last_waiter_cancels_work():
+    flight = SingleFlight()
+    state = {"started": 0, "cancelled": 0}
+
+    async def work():
+        state["started"] += 1
+        try:
+            await asyncio.sleep(0.05)
+            return "result"
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+
+    async def run():
+        leader = asyncio.create_task(flight.do("shared", work))
+        follower = asyncio.create_task(flight.do("shared", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "result"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+        alone = asyncio.create_task(flight.do("alone", work))
+        await asyncio.sleep(0)
+        alone.cancel()
+        await asyncio.sleep(0)
+        return alone.cancelled()
+
+    assert asyncio.run(run())
+    assert state == {"started": 2, "cancelled": 1}
+    assert len(flight) == 0
+
+def test_client_disconnect_cancels_the_request_work():
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def run():
+        work = asyncio.create_task(asyncio.sleep(10))
+        waiting = asyncio.create_task(_cancel_on_disconnect(SimpleNamespace(receive=receive), work))
+        await asyncio.sleep(0)
+        disconnected.set()
+        with pytest.raises(ClientDisconnected):
+            await waiting
+        return work.cancelled()
+
+    assert asyncio.run(run())
+
+def test_cancellation_without_disconnect_is_not_reported_as_disconnect():
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def run():
+        work = asyncio.create_task(asyncio.sleep(10))
+        waiting = asyncio.create_task(_cancel_on_disconnect(SimpleNamespace(receive=receive), work))
+        await asyncio.sleep(0)
+        # As at shutdown: the request task itself is cancelled
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        return work.cancelled()
+
+    assert asyncio.run(run())
@@ -1,5 +1,9 @@
+import asyncio
+import time
+from types import SimpleNamespace
 import pytest
 from app.services.supabase import SupabaseService
+from app.services.tenant_registry import TenantRegistry
 from uuid import uuid4
 
 @pytest.fixture
@@ -31,4 +35,87 @@ async def test_create_and_search_document(supabase_service):
         client_id=client_id
     )
     
-    assert len(results) > 0
\ No newline at end of file
+    assert len(results) > 0
+
+class SlowQuery:
+    """Stand-in for a supabase-py query builder whose execute() blocks like a network call"""
+    def __init__(self, delay, data, calls=None):
+        self.delay = delay
+        self.data = data
+        self.params = self
+        self.calls = calls if calls is not None else []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        self.calls.append(self)
+        time.sleep(self.delay)
+        return SimpleNamespace(data=self.data, count=len(self.data))
+
+class SlowClient:
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = []
+
+    def table(self, name):
+        return SlowQuery(self.delay, [{"id": "1", "title": "Doc", "client_id": "c"}], self.calls)
+
+    def rpc(self, name, params):
+        return SlowQuery(self.delay, [{"id": "1", "similarity": 0.9}], self.calls)
+
+def test_concurrent_queries_overlap():
+    delay = 0.1
+    concurrency = 8
+    service = SupabaseService(
+        client=SlowClient(delay),
+        max_workers=concurrency,
+        tenants=TenantRegistry()
+    )
+    client_id = uuid4()
+
+    async def run():
+        searches = [
+            service.search_documents(embedding=[0.1] * 1536, client_id=client_id)
+            for _ in range(concurrency // 2)
+        ]
+        inserts = [
+            service.create_document(
+                title="Doc",
+                content="Text",
+                client_id=client_id,
+                embedding=[0.1] * 1536
+            )
+            for _ in range(concurrency // 2)
+        ]
+        return await asyncio.gather(*searches, *inserts)
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    assert len(results) == concurrency
+    # Run serially these calls would take at least 8x delay
+    assert elapsed < 2 * delay * 2
+
+def test_document_count_is_served_from_tenant_registry():
+    client = SlowClient(delay=0)
+    service = SupabaseService(client=client, tenants=TenantRegistry(ttl=60))
+    client_id = uuid4()
+
+    async def run():
+        await service.search_documents(embedding=[0.1] * 1536, client_id=client_id)
+        await service.search_documents(embedding=[0.1] * 1536, client_id=client_id)
+        await service.create_document(
+            title="Doc",
+            content="Text",
+            client_id=client_id,
+            embedding=[0.1] * 1536
+        )
+
+    asyncio.run(run())
+
+    # One count query, two vector searches and a single insert round-trip
+    assert len(client.calls) == 4
+    assert service.tenants.get_count(client_id) == 2
+    assert service.tenants.get_version(client_id) == 1
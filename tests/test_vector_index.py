@@ -0,0 +1,335 @@
+import asyncio
+import os
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from uuid import uuid4
+import numpy as np
+import pytest
+from app.services.supabase import SupabaseService
+from app.services.tenant_registry import TenantRegistry
+from app.services.vector_index import InMemoryVectorIndex, IVFVectors, TenantVectors, recall_report
+
+def brute_force(rows, embeddings, query, limit, threshold):
+    """Reference semantics of match_documents: cosine similarity, threshold, limit"""
+    matrix = np.asarray(embeddings, dtype=np.float64)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    scores = matrix @ (np.asarray(query) / np.linalg.norm(query))
+    ranked = [i for i in np.argsort(-scores, kind="stable") if scores[i] > threshold]
+    return [rows[i]['id'] for i in ranked[:limit]]
+
+def test_search_matches_brute_force_and_survives_removals():
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(200, 8)).tolist()
+    rows = [{"id": str(i), "title": f"doc {i}"} for i in range(200)]
+    vectors = TenantVectors(dimensions=8)
+    for row, embedding in zip(rows, embeddings):
+        vectors.upsert(row, embedding)
+
+    query = rng.normal(size=8).tolist()
+    for limit, threshold in [(5, 0.0), (50, 0.3), (500, -1.0)]:
+        results = vectors.search(query, limit, threshold)
+        assert [r["id"] for r in results] == brute_force(rows, embeddings, query, limit, threshold)
+
+    for doc_id in range(0, 200, 3):
+        vectors.remove(str(doc_id))
+    kept = [i for i in range(200) if i % 3]
+    results = vectors.search(query, 10, 0.0)
+    expected = brute_force([rows[i] for i in kept], [embeddings[i] for i in kept], query, 10, 0.0)
+    assert [r["id"] for r in results] == expected
+    assert results[0]["similarity"] > results[-1]["similarity"]
+
+class FakeQuery:
+    """Minimal PostgREST builder over an in-memory documents table"""
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.filters = {}
+        self.conditions = []
+        self.window = None
+        self.insert_rows = None
+        self.params = SimpleNamespace(add=lambda *args: self.params)
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def gte(self, column, value):
+        self.conditions.append(lambda row: str(row.get(column)) >= value)
+        return self
+
+    def in_(self, column, values):
+        self.conditions.append(lambda row: str(row.get(column)) in set(values))
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def range(self, start, end):
+        self.window = (start, end + 1)
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.insert_rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def execute(self):
+        self.client.calls.append(self.table)
+        if self.insert_rows is not None:
+            created = [{**row, "id": str(uuid4())} for row in self.insert_rows]
+            self.client.documents.extend(created)
+            return SimpleNamespace(data=[{k: v for k, v in row.items() if k != "embedding"} for row in created])
+        data = [
+            dict(row) for row in self.client.documents
+            if all(row.get(k) == v for k, v in self.filters.items())
+            and all(condition(row) for condition in self.conditions)
+        ]
+        count = len(data)
+        if self.window:
+            data = data[self.window[0]:self.window[1]]
+        # pgvector columns come back from PostgREST as text
+        for row in data:
+            if "embedding" in row:
+                row["embedding"] = str(row["embedding"])
+        return SimpleNamespace(data=data, count=count)
+
+class FakeClient:
+    def __init__(self):
+        self.documents = []
+        self.calls = []
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        raise AssertionError("the memory backend should not call match_documents")
+
+def vector(x, y):
+    return [x, y] + [0.0] * 1534
+
+def test_memory_backend_loads_tenant_once_and_tracks_writes(monkeypatch):
+    monkeypatch.setattr("app.services.supabase.settings.VECTOR_INDEX_PAGE_SIZE", 2)
+    client = FakeClient()
+    client_id = uuid4()
+    client.documents = [
+        {"id": str(i), "title": f"doc {i}", "client_id": str(client_id), "embedding": embedding}
+        for i, embedding in enumerate([vector(1.0, 0.0), vector(0.0, 1.0), vector(0.6, 0.8)])
+    ]
+    service = SupabaseService(
+        client=client,
+        tenants=TenantRegistry(ttl=60),
+        vector_index=InMemoryVectorIndex(ttl=60)
+    )
+
+    async def run():
+        first = await service.search_documents(vector(1.0, 0.0), client_id, limit=2, threshold=0.1)
+        loads = len(client.calls)
+        created = await service.create_document(
+            title="new", content="text", client_id=client_id, embedding=vector(0.8, 0.6)
+        )
+        second = await service.search_documents(vector(1.0, 0.0), client_id, limit=2, threshold=0.1)
+        return first, loads, created, second
+
+    first, loads, created, second = asyncio.run(run())
+
+    assert [doc["id"] for doc in first] == ["0", "2"]
+    assert first[1]["similarity"] == pytest.approx(0.6)
+    # One count query, then two pages of two documents
+    assert loads == 3
+    assert [doc["id"] for doc in second] == ["0", created["id"]]
+    assert client.calls.count("documents") == 4
+
+def test_memory_backend_refreshes_changed_documents_instead_of_reloading(monkeypatch):
+    monkeypatch.setattr("app.services.supabase.settings.VECTOR_INDEX_PAGE_SIZE", 2)
+    client = FakeClient()
+    client_id = uuid4()
+    client.documents = [
+        {
+            "id": str(i), "title": f"doc {i}", "client_id": str(client_id),
+            "embedding": embedding, "updated_at": "2020-01-01T00:00:00+00:00"
+        }
+        for i, embedding in enumerate([vector(1.0, 0.0), vector(0.0, 1.0), vector(0.6, 0.8)])
+    ]
+    service = SupabaseService(
+        client=client,
+        tenants=TenantRegistry(ttl=0),
+        vector_index=InMemoryVectorIndex(ttl=60)
+    )
+
+    async def run():
+        await service.search_documents(vector(1.0, 0.0), client_id, limit=3, threshold=0.1)
+        # Another worker adds a document and deletes document 0
+        client.documents.append({
+            "id": "3", "title": "doc 3", "client_id": str(client_id),
+            "embedding": vector(0.9, 0.1), "updated_at": datetime.now(timezone.utc).isoformat()
+        })
+        del client.documents[0]
+        service.vector_index.peek(client_id).loaded_at = float("-inf")
+        client.calls.clear()
+        return await service.search_documents(vector(1.0, 0.0), client_id, limit=3, threshold=0.1)
+
+    results = asyncio.run(run())
+
+    assert [doc["id"] for doc in results] == ["3", "2"]
+    # Two counts, one page of changed documents and two pages of ids to find the deletion
+    assert client.calls == ["documents"] * 5
+
+def test_empty_tenant_is_refreshed_not_restored(monkeypatch):
+    client = FakeClient()
+    client_id = uuid4()
+    service = SupabaseService(
+        client=client,
+        tenants=TenantRegistry(ttl=0),
+        vector_index=InMemoryVectorIndex(ttl=60)
+    )
+
+    async def run():
+        await service.search_documents(vector(1.0, 0.0), client_id, limit=3, threshold=0.1)
+        loaded = service.vector_index.peek(client_id)
+        assert loaded is not None and len(loaded) == 0
+        loaded.loaded_at = float("-inf")
+
+        async def restore(client_id):
+            pytest.fail("a loaded tenant with no documents was treated as missing")
+
+        monkeypatch.setattr(service.vector_index, "restore", restore)
+        await service.search_documents(vector(1.0, 0.0), client_id, limit=3, threshold=0.1)
+        return service.vector_index.get(client_id) is loaded
+
+    assert asyncio.run(run())
+
+def clustered_vectors(rng, count, dimensions=16, clusters=20):
+    centers = rng.normal(size=(clusters, dimensions))
+    return centers[rng.integers(clusters, size=count)] + 0.1 * rng.normal(size=(count, dimensions))
+
+def test_ivf_index_recall_incremental_updates_and_snapshot(tmp_path):
+    rng = np.random.default_rng(1)
+    embeddings = clustered_vectors(rng, 2000)
+    vectors = IVFVectors(dimensions=16, nprobe=4)
+    for i, embedding in enumerate(embeddings):
+        vectors.upsert({"id": str(i)}, embedding)
+    vectors.train()
+
+    queries = clustered_vectors(rng, 20)
+    report = recall_report(vectors, queries, limit=10, nprobes=(1, 8))
+    assert report[0]["recall"] <= report[1]["recall"]
+    assert report[1]["recall"] >= 0.9
+    assert vectors.nprobe == 4
+
+    # Writes go to the closest existing cluster without retraining
+    vectors.upsert({"id": "new"}, queries[0])
+    vectors.remove("0")
+    assert vectors.search(queries[0], 1, threshold=0.0)[0]["id"] == "new"
+    assert "0" not in {row["id"] for row in vectors.search(embeddings[0], 50, threshold=0.0)}
+
+    path = str(tmp_path / "tenant")
+    vectors.save(path)
+    restored = TenantVectors.open(path)
+    restored.nprobe = vectors.nprobe
+    assert isinstance(restored, IVFVectors)
+    for query in queries:
+        assert restored.search(query, 5, 0.0) == vectors.search(query, 5, 0.0)
+
+    # Reloading with the previous index keeps its clusters
+    reloaded = IVFVectors(dimensions=16, nprobe=4)
+    for row in restored.rows:
+        reloaded.upsert(row, restored.vector(restored.positions[row["id"]]))
+    reloaded.train(previous=restored)
+    assert reloaded.centroids is restored.centroids
+    assert np.array_equal(reloaded.assignments[:len(reloaded)], restored.assignments[:len(restored)])
+
+def test_int8_snapshot_is_mapped_and_rescored_at_full_precision(tmp_path):
+    rng = np.random.default_rng(2)
+    embeddings = rng.normal(size=(500, 32))
+    exact = TenantVectors(dimensions=32)
+    for i, embedding in enumerate(embeddings):
+        exact.upsert({"id": str(i)}, embedding)
+    path = str(tmp_path / "tenant")
+    exact.save(path, quantization="int8")
+
+    mapped = TenantVectors.open(path)
+    assert isinstance(mapped.matrix, np.memmap) and mapped.matrix.dtype == np.int8
+    mapped.rescore = 4
+    for query in rng.normal(size=(10, 32)):
+        expected = exact.search(query, 5, 0.0)
+        results = mapped.search(query, 5, 0.0)
+        assert [r["id"] for r in results] == [r["id"] for r in expected]
+        assert [r["similarity"] for r in results] == pytest.approx([r["similarity"] for r in expected], abs=1e-6)
+
+    # The first write copies the mapped arrays; the snapshot on disk is untouched
+    mapped.upsert({"id": "new"}, embeddings[0] * -1)
+    assert not isinstance(mapped.matrix, np.memmap)
+    assert mapped.search(embeddings[0] * -1, 1, 0.0)[0]["id"] == "new"
+    assert len(TenantVectors.open(path)) == 500
+
+def test_concurrent_snapshots_of_one_tenant_stay_readable(tmp_path):
+    rng = np.random.default_rng(5)
+    path = str(tmp_path / "tenant")
+    workers = []
+    for _ in range(2):
+        vectors = TenantVectors(dimensions=8)
+        for i in range(50):
+            vectors.upsert({"id": str(i)}, rng.normal(size=8))
+        workers.append(vectors)
+    errors = []
+
+    def snapshot(vectors):
+        try:
+            for _ in range(20):
+                vectors.save(path)
+                assert len(TenantVectors.open(path)) == 50
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=snapshot, args=(vectors,)) for vectors in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    current = open(os.path.join(path, "CURRENT")).read()
+    # Nothing older than the current generation is left behind
+    assert set(os.listdir(path)) == {"CURRENT", current}
+
+def make_tenant(rng, count=100):
+    vectors = TenantVectors(dimensions=8)
+    for i in range(count):
+        vectors.upsert({"id": str(i)}, rng.normal(size=8))
+    return vectors
+
+def test_index_evicts_least_recently_used_tenants_within_budget(tmp_path):
+    rng = np.random.default_rng(3)
+    index = InMemoryVectorIndex(
+        ttl=60,
+        dimensions=8,
+        snapshot_dir=str(tmp_path),
+        quantization="int8",
+        memory_budget=1
+    )
+    a, b, c = uuid4(), uuid4(), uuid4()
+
+    async def run():
+        tenant = await index.install(a, make_tenant(rng))
+        index.memory_budget = 2 * tenant.nbytes + 100
+        await index.install(b, make_tenant(rng))
+        index.upsert(a, [{"id": "written"}], [rng.normal(size=8)])
+        await index.install(c, make_tenant(rng))
+        evicted = index.get(a) is None
+        restored = await index.restore(a)
+        return evicted, restored
+
+    evicted, restored = asyncio.run(run())
+
+    assert evicted
+    # a was snapshotted when evicted, so its write survives; b is now the least recently used
+    assert "written" in restored.positions
+    assert index.get(b) is None
+    assert index.get(c) is not None
+    assert index.stats()["evictions"] == 2